@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from kd_common import logutil
+
+_logger = logutil.get_logger(__name__)
+
+
+@dataclass
+class Stat:
+    calls: int = 0
+    total: float = 0.
+    max: float = 0.
+    items: int = 0
+
+    def add(self, other: Stat) -> None:
+        self.calls += other.calls
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.items += other.items
+
+
+@dataclass
+class Profile:
+    stats: Dict[str, Stat] = field(default_factory=dict)
+    folded: Dict[str, float] = field(default_factory=dict)
+
+    def merge(self, other: Profile) -> None:
+        for name, stat in other.stats.items():
+            self.stats.setdefault(name, Stat()).add(stat)
+        for path, seconds in other.folded.items():
+            self.folded[path] = self.folded.get(path, 0.) + seconds
+
+    def report(self) -> str:
+        lines = [f"{'stage':<40} {'calls':>10} {'total, s':>10} {'mean, ms':>10} {'max, ms':>10} {'items':>10}"]
+        for name, s in sorted(self.stats.items(), key=lambda x: -x[1].total):
+            mean = s.total / s.calls * 1000 if s.calls else 0.
+            lines.append(f"{name:<40} {s.calls:>10} {s.total:>10.3f} {mean:>10.3f} {s.max * 1000:>10.3f} {s.items:>10}")
+        return "\n".join(lines)
+
+    def write_folded(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, seconds in sorted(self.folded.items()):
+                f.write(f"{stack} {int(seconds * 1e6)}\n")
+
+
+_enabled = False
+_flame = False
+_profile = Profile()
+_stack: List[List[Any]] = []
+
+
+class _Stage:
+    __slots__ = ("name", "items", "begin")
+
+    def __init__(self, name: str, items: int) -> None:
+        self.name = name
+        self.items = items
+        self.begin = 0.
+
+    def __enter__(self) -> _Stage:
+        if _flame:
+            _stack.append([self.name, 0.])
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        elapsed = time.perf_counter() - self.begin
+        stat = _profile.stats.get(self.name)
+        if stat is None:
+            stat = _profile.stats[self.name] = Stat()
+        stat.calls += 1
+        stat.total += elapsed
+        stat.items += self.items
+        if elapsed > stat.max:
+            stat.max = elapsed
+        if _flame:
+            frame = _stack.pop()
+            path = ";".join([f[0] for f in _stack] + [self.name])
+            _profile.folded[path] = _profile.folded.get(path, 0.) + elapsed - frame[1]
+            if _stack:
+                _stack[-1][1] += elapsed
+
+
+class _NullStage:
+    def __enter__(self) -> _NullStage:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def enable(flame: bool = False) -> None:
+    global _enabled, _flame
+    _enabled = True
+    _flame = flame
+
+
+def disable() -> None:
+    global _enabled, _flame
+    _enabled = False
+    _flame = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def stage(name: str, items: int = 0) -> Any:
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, items)
+
+
+def count(name: str, items: int = 1) -> None:
+    if not _enabled:
+        return
+    stat = _profile.stats.get(name)
+    if stat is None:
+        stat = _profile.stats[name] = Stat()
+    stat.calls += 1
+    stat.items += items
+
+
+def take() -> Optional[Profile]:
+    global _profile
+    if not _enabled:
+        return None
+    profile = _profile
+    _profile = Profile()
+    return profile
+
+
+def reset() -> None:
+    global _profile
+    _profile = Profile()
+    _stack.clear()
+
+
+def merge(profile: Optional[Profile]) -> None:
+    if profile is not None:
+        _profile.merge(profile)
+
+
+def current() -> Profile:
+    return _profile
+
+
+def log_report(folded_path: Optional[str] = None) -> None:
+    if not _enabled:
+        return
+    _logger.info("Profile:\n" + _profile.report())
+    if folded_path is not None and _profile.folded:
+        _profile.write_folded(folded_path)
+        _logger.info(f"Folded stacks written to {folded_path}")
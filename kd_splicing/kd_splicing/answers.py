@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import uuid
+from typing import List, Mapping, Optional, Tuple
+
+import pandas as pd
+from sqlitedict import SqliteDict
+from tqdm import tqdm
+
+from kd_common import logutil
+from kd_splicing.models import IsoformTuple, SimpleMatch
+
+_logger = logutil.get_logger(__name__)
+
+_StoredMatch = Tuple[bytes, bytes, bool, float]
+
+
+def _canonical(iso: uuid.UUID, isoform_to_duplicates: Mapping[uuid.UUID, List[uuid.UUID]]) -> uuid.UUID:
+    duplicates = isoform_to_duplicates.get(iso)
+    return min(duplicates) if duplicates else iso
+
+
+def normalize(query: IsoformTuple, isoform_to_duplicates: Mapping[uuid.UUID, List[uuid.UUID]]) -> Tuple[str, bool]:
+    a = _canonical(query.a, isoform_to_duplicates)
+    b = _canonical(query.b, isoform_to_duplicates)
+    if b < a:
+        return f"{b},{a}", True
+    return f"{a},{b}", False
+
+
+def _unpack(stored: List[_StoredMatch], swapped: bool) -> List[SimpleMatch]:
+    result = []
+    for a, b, predicted_positive, probability in stored:
+        hit_a, hit_b = uuid.UUID(bytes=a), uuid.UUID(bytes=b)
+        result.append(SimpleMatch(
+            hit_isoforms=IsoformTuple(hit_b, hit_a) if swapped else IsoformTuple(hit_a, hit_b),
+            predicted_positive=predicted_positive,
+            predicted_positive_probability=probability,
+        ))
+    return result
+
+
+def build(
+    path: str,
+    matches: pd.DataFrame,
+    isoform_to_duplicates: Mapping[uuid.UUID, List[uuid.UUID]],
+) -> None:
+    queries = 0
+    with SqliteDict(path, flag="w", outer_stack=False, journal_mode="OFF") as store:
+        for (query_a, query_b), group in tqdm(matches.groupby(["query_a", "query_b"], sort=False), desc="build answers"):
+            key, swapped = normalize(IsoformTuple(query_a, query_b), isoform_to_duplicates)
+            hit_a, hit_b = (group["hit_b"], group["hit_a"]) if swapped else (group["hit_a"], group["hit_b"])
+            store[key] = [
+                (a.bytes, b.bytes, bool(positive), float(probability))
+                for a, b, positive, probability in zip(hit_a, hit_b, group["positive"], group["probability"])
+            ]
+            queries += 1
+        store.commit()
+    _logger.info(f"Precomputed answers: {queries} queries")
+
+
+class AnswerStore:
+    def __init__(self, path: str, isoform_to_duplicates: Mapping[uuid.UUID, List[uuid.UUID]]) -> None:
+        self.store = SqliteDict(path, flag="r", outer_stack=False)
+        self.isoform_to_duplicates = isoform_to_duplicates
+
+    def get(self, query: IsoformTuple) -> Optional[List[SimpleMatch]]:
+        key, swapped = normalize(query, self.isoform_to_duplicates)
+        stored = self.store.get(key)
+        if stored is None:
+            return None
+        return _unpack(stored, swapped)
+
+    def __contains__(self, query: IsoformTuple) -> bool:
+        return normalize(query, self.isoform_to_duplicates)[0] in self.store
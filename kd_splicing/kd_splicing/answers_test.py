@@ -0,0 +1,23 @@
+import os
+import tempfile
+import unittest
+import uuid
+
+from kd_splicing import answers, match_store
+from kd_splicing.models import IsoformTuple, SimpleMatch
+
+
+class AnswersTestCase(unittest.TestCase):
+    def test_lookup_by_duplicates_and_order(self) -> None:
+        q_a, q_a_dup, q_b = uuid.UUID(int=3), uuid.UUID(int=1), uuid.UUID(int=2)
+        h_a, h_b = uuid.uuid4(), uuid.uuid4()
+        isoform_to_duplicates = {q_a: [q_a, q_a_dup], q_a_dup: [q_a_dup, q_a], q_b: [q_b]}
+        matches = match_store.simple_matches_to_dataframe({IsoformTuple(q_a, q_b): [SimpleMatch(IsoformTuple(h_a, h_b), True, 0.9)]})
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "answers.sqlite")
+            answers.build(path, matches, isoform_to_duplicates)
+            store = answers.AnswerStore(path, isoform_to_duplicates)
+
+            self.assertEqual(store.get(IsoformTuple(q_a_dup, q_b)), [SimpleMatch(IsoformTuple(h_a, h_b), True, 0.9)])
+            self.assertEqual(store.get(IsoformTuple(q_b, q_a)), [SimpleMatch(IsoformTuple(h_b, h_a), True, 0.9)])
+            self.assertIsNone(store.get(IsoformTuple(q_b, uuid.uuid4())))
@@ -1,25 +1,32 @@
+import heapq
 import json
 import multiprocessing
+import os
 import subprocess
 import uuid
 from collections import defaultdict
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from functools import partial
 from os.path import dirname, join
-from typing import Dict, List, Mapping, Set, Optional
+from typing import Callable, Dict, List, Mapping, Sequence, Set, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
-from kd_common import excel, logutil, pathutil
-from kd_splicing import database, sequences
-from kd_splicing.location.models import ConvertSegment
-from kd_splicing.location.utils import get_alignment_segments, symmetric_difference
+from kd_common import excel, logutil, pathutil, profileutil
+from kd_splicing import blast_members, database, hitstore, kmer_index, realign, scoring, sequences
+from kd_splicing.blast_cache import BlastCache, db_version, make_key
+from kd_splicing.exception import BlastException
+from kd_splicing.location.alignment import AlignmentMap
+from kd_splicing.location.utils import symmetric_difference
 from kd_splicing.models import Queries
 
 
 _logger = logutil.get_logger(__name__)
 
+EVALUE = "0.000000001"
+
 def _deduplicate_isoforms(src_isoforms: List[database.models.Isoform]) -> List[database.models.Isoform]:
     gene_to_isoforms: Dict[uuid.UUID, List[database.models.Isoform]] = defaultdict(list)
     for iso in src_isoforms:
@@ -67,9 +74,8 @@ def create_db(db: database.models.DB, db_path: str, deduplicate_isoforms: bool =
     pathutil.reset_folder(dirname(db_path))
 
     with open(db_path, "w") as f:
-        for isoform in uniq_isoforms:
-            f.write(">" + str(isoform.uuid) + "\n")
-            f.write(isoform.translation + "\n")
+        members = blast_members.write_fasta(f, uniq_isoforms)
+    blast_members.write(blast_members.members_path(db_path), members)
 
     _logger.info("Start Makeblastdb")
     _logger.info(subprocess.call(
@@ -82,11 +88,14 @@ def create_db_from_file_db(db: database.filedb.FileDB, db_path: str, filter: Opt
     pathutil.reset_folder(dirname(db_path))
 
     
+    isoforms = [
+        isoform
+        for isoform in tqdm(db.isoforms.values())
+        if filter is None or isoform.uuid in filter
+    ]
     with open(db_path, "w") as f:
-        for isoform in tqdm(db.isoforms.values()):
-            if filter is None or isoform.uuid in filter:
-                f.write(">" + str(isoform.uuid) + "\n")
-                f.write(isoform.translation + "\n")
+        members = blast_members.write_fasta(f, isoforms)
+    blast_members.write(blast_members.members_path(db_path), members)
 
     _logger.info("Start Makeblastdb")
     _logger.info(subprocess.call(
@@ -114,15 +123,87 @@ def _results_path(launch_folder: str, group: int) -> str:
     ), "result")
 
 
-def run_single(group: int, launch_folder: str, db_path: str, max_target_seqs: int) -> None:
-    blast_args = [
-        "blastp", "-query", _query_path(launch_folder, group), "-db", db_path,
-        "-out", _results_path(launch_folder, group),  "-outfmt", "13", "-num_threads", "19",
-        "-max_target_seqs", str(max_target_seqs), "-evalue", "0.000000001"
-    ]
-    _logger.info("Start blast")
-    _logger.info(subprocess.call(blast_args))
-    _logger.info("Finish blast")
+def assign_groups(isoforms: List[uuid.UUID], lengths: Mapping[uuid.UUID, int], num_groups: int) -> Tuple[Dict[uuid.UUID, int], Dict[uuid.UUID, int]]:
+    groups = [(0, group) for group in range(num_groups)]
+    isoform_to_group: Dict[uuid.UUID, int] = {}
+    for iso in sorted(isoforms, key=lambda i: lengths[i], reverse=True):
+        residues, group = heapq.heappop(groups)
+        isoform_to_group[iso] = group
+        heapq.heappush(groups, (residues + lengths[iso], group))
+
+    isoform_to_idx: Dict[uuid.UUID, int] = {}
+    group_size: Dict[int, int] = defaultdict(int)
+    for iso in isoforms:
+        group = isoform_to_group[iso]
+        isoform_to_idx[iso] = group_size[group]
+        group_size[group] += 1
+    return isoform_to_group, isoform_to_idx
+
+
+def _done_path(launch_folder: str, group: int) -> str:
+    return join(dirname(_results_path(launch_folder, group)), "done")
+
+
+def _query_count(launch_folder: str, group: int) -> int:
+    with open(_query_path(launch_folder, group), "r") as f:
+        return sum(1 for line in f if line.startswith(">"))
+
+
+def _is_complete(launch_folder: str, group: int) -> bool:
+    done_path = _done_path(launch_folder, group)
+    if not os.path.exists(done_path):
+        return False
+    with open(done_path, "r") as f:
+        return f.read().strip() == str(_query_count(launch_folder, group))
+
+
+def _check_results(launch_folder: str, group: int) -> bool:
+    result_files = pathutil.file_list(dirname(_results_path(launch_folder, group)), ".json")
+    expected = _query_count(launch_folder, group)
+    if len(result_files) != expected:
+        _logger.warn(f"Blast group {group}: {len(result_files)} results for {expected} queries")
+        return False
+    for result_file in result_files:
+        with open(result_file, "r") as f:
+            try:
+                json.load(f)["BlastOutput2"]["report"]["results"]["search"]["query_title"]
+            except (ValueError, KeyError, TypeError):
+                _logger.warn(f"Blast group {group}: unreadable result {result_file}")
+                return False
+    return True
+
+
+BlastRunner = Callable[[str, str, str, int, int], int]
+
+
+def blastp(query_path: str, db_path: str, out_path: str, max_target_seqs: int, num_threads: int) -> int:
+    return subprocess.call([
+        "blastp", "-query", query_path, "-db", db_path,
+        "-out", out_path,  "-outfmt", "13", "-num_threads", str(num_threads),
+        "-max_target_seqs", str(max_target_seqs), "-evalue", EVALUE
+    ])
+
+
+def run_single(
+    group: int,
+    launch_folder: str,
+    db_path: str,
+    max_target_seqs: int,
+    num_threads: int = 19,
+    runner: BlastRunner = blastp,
+) -> Tuple[int, bool]:
+    pathutil.reset_folder(dirname(_results_path(launch_folder, group)))
+    _logger.info(f"Start blast group {group}")
+    return_code = runner(_query_path(launch_folder, group), db_path, _results_path(launch_folder, group), max_target_seqs, num_threads)
+    if return_code != 0:
+        _logger.warn(f"Blast group {group} failed with return code {return_code}")
+        return group, False
+    if not _check_results(launch_folder, group):
+        return group, False
+    with open(_done_path(launch_folder, group), "w") as f:
+        f.write(str(_query_count(launch_folder, group)))
+    _logger.info(f"Finish blast group {group}")
+    return group, True
 
 def create_queires(db: database.models.DB, queries: Queries, launch_folder: str) -> None:
     group_to_isoforms: Dict[int, List[uuid.UUID]] = defaultdict(list)
@@ -137,26 +218,310 @@ def create_queires(db: database.models.DB, queries: Queries, launch_folder: str)
                 f.write(f">{isoform.uuid}\n")
                 f.write(isoform.translation + "\n")
 
-def run(launch_folder: str,  blast_db_path: str, max_target_seqs: int=2000, num_groups: int = 20, parallel: bool = True) -> None:
-    if parallel:
-        with multiprocessing.Pool(num_groups) as p:
-            list(tqdm(p.imap(
-                partial(
-                    run_single,
-                    launch_folder=launch_folder,
-                    db_path=blast_db_path,
-                    max_target_seqs=max_target_seqs,
-                ),
-                list(range(num_groups))
-            )))
+def _query_groups(launch_folder: str) -> List[int]:
+    return sorted(
+        int(f[:-len(".fasta")])
+        for f in pathutil.file_list(_queries_folder(launch_folder), ".fasta", absolute=False)
+    )
+
+def _pool_size(num_cores: Optional[int], jobs: int) -> int:
+    return max(1, min(jobs, num_cores or os.cpu_count() or 1))
+
+
+def run(
+    launch_folder: str,
+    blast_db_path: str,
+    max_target_seqs: int=2000,
+    num_groups: int = 20,
+    parallel: bool = True,
+    num_cores: Optional[int] = None,
+    retries: int = 2,
+    runner: BlastRunner = blastp,
+) -> None:
+    groups = [g for g in _query_groups(launch_folder) if not _is_complete(launch_folder, g)]
+    _logger.info(f"Blast groups to run: {len(groups)}")
+    num_cores = num_cores or os.cpu_count() or 1
+    processes = _pool_size(num_cores, min(num_groups, len(groups))) if parallel else 1
+    num_threads = max(1, num_cores // processes)
+    _logger.info(f"Blast processes: {processes}, threads per process: {num_threads}")
+
+    for attempt in range(retries + 1):
+        if not groups:
+            break
+        if attempt:
+            _logger.warn(f"Retry {attempt} for blast groups {groups}")
+        run_group = partial(
+            run_single,
+            launch_folder=launch_folder,
+            db_path=blast_db_path,
+            max_target_seqs=max_target_seqs,
+            num_threads=num_threads,
+            runner=runner,
+        )
+        if processes > 1:
+            with multiprocessing.Pool(processes) as p:
+                results = list(tqdm(p.imap_unordered(run_group, groups), total=len(groups)))
+        else:
+            results = [run_group(group) for group in groups]
+        groups = sorted(group for group, ok in results if not ok)
+
+    if groups:
+        raise BlastException(f"Blast groups failed after {retries} retries: {groups}")
+    blast_members.save_for_launch(launch_folder, blast_db_path)
+    hitstore.build(launch_folder)
+
+
+def run_cached(
+    db: database.models.DB,
+    queries: Queries,
+    launch_folder: str,
+    blast_db_path: str,
+    cache: BlastCache,
+    max_target_seqs: int = 2000,
+    num_groups: int = 20,
+    parallel: bool = True,
+    runner: BlastRunner = blastp,
+) -> None:
+    if runner is not blastp:
+        _logger.info("Blast cache is bypassed for a non-blastp runner")
+        create_queires(db, queries, launch_folder)
+        run(launch_folder, blast_db_path, max_target_seqs=max_target_seqs, num_groups=num_groups, parallel=parallel, runner=runner)
+        return
+    version = db_version(blast_db_path)
+    keys = {
+        iso: make_key(db.isoforms[iso].translation, version, max_target_seqs, EVALUE)
+        for iso in queries.isoforms
+    }
+    cached: Dict[uuid.UUID, str] = {}
+    misses: List[uuid.UUID] = []
+    for iso in queries.isoforms:
+        report = cache.get(keys[iso])
+        if report is None:
+            misses.append(iso)
+        else:
+            cached[iso] = report
+
+    create_queires(db, replace(queries, isoforms=misses), launch_folder)
+    cached_folder = pathutil.create_folder(_results_folder(launch_folder), "group_cached")
+    for i, (iso, report) in enumerate(cached.items()):
+        data = json.loads(report)
+        data["BlastOutput2"]["report"]["results"]["search"]["query_title"] = str(iso)
+        with open(join(cached_folder, f"result_{i + 1}.json"), "w") as f:
+            json.dump(data, f)
+
+    if misses:
+        run(launch_folder, blast_db_path, max_target_seqs=max_target_seqs, num_groups=num_groups, parallel=parallel, runner=runner)
+        for group_folder in pathutil.get_sub_directories(_results_folder(launch_folder)):
+            if group_folder == cached_folder:
+                continue
+            for result_file in pathutil.file_list(group_folder, ".json"):
+                with open(result_file, "r") as f:
+                    report = f.read()
+                query_title = json.loads(report)["BlastOutput2"]["report"]["results"]["search"]["query_title"]
+                key = keys.get(uuid.UUID(query_title))
+                if key is not None:
+                    cache.put(key, report)
     else:
-        for group in list(range(1)):
-            run_single(
-                group=group,
-                launch_folder=launch_folder,
-                db_path=blast_db_path,
-                max_target_seqs=max_target_seqs
-            )
+        blast_members.save_for_launch(launch_folder, blast_db_path)
+        hitstore.build(launch_folder)
+    _logger.info(f"Blast cache: {cache.stats()}")
+
+
+def _empty_report(query_uuid: uuid.UUID, query_len: int) -> dict:
+    return {"BlastOutput2": {"report": {"results": {"search": {
+        "query_title": str(query_uuid),
+        "query_len": query_len,
+        "hits": [],
+    }}}}}
+
+
+def run_prefiltered_single(
+    args: Tuple[int, uuid.UUID, str, List[Tuple[uuid.UUID, str]]],
+    launch_folder: str,
+    max_target_seqs: int,
+    dbsize: int,
+    runner: Optional[BlastRunner] = None,
+) -> Tuple[uuid.UUID, bool]:
+    idx, query_uuid, translation, subjects = args
+    folder = _prefiltered_folder(launch_folder, idx)
+    pathutil.reset_folder(folder)
+    if not subjects:
+        with open(join(folder, "result_1.json"), "w") as f:
+            json.dump(_empty_report(query_uuid, len(translation)), f)
+        return query_uuid, True
+    query_path = join(folder, "query.fasta")
+    subject_path = join(folder, "subject.fasta")
+    with open(query_path, "w") as f:
+        f.write(f">{query_uuid}\n{translation}\n")
+    with open(subject_path, "w") as f:
+        for iso_uuid, iso_translation in subjects:
+            f.write(f">{iso_uuid}\n{iso_translation}\n")
+    if runner is None:
+        return_code = subprocess.call([
+            "blastp", "-query", query_path, "-subject", subject_path, "-dbsize", str(dbsize),
+            "-out", join(folder, "result"), "-outfmt", "13",
+            "-max_target_seqs", str(max_target_seqs), "-evalue", EVALUE,
+        ])
+    else:
+        return_code = runner(query_path, subject_path, join(folder, "result"), max_target_seqs, 1)
+    os.remove(query_path)
+    os.remove(subject_path)
+    return query_uuid, return_code == 0 and len(pathutil.file_list(folder, ".json")) == 1
+
+
+def _prefiltered_folder(launch_folder: str, idx: int) -> str:
+    return join(_results_folder(launch_folder), f"prefiltered_{idx}")
+
+
+def _in_taxonomy(record: database.models.Record, taxonomy: Set[str]) -> bool:
+    return record.organism in taxonomy or any(t in taxonomy for t in record.taxonomy)
+
+
+def run_prefiltered(
+    db: database.models.DB,
+    queries: Queries,
+    launch_folder: str,
+    index: kmer_index.KmerIndex,
+    max_target_seqs: int = 2000,
+    max_candidates: int = 2000,
+    min_shared: int = 2,
+    parallel: bool = True,
+    taxonomy: Optional[Sequence[str]] = None,
+    cache: Optional[BlastCache] = None,
+    dbsize: Optional[int] = None,
+    num_cores: Optional[int] = None,
+    runner: Optional[BlastRunner] = None,
+) -> None:
+    pathutil.reset_folder(_results_folder(launch_folder))
+    if runner is not None and cache is not None:
+        _logger.info("Blast cache is bypassed for a custom runner")
+        cache = None
+    wanted = set(taxonomy or [])
+    gene_allowed: Dict[uuid.UUID, bool] = {}
+
+    def allowed(gene_uuid: uuid.UUID) -> bool:
+        result = gene_allowed.get(gene_uuid)
+        if result is None:
+            gene = db.genes.get(gene_uuid)
+            result = gene_allowed[gene_uuid] = gene is not None and _in_taxonomy(db.records[gene.record_uuid], wanted)
+        return result
+
+    version = f"kmer:{kmer_index.version(index.folder)}:{max_candidates}:{min_shared}:{','.join(sorted(wanted))}"
+    keys: Dict[uuid.UUID, str] = {}
+    tasks = []
+    cached = 0
+    num_subjects = 0
+    for idx, iso_uuid in enumerate(tqdm(queries.isoforms, desc="kmer prefilter")):
+        translation = db.isoforms[iso_uuid].translation
+        if cache is not None:
+            keys[iso_uuid] = make_key(translation, version, max_target_seqs, EVALUE)
+            report = cache.get(keys[iso_uuid])
+            if report is not None:
+                data = json.loads(report)
+                data["BlastOutput2"]["report"]["results"]["search"]["query_title"] = str(iso_uuid)
+                folder = _prefiltered_folder(launch_folder, idx)
+                pathutil.reset_folder(folder)
+                with open(join(folder, "result_1.json"), "w") as f:
+                    json.dump(data, f)
+                cached += 1
+                continue
+        subjects = [
+            (candidate, db.isoforms[candidate].translation)
+            for candidate in index.candidate_isoforms(translation, max_candidates, min_shared, allowed if wanted else None)
+            if candidate in db.isoforms
+        ]
+        num_subjects += len(subjects)
+        tasks.append((idx, iso_uuid, translation, subjects))
+    _logger.info(f"Kmer prefilter: {cached} cached, {num_subjects / max(len(tasks), 1):.1f} candidate isoforms per query")
+
+    run_query = partial(run_prefiltered_single, launch_folder=launch_folder, max_target_seqs=max_target_seqs, dbsize=dbsize or index.residues, runner=runner)
+    if parallel and tasks:
+        with multiprocessing.Pool(_pool_size(num_cores, len(tasks))) as p:
+            results = list(tqdm(p.imap_unordered(run_query, tasks), total=len(tasks)))
+    else:
+        results = [run_query(task) for task in tqdm(tasks)]
+    failed = [query for query, ok in results if not ok]
+    if failed:
+        raise BlastException(f"Prefiltered blast failed for queries: {failed}")
+    if cache is not None:
+        for idx, iso_uuid, _, _ in tasks:
+            with open(join(_prefiltered_folder(launch_folder, idx), "result_1.json"), "r") as f:
+                cache.put(keys[iso_uuid], f.read())
+    blast_members.clear_for_launch(launch_folder)
+    hitstore.build(launch_folder)
+
+
+def _realign_single(
+    args: Tuple[int, uuid.UUID, str, List[Tuple[uuid.UUID, str]]],
+    folder: str,
+    dbsize: int,
+    max_target_seqs: int,
+) -> None:
+    idx, query_uuid, translation, subjects = args
+    report = realign.report(realign.default_aligner(), query_uuid, translation, subjects, dbsize, float(EVALUE), max_target_seqs)
+    with open(join(folder, f"result_{idx + 1}.json"), "w") as f:
+        json.dump(report, f)
+
+
+def run_gene_level(
+    db: database.models.DB,
+    queries: Queries,
+    launch_folder: str,
+    blast_db_path: str,
+    index: kmer_index.KmerIndex,
+    max_target_seqs: int = 2000,
+    num_groups: int = 20,
+    parallel: bool = True,
+    runner: BlastRunner = blastp,
+    dbsize: Optional[int] = None,
+    num_cores: Optional[int] = None,
+) -> None:
+    gene_to_queries: Dict[uuid.UUID, List[uuid.UUID]] = defaultdict(list)
+    for iso in queries.isoforms:
+        gene_to_queries[db.isoforms[iso].gene_uuid].append(iso)
+    representatives = {
+        gene: max(isoforms, key=lambda i: len(db.isoforms[i].translation))
+        for gene, isoforms in gene_to_queries.items()
+    }
+    lengths = {iso: len(db.isoforms[iso].translation) for iso in representatives.values()}
+    isoform_to_group, isoform_to_idx = assign_groups(list(representatives.values()), lengths, num_groups)
+    create_queires(db, replace(
+        queries,
+        isoforms=list(representatives.values()),
+        isoform_to_group=isoform_to_group,
+        isoform_to_idx=isoform_to_idx,
+    ), launch_folder)
+    run(launch_folder, blast_db_path, max_target_seqs=max_target_seqs, num_groups=num_groups, parallel=parallel, num_cores=num_cores, runner=runner)
+
+    store = hitstore.HitStore(launch_folder)
+    tasks = []
+    for gene, isoforms in gene_to_queries.items():
+        representative = representatives[gene]
+        hit_genes = {
+            db.isoforms[h.iso_uuid].gene_uuid
+            for h in store.get(representative) or []
+            if h.iso_uuid in db.isoforms
+        }
+        subjects = [
+            (iso, db.isoforms[iso].translation)
+            for hit_gene in hit_genes
+            for iso in index.gene_to_isoforms.get(hit_gene, [])
+            if iso in db.isoforms
+        ]
+        for iso in isoforms:
+            if iso != representative:
+                tasks.append((len(tasks), iso, db.isoforms[iso].translation, subjects))
+    _logger.info(f"Gene level blast: {len(representatives)} blasted, {len(tasks)} realigned")
+
+    folder = pathutil.create_folder(_results_folder(launch_folder), "group_realigned")
+    realign_query = partial(_realign_single, folder=folder, dbsize=dbsize or index.residues, max_target_seqs=max_target_seqs)
+    if parallel and tasks:
+        with multiprocessing.Pool(_pool_size(num_cores, len(tasks))) as p:
+            list(tqdm(p.imap_unordered(realign_query, tasks), total=len(tasks)))
+    else:
+        for task in tqdm(tasks):
+            realign_query(task)
+    hitstore.extend(launch_folder, sorted(pathutil.file_list(folder, ".json")))
 
 
 @dataclass
@@ -176,8 +541,29 @@ class Hit:
     qseq: str
     hseq: str
     midline: str
-    query_segments: List[ConvertSegment] = field(default_factory=list)
-    hit_segments: List[ConvertSegment] = field(default_factory=list)
+    _query_map: Optional[AlignmentMap] = field(default=None, repr=False, compare=False)
+    _hit_map: Optional[AlignmentMap] = field(default=None, repr=False, compare=False)
+    _midline_prefix: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
+
+    @property
+    def query_map(self) -> AlignmentMap:
+        if self._query_map is None:
+            with profileutil.stage("alignment_segments"):
+                self._query_map = AlignmentMap(self.qseq, self.query_from, self.query_len)
+        return self._query_map
+
+    @property
+    def hit_map(self) -> AlignmentMap:
+        if self._hit_map is None:
+            with profileutil.stage("alignment_segments"):
+                self._hit_map = AlignmentMap(self.hseq, self.hit_from, self.iso_len)
+        return self._hit_map
+
+    @property
+    def midline_prefix(self) -> np.ndarray:
+        if self._midline_prefix is None:
+            self._midline_prefix = scoring.midline_prefix(self.midline)
+        return self._midline_prefix
 
 
 @dataclass
@@ -185,42 +571,89 @@ class Results:
     hits: Mapping[uuid.UUID, List[Hit]]
 
 
+def _make_hit(
+    db: database.models.DB,
+    iso_uuid: uuid.UUID,
+    score: float,
+    query_from: int,
+    query_to: int,
+    query_len: int,
+    hit_from: int,
+    hit_to: int,
+    qseq: str,
+    hseq: str,
+    midline: str,
+) -> Optional[Hit]:
+    iso = db.isoforms.get(iso_uuid)
+    if not iso:
+        _logger.warn(f"Iso not found in db {iso_uuid}")
+        return None
+    gene = db.genes[iso.gene_uuid]
+    record = db.records[gene.record_uuid]
+    db_file = db.files[record.file_uuid]
+    return Hit(
+        iso_uuid=iso.uuid,
+        iso_len=len(iso.translation),
+        iso_gene_uuid=iso.gene_uuid,
+        iso_location=iso.location,
+        organism=record.organism,
+        db_name=db_file.db_name,
+        score=score,
+        query_from=query_from,
+        query_to=query_to,
+        query_len=query_len,
+        hit_from=hit_from,
+        hit_to=hit_to,
+        qseq=qseq,
+        hseq=hseq,
+        midline=midline,
+    )
+
+
+def get_stored_results(db: database.models.DB, store: hitstore.HitStore, query_uuid: uuid.UUID, query_len: int) -> List[Hit]:
+    hits = []
+    for raw in store.get(query_uuid) or []:
+        hit = _make_hit(
+            db,
+            iso_uuid=raw.iso_uuid,
+            score=raw.score,
+            query_from=raw.query_from,
+            query_to=raw.query_to,
+            query_len=query_len,
+            hit_from=raw.hit_from,
+            hit_to=raw.hit_to,
+            qseq=raw.qseq.decode(),
+            hseq=raw.hseq.decode(),
+            midline=raw.midline.decode(),
+        )
+        if hit is not None:
+            hits.append(hit)
+    return hits
+
+
 def get_results(db: database.models.DB, launch_folder: str, query_len: int, result_file: str, query_organism: str) -> List[Hit]:
     hits = []
-    with open(result_file, "r") as f:
+    members = blast_members.load_for_launch(launch_folder)
+    with open(result_file, "r") as f, profileutil.stage("json_load"):
         data = json.load(f)
-        search = data["BlastOutput2"]["report"]["results"]["search"]
-        blast_hits = search["hits"]
-        for hit in blast_hits:
-            hsps = hit["hsps"][0]
-            qseq = hsps["qseq"]
-            hseq = hsps["hseq"]
-            iso_uuid = uuid.UUID(hit["description"][0]["title"])
-            iso = db.isoforms.get(iso_uuid)
-            if not iso:
-                _logger.warn(f"Iso not found in db {iso_uuid}")
-                continue
-            gene = db.genes[iso.gene_uuid]
-            record = db.records[gene.record_uuid]
-            # if record.organism == query_organism: continue
-            db_file = db.files[record.file_uuid]
-            hit_from = hsps["hit_from"] - 1
-            query_from = hsps["query_from"] - 1
-            hits.append(Hit(
-                iso_uuid=iso.uuid,
-                iso_len=len(iso.translation),
-                iso_gene_uuid=iso.gene_uuid,
-                iso_location=iso.location,
-                organism=record.organism,
-                db_name=db_file.db_name,
+    search = data["BlastOutput2"]["report"]["results"]["search"]
+    blast_hits = search["hits"]
+    for hit in blast_hits:
+        hsps = hit["hsps"][0]
+        for iso_uuid in blast_members.expand(members, uuid.UUID(hit["description"][0]["title"])):
+            h = _make_hit(
+                db,
+                iso_uuid=iso_uuid,
                 score=hsps["bit_score"],
                 query_from=hsps["query_from"] - 1,
                 query_to=hsps["query_to"],
                 query_len=query_len,
                 hit_from=hsps["hit_from"] - 1,
                 hit_to=hsps["hit_to"],
-                qseq=qseq,
-                hseq=hseq,
+                qseq=hsps["qseq"],
+                hseq=hsps["hseq"],
                 midline=hsps["midline"],
-            ))
+            )
+            if h is not None:
+                hits.append(h)
     return hits
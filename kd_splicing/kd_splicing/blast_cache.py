@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import glob
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Mapping, Optional
+
+from kd_common import logutil
+
+_logger = logutil.get_logger(__name__)
+
+_DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def db_version(blast_db_path: str) -> str:
+    h = hashlib.sha1()
+    for db_path in sorted(blast_db_path.split()):
+        for path in sorted(glob.glob(db_path + ".*")):
+            stat = os.stat(path)
+            h.update(f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)};".encode())
+    return h.hexdigest()
+
+
+def make_key(translation: str, blast_db_version: str, max_target_seqs: int, evalue: str) -> str:
+    seq_hash = hashlib.sha256(translation.encode()).hexdigest()
+    return f"{seq_hash}:{blast_db_version}:{max_target_seqs}:{evalue}"
+
+
+class BlastCache:
+    def __init__(self, path: str, max_bytes: int = _DEFAULT_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports (key TEXT PRIMARY KEY, report BLOB, size INTEGER, last_used REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reports_last_used ON reports (last_used)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT report FROM reports WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE reports SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return zlib.decompress(row[0]).decode()
+
+    def put(self, key: str, report: str) -> None:
+        data = zlib.compress(report.encode())
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (key, report, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(data), len(data), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM reports").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM reports ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    def stats(self) -> Mapping[str, float]:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / requests if requests else 0.,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
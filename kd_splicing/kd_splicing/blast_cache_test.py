@@ -0,0 +1,28 @@
+import os
+import tempfile
+import unittest
+
+from kd_splicing.blast_cache import BlastCache, make_key
+
+
+class BlastCacheTestCase(unittest.TestCase):
+    def test_lru(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            cache = BlastCache(os.path.join(folder, "cache.sqlite"))
+            a = make_key("MKV", "v1", 2000, "1e-9")
+            b = make_key("MKL", "v1", 2000, "1e-9")
+            self.assertNotEqual(a, make_key("MKV", "v2", 2000, "1e-9"))
+
+            self.assertIsNone(cache.get(a))
+            cache.put(a, "report a")
+            cache.put(b, "report b")
+            self.assertEqual(cache.get(a), "report a")
+            self.assertEqual(len(cache), 2)
+
+            cache.max_bytes = len(cache._conn.execute("SELECT report FROM reports WHERE key = ?", (a,)).fetchone()[0])
+            cache.put(a, "report a")
+            self.assertEqual(len(cache), 1)
+            self.assertIsNone(cache.get(b))
+            self.assertEqual(cache.get(a), "report a")
+            self.assertEqual(cache.stats(), {"hits": 2, "misses": 2, "evictions": 1, "hit_rate": 0.5})
+            cache.close()
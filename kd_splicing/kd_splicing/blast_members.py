@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Mapping, Sequence, TextIO, Tuple
+
+from kd_common import logutil
+from kd_splicing import database
+
+_logger = logutil.get_logger(__name__)
+
+_NAMESPACE = uuid.UUID("3f1c9a52-7d4e-5b8a-9c61-2e0f4d7b8a13")
+_LAUNCH_FILE = "blast_members.json"
+
+Members = Dict[uuid.UUID, List[uuid.UUID]]
+
+_loaded: Dict[str, Tuple[float, Members]] = {}
+
+
+def sequence_id(translation: str) -> uuid.UUID:
+    return uuid.uuid5(_NAMESPACE, translation)
+
+
+def _digest(translation: str) -> bytes:
+    return hashlib.sha1(translation.encode()).digest()
+
+
+def write_fasta(f: TextIO, isoforms: Sequence[database.models.Isoform]) -> Members:
+    digest_to_isoforms: Dict[bytes, List[uuid.UUID]] = defaultdict(list)
+    for iso in isoforms:
+        digest_to_isoforms[_digest(iso.translation)].append(iso.uuid)
+
+    members: Members = {}
+    for iso in isoforms:
+        uuids = digest_to_isoforms.pop(_digest(iso.translation), None)
+        if uuids is None:
+            continue
+        if len(uuids) == 1:
+            seq_id = uuids[0]
+        else:
+            seq_id = sequence_id(iso.translation)
+            members[seq_id] = sorted(uuids)
+        f.write(f">{seq_id}\n{iso.translation}\n")
+    _logger.info(f"Collapsed {sum(len(m) for m in members.values())} isoforms into {len(members)} sequences")
+    return members
+
+
+def members_path(blast_db_path: str) -> str:
+    return blast_db_path + ".members.json"
+
+
+def write(path: str, members: Mapping[uuid.UUID, List[uuid.UUID]]) -> None:
+    with open(path, "w") as f:
+        json.dump({str(k): [str(i) for i in v] for k, v in members.items()}, f)
+
+
+def read(path: str) -> Members:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return {uuid.UUID(k): [uuid.UUID(i) for i in v] for k, v in json.load(f).items()}
+
+
+def read_db(blast_db_path: str) -> Members:
+    members: Members = {}
+    for db_path in blast_db_path.split():
+        members.update(read(members_path(db_path)))
+    return members
+
+
+def save_for_launch(launch_folder: str, blast_db_path: str) -> None:
+    write(os.path.join(launch_folder, _LAUNCH_FILE), read_db(blast_db_path))
+
+
+def clear_for_launch(launch_folder: str) -> None:
+    write(os.path.join(launch_folder, _LAUNCH_FILE), {})
+
+
+def load_for_launch(launch_folder: str) -> Members:
+    path = os.path.join(launch_folder, _LAUNCH_FILE)
+    if not os.path.exists(path):
+        return {}
+    mtime = os.path.getmtime(path)
+    loaded = _loaded.get(path)
+    if loaded is None or loaded[0] != mtime:
+        loaded = mtime, read(path)
+        _loaded[path] = loaded
+    return loaded[1]
+
+
+def expand(members: Mapping[uuid.UUID, List[uuid.UUID]], seq_id: uuid.UUID) -> List[uuid.UUID]:
+    return members.get(seq_id) or [seq_id]
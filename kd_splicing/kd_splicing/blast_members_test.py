@@ -0,0 +1,22 @@
+import io
+import unittest
+import uuid
+
+from kd_splicing import blast_members
+from kd_splicing.database.models import Isoform
+
+
+class BlastMembersTestCase(unittest.TestCase):
+    def test_write_fasta(self) -> None:
+        isoforms = [
+            Isoform(uuid.UUID(int=i), uuid.UUID(int=100), None, None, None, translation, None, None)
+            for i, translation in ((1, "MKV"), (2, "MKL"), (3, "MKV"))
+        ]
+        f = io.StringIO()
+        members = blast_members.write_fasta(f, isoforms)
+
+        seq_id = blast_members.sequence_id("MKV")
+        self.assertEqual(members, {seq_id: [uuid.UUID(int=1), uuid.UUID(int=3)]})
+        self.assertEqual(f.getvalue(), f">{seq_id}\nMKV\n>{uuid.UUID(int=2)}\nMKL\n")
+        self.assertEqual(blast_members.expand(members, seq_id), [uuid.UUID(int=1), uuid.UUID(int=3)])
+        self.assertEqual(blast_members.expand(members, uuid.UUID(int=2)), [uuid.UUID(int=2)])
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import re
+import subprocess
+import uuid
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from tqdm import tqdm
+
+from kd_common import logutil, pathutil
+from kd_splicing import blast, blast_members, database, kmer_index
+from kd_splicing.exception import BlastException
+
+_logger = logutil.get_logger(__name__)
+
+ALIAS_NAME = "all"
+_MANIFEST = "manifest.json"
+
+
+@dataclass
+class Shard:
+    name: str
+    organisms: List[str]
+    taxonomy: List[str]
+    isoforms: int
+    residues: int
+    hash: str
+
+
+def organism_shard(record: database.models.Record) -> str:
+    return record.organism
+
+
+def taxonomy_shard(level: int) -> Callable[[database.models.Record], str]:
+    def _shard(record: database.models.Record) -> str:
+        return record.taxonomy[level] if len(record.taxonomy) > level else record.organism
+    return _shard
+
+
+def _shard_name(key: str) -> str:
+    readable = re.sub(r"[^A-Za-z0-9]+", "_", key).strip("_")[:48]
+    return f"{readable}_{hashlib.sha1(key.encode()).hexdigest()[:8]}"
+
+
+def _read_manifest(folder: str) -> Dict[str, Shard]:
+    path = os.path.join(folder, _MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return {name: Shard(**shard) for name, shard in json.load(f).items()}
+
+
+def _write_manifest(folder: str, shards: Dict[str, Shard]) -> None:
+    with open(os.path.join(folder, _MANIFEST), "w") as f:
+        json.dump({name: asdict(shard) for name, shard in shards.items()}, f, indent=2)
+
+
+def _shard_built(folder: str, name: str) -> bool:
+    return any(
+        f.startswith(name + ".") and f.endswith(".pin")
+        for f in os.listdir(folder)
+    )
+
+
+def _remove_shard(folder: str, name: str) -> None:
+    for f in os.listdir(folder):
+        if f.startswith(name + "."):
+            os.remove(os.path.join(folder, f))
+
+
+def create_db(
+    db: Any,
+    folder: str,
+    shard_key: Callable[[database.models.Record], str] = organism_shard,
+    deduplicate_isoforms: bool = True,
+) -> str:
+    pathutil.create_folder(folder)
+    isoforms = list(db.isoforms.values())
+    if deduplicate_isoforms:
+        isoforms = blast._deduplicate_isoforms(isoforms)
+
+    key_to_isoforms: Dict[str, List[database.models.Isoform]] = defaultdict(list)
+    key_to_records: Dict[str, Dict[uuid.UUID, database.models.Record]] = defaultdict(dict)
+    for iso in tqdm(isoforms, desc="split isoforms by shard"):
+        record = db.records[db.genes[iso.gene_uuid].record_uuid]
+        key = shard_key(record)
+        key_to_isoforms[key].append(iso)
+        key_to_records[key][record.uuid] = record
+
+    old_shards = _read_manifest(folder)
+    shards: Dict[str, Shard] = {}
+    rebuilt = 0
+    for key, shard_isoforms in tqdm(key_to_isoforms.items(), desc="build shards"):
+        name = _shard_name(key)
+        shard_isoforms.sort(key=lambda i: i.uuid)
+        fasta = io.StringIO()
+        members = blast_members.write_fasta(fasta, shard_isoforms)
+        content = fasta.getvalue()
+        records = key_to_records[key].values()
+        shard = Shard(
+            name=name,
+            organisms=sorted({r.organism for r in records}),
+            taxonomy=sorted({t for r in records for t in r.taxonomy}),
+            isoforms=len(shard_isoforms),
+            residues=sum(len(t) for t in {iso.translation for iso in shard_isoforms}),
+            hash=hashlib.sha1(content.encode()).hexdigest(),
+        )
+        shards[name] = shard
+        old = old_shards.get(name)
+        if old is not None and old.hash == shard.hash and _shard_built(folder, name):
+            continue
+        _remove_shard(folder, name)
+        fasta_path = os.path.join(folder, name + ".fasta")
+        with open(fasta_path, "w") as f:
+            f.write(content)
+        blast_members.write(blast_members.members_path(os.path.join(folder, name)), members)
+        return_code = subprocess.call(["makeblastdb", "-in", fasta_path, "-dbtype", "prot", "-out", os.path.join(folder, name)])
+        if return_code != 0:
+            raise BlastException(f"makeblastdb failed for shard {name} with return code {return_code}")
+        os.remove(fasta_path)
+        rebuilt += 1
+
+    for name in set(old_shards) - set(shards):
+        _remove_shard(folder, name)
+
+    _write_manifest(folder, shards)
+    if rebuilt or set(old_shards) != set(shards) or not kmer_index.exists(folder):
+        kmer_index.build(isoforms, folder)
+    alias_path = os.path.join(folder, ALIAS_NAME)
+    blast_members.write(
+        blast_members.members_path(alias_path),
+        blast_members.read_db(" ".join(os.path.join(folder, name) for name in shards)),
+    )
+    subprocess.check_call([
+        "blastdb_aliastool", "-dbtype", "prot", "-title", ALIAS_NAME, "-out", alias_path,
+        "-dblist", " ".join(os.path.join(folder, name) for name in sorted(shards)),
+    ])
+    _logger.info(f"BLAST shards: {len(shards)}, rebuilt: {rebuilt}, removed: {len(set(old_shards) - set(shards))}")
+    return alias_path
+
+
+def select_shards(folder: str, taxonomy: Sequence[str]) -> List[Shard]:
+    wanted = set(taxonomy)
+    return [
+        shard
+        for _, shard in sorted(_read_manifest(folder).items())
+        if wanted & set(shard.taxonomy) or wanted & set(shard.organisms)
+    ]
+
+
+def restrict(blast_db_path: str, taxonomy: Optional[Sequence[str]]) -> str:
+    folder = os.path.dirname(blast_db_path)
+    if not taxonomy:
+        return blast_db_path
+    if not os.path.exists(os.path.join(folder, _MANIFEST)):
+        raise BlastException(f"Taxonomy filter {list(taxonomy)} needs a sharded BLAST DB, no manifest in {folder}")
+    shards = select_shards(folder, taxonomy)
+    if not shards:
+        raise BlastException(f"No BLAST shards for taxonomy filter {list(taxonomy)}")
+    total = sum(s.residues for s in _read_manifest(folder).values())
+    selected = sum(s.residues for s in shards)
+    _logger.info(f"Taxonomy filter {list(taxonomy)}: {len(shards)} shards, {selected / total:.2%} of residues")
+    return " ".join(os.path.join(folder, s.name) for s in shards)
+
+
+def residues(blast_db_path: str) -> Optional[int]:
+    db_paths = blast_db_path.split()
+    shards = _read_manifest(os.path.dirname(db_paths[0]))
+    if not shards:
+        return None
+    names = [os.path.basename(path) for path in db_paths]
+    if names == [ALIAS_NAME]:
+        return sum(s.residues for s in shards.values())
+    return sum(shards[name].residues for name in names if name in shards)
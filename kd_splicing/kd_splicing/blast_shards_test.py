@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+
+from kd_splicing import blast_shards
+from kd_splicing.blast_shards import Shard
+from kd_splicing.exception import BlastException
+
+
+class BlastShardsTestCase(unittest.TestCase):
+    def test_restrict(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            alias = os.path.join(folder, blast_shards.ALIAS_NAME)
+            self.assertEqual(blast_shards.restrict(alias, None), alias)
+            with self.assertRaises(BlastException):
+                blast_shards.restrict(alias, ["Mammalia"])
+
+            shards = {
+                "a": Shard("a", ["Homo sapiens"], ["Eukaryota", "Mammalia"], 2, 100, "h1"),
+                "b": Shard("b", ["Danio rerio"], ["Eukaryota", "Actinopteri"], 1, 300, "h2"),
+            }
+            blast_shards._write_manifest(folder, shards)
+            self.assertEqual(blast_shards._read_manifest(folder), shards)
+
+            self.assertEqual(blast_shards.restrict(alias, None), alias)
+            self.assertEqual(blast_shards.restrict(alias, ["Mammalia"]), os.path.join(folder, "a"))
+            self.assertEqual(blast_shards.restrict(alias, ["Danio rerio"]), os.path.join(folder, "b"))
+            self.assertEqual(
+                blast_shards.restrict(alias, ["Eukaryota"]),
+                " ".join([os.path.join(folder, "a"), os.path.join(folder, "b")]),
+            )
+            with self.assertRaises(BlastException):
+                blast_shards.restrict(alias, ["Bacteria"])
+
+            self.assertEqual(blast_shards.residues(alias), 400)
+            self.assertEqual(blast_shards.residues(blast_shards.restrict(alias, ["Mammalia"])), 100)
+
+    def test_shard_name(self) -> None:
+        name = blast_shards._shard_name("Homo sapiens (human)")
+        self.assertTrue(name.startswith("Homo_sapiens_human_"))
+        self.assertNotEqual(name, blast_shards._shard_name("Homo sapiens human"))
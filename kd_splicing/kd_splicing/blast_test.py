@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+import uuid
+
+from kd_splicing import blast, fake_blast, hitstore, kmer_index
+from kd_splicing.blast import assign_groups
+from kd_splicing.blast_cache import BlastCache
+from kd_splicing.database.models import DB, Gene, Isoform, Record
+from kd_splicing.models import Queries
+
+
+class BlastTestCase(unittest.TestCase):
+    def test_assign_groups(self) -> None:
+        isoforms = [uuid.UUID(int=i) for i in range(6)]
+        lengths = dict(zip(isoforms, [100, 900, 300, 500, 400, 200]))
+        isoform_to_group, isoform_to_idx = assign_groups(isoforms, lengths, 3)
+
+        residues = [0, 0, 0]
+        for iso, group in isoform_to_group.items():
+            residues[group] += lengths[iso]
+        self.assertEqual(sorted(residues), [700, 800, 900])
+
+        for group in range(3):
+            members = [iso for iso in isoforms if isoform_to_group[iso] == group]
+            self.assertEqual([isoform_to_idx[iso] for iso in members], list(range(len(members))))
+
+    def test_check_results_parses_reports(self) -> None:
+        with tempfile.TemporaryDirectory() as launch_folder:
+            with open(blast._query_path(launch_folder, 0), "w") as f:
+                f.write(">q\nMKV\n")
+            result_path = blast._results_path(launch_folder, 0) + "_1.json"
+            with open(result_path, "w") as f:
+                json.dump({"BlastOutput2": {"report": {"results": {"search": {"query_title": "q", "hits": []}}}}}, f)
+            self.assertTrue(blast._check_results(launch_folder, 0))
+            with open(result_path, "w") as f:
+                f.write('{"BlastOutput2": {"report": {"results": {}}')
+            self.assertFalse(blast._check_results(launch_folder, 0))
+
+
+class PrefilteredTestCase(unittest.TestCase):
+    def test_taxonomy_and_cache(self) -> None:
+        record = Record(uuid.UUID(int=10), uuid.UUID(int=20), "seq", "Homo sapiens", ["Eukaryota", "Mammalia"])
+        genes = {uuid.UUID(int=100 + i): Gene(uuid.UUID(int=100 + i), record.uuid, None, None, None, None) for i in range(2)}
+        isoforms = {
+            uuid.UUID(int=i): Isoform(uuid.UUID(int=i), uuid.UUID(int=100 + i), None, None, None, "MKVLAGHTREWQPLK", None, None)
+            for i in range(2)
+        }
+        db = DB(isoforms=isoforms, genes=genes, records={record.uuid: record})
+        queries = Queries([], [uuid.UUID(int=0)], {uuid.UUID(int=0): 0}, {uuid.UUID(int=0): 0})
+        with tempfile.TemporaryDirectory() as folder:
+            kmer_index.build(list(isoforms.values()), folder)
+            index = kmer_index.KmerIndex(folder)
+            cache = BlastCache(os.path.join(folder, "cache.sqlite"))
+            for _ in range(2):
+                blast.run_prefiltered(db, queries, os.path.join(folder, "launch"), index, parallel=False, taxonomy=["Actinopteri"], cache=cache)
+                self.assertEqual(hitstore.HitStore(os.path.join(folder, "launch")).get(uuid.UUID(int=0)), [])
+            self.assertEqual(len(cache), 1)
+            self.assertEqual(cache.stats()["hits"], 1)
+            cache.close()
+
+    def test_taxonomy_selects_subjects(self) -> None:
+        human = Record(uuid.UUID(int=10), uuid.UUID(int=20), "seq", "Homo sapiens", ["Eukaryota", "Mammalia"])
+        fish = Record(uuid.UUID(int=11), uuid.UUID(int=20), "seq", "Danio rerio", ["Eukaryota", "Actinopteri"])
+        gene_records = [human, human, fish, fish]
+        genes = {
+            uuid.UUID(int=100 + i): Gene(uuid.UUID(int=100 + i), record.uuid, None, None, None, None)
+            for i, record in enumerate(gene_records)
+        }
+        translations = ["MKVLAGHTREWQPLK", "MKVLAGHTREWQPLR", "MKVLAGHTREWQPLD", "CCCCCCCCCCCCCCC"]
+        isoforms = {
+            uuid.UUID(int=i): Isoform(uuid.UUID(int=i), uuid.UUID(int=100 + i), None, None, None, translation, None, None)
+            for i, translation in enumerate(translations)
+        }
+        db = DB(isoforms=isoforms, genes=genes, records={human.uuid: human, fish.uuid: fish})
+        queries = Queries([], [uuid.UUID(int=0)], {uuid.UUID(int=0): 0}, {uuid.UUID(int=0): 0})
+        with tempfile.TemporaryDirectory() as folder:
+            kmer_index.build(list(isoforms.values()), folder)
+            index = kmer_index.KmerIndex(folder)
+            launch = os.path.join(folder, "launch")
+            for taxonomy, expected in ((["Actinopteri"], [2]), (["Mammalia"], [0, 1])):
+                blast.run_prefiltered(db, queries, launch, index, parallel=False, taxonomy=taxonomy, runner=fake_blast.SyntheticRunner(hits_per_query=10))
+                hits = hitstore.HitStore(launch).get(uuid.UUID(int=0))
+                self.assertEqual(sorted(h.iso_uuid for h in hits), [uuid.UUID(int=i) for i in expected])
+                for h in hits:
+                    self.assertEqual(h.qseq.decode(), translations[0][h.query_from:h.query_to])
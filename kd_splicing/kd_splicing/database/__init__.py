@@ -1 +1 @@
-from kd_splicing.database import archive, models, store, utils, feature_tables, filedb
+from kd_splicing.database import archive, models, store, utils, feature_tables, filedb, interval_index
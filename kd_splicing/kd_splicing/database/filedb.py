@@ -6,6 +6,8 @@ import pickle
 import shutil
 from typing import Dict, Generic, List, Mapping, TypeVar, Optional, Union
 import uuid
+from kd_splicing.database import interval_index
+from kd_splicing.database.interval_index import RecordIndex
 from kd_splicing.database.models import DB, DBPart, DBFile, Gene, Isoform, RNA, Record
 from kd_splicing.database.store import get_isoform_to_duplicates
 from sqlitedict import SqliteDict
@@ -129,10 +131,13 @@ class FileDB:
 
     file_path: Path
 
+    interval_index: Optional[_Wrapper[RecordIndex]] = None
+
     @classmethod
     def create(cls, file_path: Union[Path, str],  method: str = "r", compress: bool = False):
         file_path = Path(file_path)
         pathutil.create_folder(file_path.parent)
+        interval_index_path = str(file_path) + "_interval_index.sqlite"
         return FileDB(
             files=_Wrapper(str(file_path) + "_files.sqlite", method, compress),
             records=_Wrapper(str(file_path) + "_records.sqlite", method, compress),
@@ -142,11 +147,14 @@ class FileDB:
             protein_id_to_isoform = _Wrapper(str(file_path) + "_protein_id_to_isoform.sqlite", method, compress),
             isoform_to_duplicates = _Wrapper(str(file_path) + "_isoform_to_duplicates.sqlite", method, compress),
             file_path = file_path,
+            interval_index = _Wrapper(interval_index_path, method, compress) if method != "r" or os.path.exists(interval_index_path) else None,
         )
 
     def commit(self): 
         self.protein_id_to_isoform.commit()
         self.isoform_to_duplicates.commit()
+        if self.interval_index is not None:
+            self.interval_index.commit()
 
         self.files.commit()
         self.records.commit()
@@ -163,6 +171,12 @@ class FileDB:
             self.protein_id_to_isoform.add_mem(iso.protein_id, iso.uuid)
             self.isoform_to_duplicates.add_mem(iso.uuid, iso.uuid)
 
+    def overlapping(self, record_uuid: uuid.UUID, start: int, end: int, strand: Optional[int] = None, kind: Optional[str] = None) -> List[uuid.UUID]:
+        record_index = self.interval_index.get(record_uuid) if self.interval_index is not None else None
+        if record_index is None:
+            return []
+        return record_index.overlapping(start, end, strand, kind)
+
 
 def add_db_part(file_db: FileDB, db: DBPart):
     for key, v in get_isoform_to_duplicates(db).items():
@@ -187,6 +201,11 @@ def add_db_part(file_db: FileDB, db: DBPart):
     for key, v in db.genes.items():
         file_db.genes[key] = v
 
+    if file_db.interval_index is not None:
+        part_index = db.interval_index if getattr(db, "interval_index", None) is not None else interval_index.build(db)
+        for key, v in part_index.items():
+            file_db.interval_index[key] = v
+
 
 def compress(file_db_old: FileDB, dst_path: Path):
     file_db = FileDB.create(dst_path, "w", compress=True)
@@ -219,6 +238,11 @@ def compress(file_db_old: FileDB, dst_path: Path):
         file_db.genes[k] = v
     file_db.commit()
 
+    if file_db_old.interval_index is not None:
+        for k, v in tqdm(file_db_old.interval_index.items()):
+            file_db.interval_index[k] = v
+        file_db.commit()
+
 def make_df(file_db: FileDB) -> pd.DataFrame:
     files = []
     for r in tqdm(file_db.files.values()):
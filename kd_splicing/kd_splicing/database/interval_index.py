@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from kd_splicing.database.models import DB, DBPart
+from kd_splicing.location.models import Location
+
+GENE = 0
+RNA = 1
+ISOFORM = 2
+
+_KINDS = {"gene": GENE, "rna": RNA, "isoform": ISOFORM}
+
+
+@dataclass
+class RecordIndex:
+    starts: np.ndarray
+    ends: np.ndarray
+    max_ends: np.ndarray
+    strands: np.ndarray
+    kinds: np.ndarray
+    uuids: List[uuid.UUID]
+
+    def __len__(self) -> int:
+        return len(self.uuids)
+
+    def overlapping(self, start: int, end: int, strand: Optional[int] = None, kind: Optional[str] = None) -> List[uuid.UUID]:
+        lo = int(np.searchsorted(self.max_ends, start, side="right"))
+        hi = int(np.searchsorted(self.starts, end, side="left"))
+        if lo >= hi:
+            return []
+        mask = self.ends[lo:hi] > start
+        if strand is not None:
+            mask &= self.strands[lo:hi] == strand
+        if kind is not None:
+            mask &= self.kinds[lo:hi] == _KINDS[kind]
+        return [self.uuids[lo + i] for i in np.flatnonzero(mask).tolist()]
+
+
+def _extent(loc: Location) -> Optional[Tuple[int, int, int]]:
+    if not loc.parts:
+        return None
+    strand = loc.parts[0].strand
+    return (
+        min(p.start for p in loc.parts),
+        max(p.end for p in loc.parts),
+        0 if strand is None else strand,
+    )
+
+
+def build_record_index(items: Iterable[Tuple[int, uuid.UUID, Location]]) -> RecordIndex:
+    rows = []
+    for kind, item_uuid, loc in items:
+        extent = _extent(loc)
+        if extent is None:
+            continue
+        rows.append((extent[0], extent[1], extent[2], kind, item_uuid))
+    rows.sort(key=lambda r: (r[0], r[1]))
+    ends = np.array([r[1] for r in rows], dtype=np.int64)
+    return RecordIndex(
+        starts=np.array([r[0] for r in rows], dtype=np.int64),
+        ends=ends,
+        max_ends=np.maximum.accumulate(ends) if len(ends) else ends,
+        strands=np.array([r[2] for r in rows], dtype=np.int8),
+        kinds=np.array([r[3] for r in rows], dtype=np.int8),
+        uuids=[r[4] for r in rows],
+    )
+
+
+def build(db: Union[DB, DBPart]) -> Dict[uuid.UUID, RecordIndex]:
+    record_to_items: Dict[uuid.UUID, List[Tuple[int, uuid.UUID, Location]]] = defaultdict(list)
+    for gene in db.genes.values():
+        record_to_items[gene.record_uuid].append((GENE, gene.uuid, gene.location))
+    for rna in db.rnas.values():
+        gene = db.genes.get(rna.gene_uuid)
+        if gene is not None:
+            record_to_items[gene.record_uuid].append((RNA, rna.uuid, rna.location))
+    for iso in db.isoforms.values():
+        gene = db.genes.get(iso.gene_uuid)
+        if gene is not None:
+            record_to_items[gene.record_uuid].append((ISOFORM, iso.uuid, iso.location))
+    return {
+        record_uuid: build_record_index(items)
+        for record_uuid, items in record_to_items.items()
+    }
+
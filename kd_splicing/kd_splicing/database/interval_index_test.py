@@ -0,0 +1,23 @@
+import unittest
+import uuid
+
+from kd_splicing.database.interval_index import GENE, ISOFORM, build_record_index
+from kd_splicing.location.models import Location, LocationPart
+
+
+class IntervalIndexTestCase(unittest.TestCase):
+    def test_overlapping(self) -> None:
+        ids = [uuid.UUID(int=i) for i in range(4)]
+        index = build_record_index([
+            (GENE, ids[0], Location([LocationPart(0, 100, 1)])),
+            (GENE, ids[1], Location([LocationPart(10, 20, -1)])),
+            (ISOFORM, ids[2], Location([LocationPart(30, 40, 1), LocationPart(60, 70, 1)])),
+            (GENE, ids[3], Location([LocationPart(150, 200, 1)])),
+            (GENE, uuid.uuid4(), Location()),
+        ])
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.overlapping(15, 35), ids[:3])
+        self.assertEqual(index.overlapping(15, 35, strand=1), [ids[0], ids[2]])
+        self.assertEqual(index.overlapping(15, 35, kind="gene"), ids[:2])
+        self.assertEqual(index.overlapping(100, 150), [])
+        self.assertEqual(index.overlapping(99, 151), [ids[0], ids[3]])
@@ -4,12 +4,15 @@ from Bio.Seq import MutableSeq, Seq, reverse_complement
 
 from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import Optional, List, Dict, Mapping
+from typing import TYPE_CHECKING, Optional, List, Dict, Mapping
 
 import uuid
 from kd_splicing.location.models import Location
 from kd_common import logutil
 
+if TYPE_CHECKING:
+    from kd_splicing.database.interval_index import RecordIndex
+
 _logger = logutil.get_logger(__name__)
 
 
@@ -94,4 +97,10 @@ class DB:
 
     protein_id_to_isoform: Optional[Mapping[str, uuid.UUID]] = None
     isoform_to_duplicates: Optional[Mapping[uuid.UUID, List[uuid.UUID]]] = None
+    interval_index: Optional[Mapping[uuid.UUID, RecordIndex]] = None
 
+    def overlapping(self, record_uuid: uuid.UUID, start: int, end: int, strand: Optional[int] = None, kind: Optional[str] = None) -> List[uuid.UUID]:
+        record_index = self.interval_index.get(record_uuid) if self.interval_index is not None else None
+        if record_index is None:
+            return []
+        return record_index.overlapping(start, end, strand, kind)
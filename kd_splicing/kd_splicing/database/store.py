@@ -5,10 +5,9 @@ import pickle
 import sys
 import uuid
 from collections import Counter, defaultdict
-from copy import copy, deepcopy
 from typing import Any, Dict, List, Mapping, Optional, Set, Tuple, Callable, Union
 from dataclasses import dataclass, field
-from kd_splicing.database import feature_tables
+from kd_splicing.database import feature_tables, interval_index
 from pathlib import Path
 
 import pandas as pd
@@ -17,8 +16,7 @@ from tqdm import tqdm
 from kd_common import funcutil, logutil, pathutil
 from kd_splicing import ct
 from kd_splicing.database.models import DB, DBPart, Gene, Isoform, Location, RNA
-from kd_splicing.location.models import LocationEvent, LocationPart
-from kd_splicing.location.utils import bounding_box, intersection, is_equal, symmetric_difference
+from kd_splicing.location.utils import is_equal
 
 _logger = logutil.get_logger(__name__)
 
@@ -47,6 +45,10 @@ def add_part(db: DB, part: DBPart) -> None:
     db.genes.update(part.genes)
     db.isoforms.update(part.isoforms)
     db.rnas.update(part.rnas)
+    if getattr(part, "interval_index", None) is not None:
+        if db.interval_index is None:
+            db.interval_index = {}
+        db.interval_index.update(part.interval_index)
 
 def merge_files(db_parts_files: List[str]) -> DB:
     db = DB()
@@ -55,6 +57,7 @@ def merge_files(db_parts_files: List[str]) -> DB:
         if len(db_part.isoforms) == 0: continue
         add_part(db, db_part)
         del db_part
+    db.interval_index = interval_index.build(db)
     return db
 
 def merge(db_parts_folders: List[str]) -> DB:
@@ -188,6 +191,7 @@ def merge_separatly(
             merge_genes(part, genbank_to_refseq)
             
         leave_only_with_splicing(part)
+        part.interval_index = interval_index.build(part)
         add_part_method(db, part)
 
         del part
@@ -223,78 +227,32 @@ def get_genbank_to_refseq_files(reports_files: List[str]) -> Mapping[str, str]:
     return genbank_to_refseq
 
 
-def _extract_locations(genes: List[Gene], name: str) -> List[Location]:
-    locs = []
-    for g in genes:
-        loc = Location()
-        for p in g.location.parts:
-            loc.parts.append(LocationPart(
-                start=p.start,
-                end=p.end,
-                strand=p.strand,
-                data={name: {g.uuid}},
-            ))
-        locs.append(loc)
-    return locs
-
-def _split_locations_by_strand(locs: List[Location]) -> Tuple[List[Location], List[Location]]:
-    straight = []
-    inverse = []
-    for loc in locs:
-        if not loc.parts:
-            continue
-        if loc.parts[0].strand == 1:
-            straight.append(loc)
-        else:
-            inverse.append(loc)
-
-    return straight, inverse
-
-
-def _intersect(first_locs: List[Location], second_locs: List[Location]) -> List[LocationPart]:
-    first_parts = [p for l in first_locs for p in l.parts]
-    second_parts = [p for l in second_locs for p in l.parts]
-    parts = first_parts + second_parts
-    events = []
-    for part in parts:
-        events.append(LocationEvent(
-            pos=part.start,
-            start=True,
-            data=part.data,
-        ))
-        events.append(LocationEvent(
-            pos=part.end,
-            start=False,
-            data=part.data,
-        ))
-    events.sort()
-
-    pos = 0
-    data: Dict[str, Set[str]] = defaultdict(set)
-    result = []
-    for e in events:
-        if len(data) >= 2 and e.pos > pos:
-            result.append(LocationPart(
-                start=pos,
-                end=e.pos,
-                strand=None,
-                data=deepcopy(data),
-            ))
-
-        if e.start:
-            for key, value in e.data.items():
-                data[key] |= value
+def _covered(loc: Location) -> List[Tuple[int, int]]:
+    result: List[Tuple[int, int]] = []
+    for start, end in sorted((p.start, p.end) for p in loc.parts):
+        if result and start <= result[-1][1]:
+            if end > result[-1][1]:
+                result[-1] = (result[-1][0], end)
         else:
-            for key, value in e.data.items():
-                data[key] -= value
-                if not data[key]:
-                    del data[key]
-        if data:
-            pos = e.pos
-
+            result.append((start, end))
     return result
 
+def _intersection_length(a: Location, b: Location) -> int:
+    a_parts = _covered(a)
+    b_parts = _covered(b)
+    i = j = 0
+    length = 0
+    while i < len(a_parts) and j < len(b_parts):
+        length += max(0, min(a_parts[i][1], b_parts[j][1]) - max(a_parts[i][0], b_parts[j][0]))
+        if a_parts[i][1] < b_parts[j][1]:
+            i += 1
+        else:
+            j += 1
+    return length
+
 def merge_genes(db: DB, genbank_to_refseq: Mapping[str, str]) -> None:
+    if db.interval_index is None:
+        db.interval_index = interval_index.build(db)
     no_appropriate_refseq = 0
     multiple_record_ids_for_single_sequence_id = 0
     absent_refseq_record = 0
@@ -338,20 +296,21 @@ def merge_genes(db: DB, genbank_to_refseq: Mapping[str, str]) -> None:
             continue
 
         refseq_record = db.records[refseq_record_id]
-        genbank_locs = _extract_locations(
-                record_id_to_genes[genbank_record.uuid], "genbank_uuid")
-        refseq_locs = _extract_locations(
-                record_id_to_genes[refseq_record.uuid], "refseq_uuid")
-        genbank_straight, genbank_inverse = _split_locations_by_strand(genbank_locs)
-        refseq_straight, refseq_inverse = _split_locations_by_strand(refseq_locs)
-
-        intersected = _intersect(genbank_straight, refseq_straight) + _intersect(genbank_inverse, refseq_inverse)
-        gene_pair_to_intersected: Dict[Tuple[uuid.UUID, uuid.UUID], int] = defaultdict(int)
-        for p in intersected:
-            for refseq_uuid in p.data.get("refseq_uuid", {}):
-                for genbank_uuid in p.data.get("genbank_uuid", {}):
-                    gene_pair_to_intersected[(genbank_uuid, refseq_uuid)] += p.length()
-        
+        gene_pair_to_intersected: Dict[Tuple[uuid.UUID, uuid.UUID], int] = {}
+        for genbank_gene in record_id_to_genes[genbank_record.uuid]:
+            if not genbank_gene.location.parts:
+                continue
+            straight = genbank_gene.location.parts[0].strand == 1
+            start = min(p.start for p in genbank_gene.location.parts)
+            end = max(p.end for p in genbank_gene.location.parts)
+            for refseq_gene_uuid in db.overlapping(refseq_record.uuid, start, end, kind="gene"):
+                refseq_gene = db.genes[refseq_gene_uuid]
+                if (refseq_gene.location.parts[0].strand == 1) != straight:
+                    continue
+                intersection_length = _intersection_length(genbank_gene.location, refseq_gene.location)
+                if intersection_length > 0:
+                    gene_pair_to_intersected[(genbank_gene.uuid, refseq_gene_uuid)] = intersection_length
+
         for gene_pair, intersection_length in gene_pair_to_intersected.items():
             genbank_gene_uuid, refseq_gene_uuid = gene_pair
             genbank_gene = db.genes[genbank_gene_uuid]
@@ -380,6 +339,8 @@ def read(store_path: str) -> DB:
         db = pickle.load(f)
         db.protein_id_to_isoform = {i.protein_id: i.uuid for i in db.isoforms.values()}
         db.isoform_to_duplicates = get_isoform_to_duplicates(db)
+        if db.interval_index is None:
+            db.interval_index = interval_index.build(db)
         return db
 
 def leave_only_with_splicing(db: DB) -> None:
@@ -2,7 +2,7 @@
 import re
 from collections import defaultdict
 from os.path import join
-from typing import List, Optional, Dict, Mapping
+from typing import Any, List, Optional, Dict, Mapping, Tuple
 import uuid
 import shutil
 
@@ -14,84 +14,110 @@ from kd_splicing import as_type, ct, database
 from kd_splicing.models import FormattedResults, FormattedResultsItem, FormattedResultsQuery, IsoformTuple, Match
 
 
-def dump(db: database.models.DB,  launch_folder: str, matches: List[Match], isoforms_to_duplicates: Optional[Mapping[uuid.UUID, List[uuid.UUID]]] = None):
+def _hit_organism(db: database.models.DB, m: Match) -> str:
+    hit_iso_a = db.isoforms[m.hit_isoforms.a]
+    hit_gene = db.genes[hit_iso_a.gene_uuid]
+    return db.records[hit_gene.record_uuid].organism
+
+
+def _group_by_organism(db: database.models.DB, query_matches: List[Match]) -> Tuple[List[Match], Dict[str, List[Match]]]:
+    organism_to_best_match: Dict[str, Match] = {}
+    organism_to_matches: Dict[str, List[Match]] = defaultdict(list)
+    for m in query_matches:
+        organism = _hit_organism(db, m)
+        best_match = organism_to_best_match.get(organism)
+        organism_to_matches[organism].append(m)
+        if not best_match or best_match.predicted_positive_probability < m.predicted_positive_probability:
+            organism_to_best_match[organism] = m
+    best_matches = sorted(organism_to_best_match.values(), key=lambda m: (m.predicted_positive, m.predicted_positive_probability), reverse=True)
+    return best_matches, organism_to_matches
+
+
+def _score_row(db: database.models.DB, m: Match, isoforms_to_duplicates: Optional[Mapping[uuid.UUID, List[uuid.UUID]]]) -> Dict[str, Any]:
+    hit_iso_a = db.isoforms[m.hit_isoforms.a]
+    hit_iso_b = db.isoforms[m.hit_isoforms.b]
+    hit_gene = db.genes[hit_iso_a.gene_uuid]
+    hit_record = db.records[hit_gene.record_uuid]
+
+    query_iso_a = db.isoforms[m.query_isoforms.a]
+    query_iso_b = db.isoforms[m.query_isoforms.b]
+    query_gene = db.genes[query_iso_a.gene_uuid]
+
+    row = {
+        "query_isoforms": m.query_isoforms,
+        "hit_isoforms": m.hit_isoforms,
+        "query_protein_ids": f"{query_iso_a.protein_id}, {query_iso_b.protein_id}",
+        "query_product": query_iso_a.product,
+        "query_gene": query_gene.gene_id,
+        "query_db_xref": query_gene.db_xref,
+        
+
+        "isoform_blast_score": m.isoform_blast_score,
+        "splicing_difference": m.splicing_difference,
+        "splicing_similarity": m.splicing_similarity,
+        "splicing_dissimilarity": m.splicing_dissimilarity,
+
+        "hit_organism": hit_record.organism,
+        "hit_locus_tag": hit_gene.locus_tag,
+        "hit_protein_ids": f"{hit_iso_a.protein_id}, {hit_iso_b.protein_id}",
+        "hit_gene": hit_gene.gene_id,
+        "hit_gene_db_xref": hit_gene.db_xref,
+        "hit_product": hit_iso_a.product,
+        
+        "query_locus_tag": query_gene.locus_tag,
+        "positive": m.positive,
+        "predicted_positive": m.predicted_positive,
+        "predicted_positive_probability": m.predicted_positive_probability,
+    }
+    if isoforms_to_duplicates:
+        row.update({
+            "query_as_types": as_type.get_isoforms_as_types(db, isoforms_to_duplicates, query_iso_a.uuid, query_iso_b.uuid),
+            "hit_as_types": as_type.get_isoforms_as_types(db, isoforms_to_duplicates, hit_iso_a.uuid, hit_iso_b.uuid),
+        })
+    return row
+
+
+class DumpWriter:
+    def __init__(self, db: database.models.DB, launch_folder: str, isoforms_to_duplicates: Optional[Mapping[uuid.UUID, List[uuid.UUID]]] = None) -> None:
+        self.db = db
+        self.launch_folder = launch_folder
+        self.isoforms_to_duplicates = isoforms_to_duplicates
+        self.rows: List[Dict[str, Any]] = []
+        pathutil.create_folder(launch_folder, "fasta")
+        self.results_folder = pathutil.create_folder(launch_folder, "results", "best_hit_in_a_species")
+        self.results_full_folder = pathutil.create_folder(launch_folder, "results", "all_hits_in_a_species")
+
+    def add(self, query_isoforms: IsoformTuple, query_matches: List[Match]) -> None:
+        best_matches, organism_to_matches = _group_by_organism(self.db, query_matches)
+        self.rows.extend(_score_row(self.db, m, self.isoforms_to_duplicates) for m in best_matches)
+        _write_query_fasta(
+            self.db,
+            self.results_folder,
+            self.results_full_folder,
+            query_isoforms,
+            best_matches,
+            organism_to_matches,
+            self.isoforms_to_duplicates,
+        )
+
+    def close(self) -> None:
+        dump_scores(pd.DataFrame(self.rows), self.launch_folder)
+        shutil.make_archive(join(self.launch_folder, "results"), 'zip', join(self.launch_folder, "results"))
+
+
+def _group_by_query(matches: List[Match]) -> Dict[IsoformTuple, List[Match]]:
     query_isoforms_to_matches: Dict[IsoformTuple,
                                     List[Match]] = defaultdict(list)
     for m in matches:
         query_isoforms_to_matches[m.query_isoforms].append(m)
+    return query_isoforms_to_matches
 
-    results_folder = pathutil.create_folder(launch_folder, "fasta")
-    filtered = []
-    for query_isoforms, query_matches in query_isoforms_to_matches.items():
-        organism_to_best_match: Dict[str, Match] = {}
-        for m in query_matches:
-            hit_iso_a = db.isoforms[m.hit_isoforms.a]
-            hit_iso_b = db.isoforms[m.hit_isoforms.b]
-            hit_gene = db.genes[hit_iso_a.gene_uuid]
-            hit_record = db.records[hit_gene.record_uuid]
-            best_match = organism_to_best_match.get(hit_record.organism)
-            if not best_match or best_match.predicted_positive_probability < m.predicted_positive_probability:
-                organism_to_best_match[hit_record.organism] = m
-        
-        additional = []
-        for m in query_matches:
-            hit_iso_a = db.isoforms[m.hit_isoforms.a]
-            hit_iso_b = db.isoforms[m.hit_isoforms.b]
-            # if hit_iso_a.protein_id == "XP_009591645.1" and hit_iso_b.protein_id == "XP_018623801.1":
-            #     additional.append(m)
-        best_matches = additional + sorted(organism_to_best_match.values(), key=lambda m: (m.predicted_positive, m.predicted_positive_probability), reverse=True)
-        filtered.extend(best_matches)
-    
 
-    data = []
-    for m in filtered:
-        hit_iso_a = db.isoforms[m.hit_isoforms.a]
-        hit_iso_b = db.isoforms[m.hit_isoforms.b]
-        hit_gene = db.genes[hit_iso_a.gene_uuid]
-        hit_record = db.records[hit_gene.record_uuid]
-
-        query_iso_a = db.isoforms[m.query_isoforms.a]
-        query_iso_b = db.isoforms[m.query_isoforms.b]
-        query_gene = db.genes[query_iso_a.gene_uuid]
-        query_record = db.records[query_gene.record_uuid]
-
-        row = {
-            "query_isoforms": m.query_isoforms,
-            "hit_isoforms": m.hit_isoforms,
-            "query_protein_ids": f"{query_iso_a.protein_id}, {query_iso_b.protein_id}",
-            "query_product": query_iso_a.product,
-            "query_gene": query_gene.gene_id,
-            "query_db_xref": query_gene.db_xref,
-            
-
-            "isoform_blast_score": m.isoform_blast_score,
-            "splicing_difference": m.splicing_difference,
-            "splicing_similarity": m.splicing_similarity,
-            "splicing_dissimilarity": m.splicing_dissimilarity,
-
-            "hit_organism": hit_record.organism,
-            "hit_locus_tag": hit_gene.locus_tag,
-            "hit_protein_ids": f"{hit_iso_a.protein_id}, {hit_iso_b.protein_id}",
-            "hit_gene": hit_gene.gene_id,
-            "hit_gene_db_xref": hit_gene.db_xref,
-            "hit_product": hit_iso_a.product,
-            
-            "query_locus_tag": query_gene.locus_tag,
-            "positive": m.positive,
-            "predicted_positive": m.predicted_positive,
-            "predicted_positive_probability": m.predicted_positive_probability,
-        }
-        if isoforms_to_duplicates:
-            row.update({
-                "query_as_types": as_type.get_isoforms_as_types(db, isoforms_to_duplicates, query_iso_a.uuid, query_iso_b.uuid),
-                "hit_as_types": as_type.get_isoforms_as_types(db, isoforms_to_duplicates, hit_iso_a.uuid, hit_iso_b.uuid),
-            })
-        data.append(row)
-        
-    df = pd.DataFrame(data)
-    dump_scores(df, launch_folder)
-    dump_to_fasta(db, launch_folder, matches, isoforms_to_duplicates)
-    shutil.make_archive(join(launch_folder, "results"), 'zip', join(launch_folder, "results"))
+def dump(db: database.models.DB,  launch_folder: str, matches: List[Match], isoforms_to_duplicates: Optional[Mapping[uuid.UUID, List[uuid.UUID]]] = None):
+    writer = DumpWriter(db, launch_folder, isoforms_to_duplicates)
+    for query_isoforms, query_matches in _group_by_query(matches).items():
+        writer.add(query_isoforms, query_matches)
+    writer.close()
 
 
 def dump_scores(df: pd.DataFrame, launch_folder: str) -> None:
@@ -142,81 +168,98 @@ def _clean_file_name(s: str) -> str:
 
 
 def dump_to_fasta(db: database.models.DB, launch_folder: str, matches: List[Match], isoforms_to_duplicates: Optional[Mapping[uuid.UUID, List[uuid.UUID]]] = None) -> None:
-    query_isoforms_to_matches: Dict[IsoformTuple,
-                                    List[Match]] = defaultdict(list)
-    for m in matches:
-        query_isoforms_to_matches[m.query_isoforms].append(m)
-
     results_folder = pathutil.create_folder(launch_folder, "results", "best_hit_in_a_species")
     results_full_folder = pathutil.create_folder(launch_folder, "results", "all_hits_in_a_species")
-    for query_isoforms, query_matches in query_isoforms_to_matches.items():
-        organism_to_best_match: Dict[str, Match] = {}
-        organism_to_matches: Dict[str, List[Match]] = defaultdict(list)
-        for m in query_matches:
+    for query_isoforms, query_matches in _group_by_query(matches).items():
+        best_matches, organism_to_matches = _group_by_organism(db, query_matches)
+        _write_query_fasta(db, results_folder, results_full_folder, query_isoforms, best_matches, organism_to_matches, isoforms_to_duplicates)
+
+
+def _write_query_fasta(
+    db: database.models.DB,
+    results_folder: str,
+    results_full_folder: str,
+    query_isoforms: IsoformTuple,
+    best_matches: List[Match],
+    organism_to_matches: Dict[str, List[Match]],
+    isoforms_to_duplicates: Optional[Mapping[uuid.UUID, List[uuid.UUID]]] = None,
+) -> None:
+    for organism, matches in organism_to_matches.items():
+        matches = sorted(matches, key=lambda m: (m.predicted_positive, m.predicted_positive_probability), reverse=True)
+        filtered_matches = [m for m in matches if m.predicted_positive_probability > 0.0001]
+        if len(filtered_matches) < 10:
+            organism_to_matches[organism] = filtered_matches
+        else:
+            organism_to_matches[organism] = filtered_matches
+
+    query_iso_a = db.isoforms[query_isoforms.a]
+    query_iso_b = db.isoforms[query_isoforms.b]
+    query_gene = db.genes[query_iso_a.gene_uuid]
+    query_record = db.records[query_gene.record_uuid]
+
+    filename = query_gene.gene_id
+    if filename is None or filename.startswith("GeneID"):
+        filename = query_gene.locus_tag
+    if filename is None:
+        filename = query_gene.db_xref
+    if filename is None:
+        filename = ""
+    filename += f"_{query_iso_a.protein_id}, {query_iso_b.protein_id}"
+    filename = _clean_file_name(filename)
+    file_path = join(results_folder, filename + ".fasta")
+
+    with open(file_path, "w") as f:
+        
+        name = f"{query_record.organism}_{query_gene.locus_tag}_{query_iso_a.protein_id}"
+        if isoforms_to_duplicates:
+            query_as_types = as_type.get_isoforms_as_types(db, isoforms_to_duplicates, query_iso_a.uuid, query_iso_b.uuid)
+            name += "_" + "|".join(";".join(".".join(j) for j in i) for i in query_as_types)
+        f.write(f">{name}\n")
+        f.write(f"{query_iso_a.translation}\n")
+
+        name = f"{query_record.organism}_{query_gene.locus_tag}_{query_iso_b.protein_id}"
+        f.write(f">{name}\n")
+        f.write(f"{query_iso_b.translation}\n")
+
+        for m in best_matches:
+            if m.hit_organism == query_record.organism: continue
+
             hit_iso_a = db.isoforms[m.hit_isoforms.a]
             hit_iso_b = db.isoforms[m.hit_isoforms.b]
             hit_gene = db.genes[hit_iso_a.gene_uuid]
             hit_record = db.records[hit_gene.record_uuid]
-            best_match = organism_to_best_match.get(hit_record.organism)
-            organism_to_matches[hit_record.organism].append(m)
-            if not best_match or best_match.predicted_positive_probability < m.predicted_positive_probability:
-                organism_to_best_match[hit_record.organism] = m
-        
-        additional = []
-        # for m in query_matches:
-        #     hit_iso_a = db.isoforms[m.hit_isoforms.a]
-        #     hit_iso_b = db.isoforms[m.hit_isoforms.b]
-        #     if hit_iso_a.protein_id == "XP_009591645.1" and hit_iso_b.protein_id == "XP_018623801.1":
-        #         additional.append(m)
-        best_matches :List[Match] = additional + sorted(organism_to_best_match.values(), key=lambda m: (m.predicted_positive, m.predicted_positive_probability), reverse=True)
-        for organism, matches in organism_to_matches.items():
-            matches = sorted(matches, key=lambda m: (m.predicted_positive, m.predicted_positive_probability), reverse=True)
-            filtered_matches = [m for m in matches if m.predicted_positive_probability > 0.0001]
-            if len(filtered_matches) < 10:
-                organism_to_matches[organism] = filtered_matches
-            else:
-                organism_to_matches[organism] = filtered_matches
-
-        query_iso_a = db.isoforms[query_isoforms.a]
-        query_iso_b = db.isoforms[query_isoforms.b]
-        query_gene = db.genes[query_iso_a.gene_uuid]
-        query_record = db.records[query_gene.record_uuid]
-
-        filename = query_gene.gene_id
-        if filename is None or filename.startswith("GeneID"):
-            filename = query_gene.locus_tag
-        if filename is None:
-            filename = query_gene.db_xref
-        if filename is None:
-            filename = ""
-        filename += f"_{query_iso_a.protein_id}, {query_iso_b.protein_id}"
-        filename = _clean_file_name(filename)
-        file_path = join(results_folder, filename + ".fasta")
-
-        with open(file_path, "w") as f:
+            locus_tag = hit_gene.locus_tag if hit_gene.locus_tag else hit_gene.gene_id
+
             
-            name = f"{query_record.organism}_{query_gene.locus_tag}_{query_iso_a.protein_id}"
+
+            name = f"{m.predicted_positive_probability:.4f}_{hit_record.organism}_{locus_tag}_{hit_iso_a.product}_{hit_iso_a.protein_id}"
             if isoforms_to_duplicates:
-                query_as_types = as_type.get_isoforms_as_types(db, isoforms_to_duplicates, query_iso_a.uuid, query_iso_b.uuid)
-                name += "_" + "|".join(";".join(".".join(j) for j in i) for i in query_as_types)
+                hit_as_types = as_type.get_isoforms_as_types(db, isoforms_to_duplicates, hit_iso_a.uuid, hit_iso_b.uuid)
+                name += "_" + "|".join(";".join(".".join(j) for j in i) for i in hit_as_types)
             f.write(f">{name}\n")
-            f.write(f"{query_iso_a.translation}\n")
+            f.write(f"{hit_iso_a.translation}\n")
 
-            name = f"{query_record.organism}_{query_gene.locus_tag}_{query_iso_b.protein_id}"
+            name = f"{m.predicted_positive_probability:.4f}_{hit_record.organism}_{locus_tag}_{hit_iso_b.product}_{hit_iso_b.protein_id}"
             f.write(f">{name}\n")
-            f.write(f"{query_iso_b.translation}\n")
+            f.write(f"{hit_iso_b.translation}\n")
+    
+    with open(join(results_full_folder, filename + ".fasta"), "w") as f:
+        name = f"{query_record.organism}_{query_gene.locus_tag}_{query_iso_a.protein_id}"
+        f.write(f">{name}\n")
+        f.write(f"{query_iso_a.translation}\n")
 
-            for m in best_matches:
-                if m.hit_organism == query_record.organism: continue
+        name = f"{query_record.organism}_{query_gene.locus_tag}_{query_iso_b.protein_id}"
+        f.write(f">{name}\n")
+        f.write(f"{query_iso_b.translation}\n")
 
+        for best_m  in best_matches:
+            for m in organism_to_matches[best_m.hit_organism]:
                 hit_iso_a = db.isoforms[m.hit_isoforms.a]
                 hit_iso_b = db.isoforms[m.hit_isoforms.b]
                 hit_gene = db.genes[hit_iso_a.gene_uuid]
                 hit_record = db.records[hit_gene.record_uuid]
                 locus_tag = hit_gene.locus_tag if hit_gene.locus_tag else hit_gene.gene_id
 
-                
-
                 name = f"{m.predicted_positive_probability:.4f}_{hit_record.organism}_{locus_tag}_{hit_iso_a.product}_{hit_iso_a.protein_id}"
                 if isoforms_to_duplicates:
                     hit_as_types = as_type.get_isoforms_as_types(db, isoforms_to_duplicates, hit_iso_a.uuid, hit_iso_b.uuid)
@@ -224,34 +267,6 @@ def dump_to_fasta(db: database.models.DB, launch_folder: str, matches: List[Matc
                 f.write(f">{name}\n")
                 f.write(f"{hit_iso_a.translation}\n")
 
-                name = f"{m.predicted_positive_probability:.4f}_{hit_record.organism}_{locus_tag}_{hit_iso_b.product}_{hit_iso_b.protein_id}"
-                f.write(f">{name}\n")
+                name = f"{m.predicted_positive_probability:.4f}_{hit_record.organism}_{locus_tag}_{hit_iso_b.protein_id}"
+                f.write(f">{hit_record.organism}_{locus_tag}_{hit_iso_b.protein_id}\n")
                 f.write(f"{hit_iso_b.translation}\n")
-        
-        with open(join(results_full_folder, filename + ".fasta"), "w") as f:
-            name = f"{query_record.organism}_{query_gene.locus_tag}_{query_iso_a.protein_id}"
-            f.write(f">{name}\n")
-            f.write(f"{query_iso_a.translation}\n")
-
-            name = f"{query_record.organism}_{query_gene.locus_tag}_{query_iso_b.protein_id}"
-            f.write(f">{name}\n")
-            f.write(f"{query_iso_b.translation}\n")
-
-            for best_m  in best_matches:
-                for m in organism_to_matches[best_m.hit_organism]:
-                    hit_iso_a = db.isoforms[m.hit_isoforms.a]
-                    hit_iso_b = db.isoforms[m.hit_isoforms.b]
-                    hit_gene = db.genes[hit_iso_a.gene_uuid]
-                    hit_record = db.records[hit_gene.record_uuid]
-                    locus_tag = hit_gene.locus_tag if hit_gene.locus_tag else hit_gene.gene_id
-
-                    name = f"{m.predicted_positive_probability:.4f}_{hit_record.organism}_{locus_tag}_{hit_iso_a.product}_{hit_iso_a.protein_id}"
-                    if isoforms_to_duplicates:
-                        hit_as_types = as_type.get_isoforms_as_types(db, isoforms_to_duplicates, hit_iso_a.uuid, hit_iso_b.uuid)
-                        name += "_" + "|".join(";".join(".".join(j) for j in i) for i in hit_as_types)
-                    f.write(f">{name}\n")
-                    f.write(f"{hit_iso_a.translation}\n")
-
-                    name = f"{m.predicted_positive_probability:.4f}_{hit_record.organism}_{locus_tag}_{hit_iso_b.protein_id}"
-                    f.write(f">{hit_record.organism}_{locus_tag}_{hit_iso_b.protein_id}\n")
-                    f.write(f"{hit_iso_b.translation}\n")
@@ -5,3 +5,9 @@ class GeneNotFoundException(Exception):
 
 class CustomException(Exception):
     pass
+
+class BlastException(Exception):
+    pass
+
+class RescoreException(Exception):
+    pass
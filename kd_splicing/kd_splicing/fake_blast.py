@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import random
+import shutil
+from typing import Any, Dict, List, Tuple
+
+from kd_common import logutil, pathutil
+from kd_splicing import blast, blast_members, database
+
+_logger = logutil.get_logger(__name__)
+
+
+def read_fasta(path: str) -> List[Tuple[str, str]]:
+    entries: List[Tuple[str, str]] = []
+    title = None
+    seq: List[str] = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                if title is not None:
+                    entries.append((title, "".join(seq)))
+                title = line[1:].split()[0]
+                seq = []
+            elif line:
+                seq.append(line)
+    if title is not None:
+        entries.append((title, "".join(seq)))
+    return entries
+
+
+def _key(translation: str) -> str:
+    return hashlib.sha1(translation.encode()).hexdigest()
+
+
+def _report(query_title: str, query_len: int, hits: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"BlastOutput2": {"report": {"results": {"search": {
+        "query_title": query_title,
+        "query_len": query_len,
+        "hits": hits,
+    }}}}}
+
+
+def _write_reports(out_path: str, reports: List[Dict[str, Any]]) -> None:
+    for i, report in enumerate(reports):
+        with open(f"{out_path}_{i + 1}.json", "w") as f:
+            json.dump(report, f)
+
+
+def write_db(db: database.models.DB, db_path: str, deduplicate_isoforms: bool = True) -> None:
+    isoforms = list(db.isoforms.values())
+    if deduplicate_isoforms:
+        isoforms = blast._deduplicate_isoforms(isoforms)
+    pathutil.create_folder(os.path.dirname(db_path))
+    with open(db_path, "w") as f:
+        members = blast_members.write_fasta(f, isoforms)
+    blast_members.write(blast_members.members_path(db_path), members)
+
+
+def record(launch_folder: str, corpus_folder: str) -> int:
+    pathutil.create_folder(corpus_folder)
+    title_to_translation = {
+        title: translation
+        for query_file in pathutil.file_list(os.path.join(launch_folder, "blast_queries"), ".fasta")
+        for title, translation in read_fasta(query_file)
+    }
+    recorded = 0
+    results_folder = os.path.join(launch_folder, "blast_results")
+    for group_folder in pathutil.get_sub_directories(results_folder):
+        for result_file in pathutil.file_list(group_folder, ".json"):
+            with open(result_file, "r") as f:
+                query_title = json.load(f)["BlastOutput2"]["report"]["results"]["search"]["query_title"]
+            translation = title_to_translation.get(query_title)
+            if translation is None:
+                continue
+            shutil.copyfile(result_file, os.path.join(corpus_folder, _key(translation) + ".json"))
+            recorded += 1
+    _logger.info(f"Recorded {recorded} BLAST reports into {corpus_folder}")
+    return recorded
+
+
+class RecordedRunner:
+    def __init__(self, corpus_folder: str) -> None:
+        self.corpus_folder = corpus_folder
+
+    def __call__(self, query_path: str, db_path: str, out_path: str, max_target_seqs: int, num_threads: int) -> int:
+        reports = []
+        for title, translation in read_fasta(query_path):
+            path = os.path.join(self.corpus_folder, _key(translation) + ".json")
+            if not os.path.exists(path):
+                reports.append(_report(title, len(translation), []))
+                continue
+            with open(path, "r") as f:
+                report = json.load(f)
+            search = report["BlastOutput2"]["report"]["results"]["search"]
+            search["query_title"] = title
+            search["hits"] = search.get("hits", [])[:max_target_seqs]
+            reports.append(report)
+        _write_reports(out_path, reports)
+        return 0
+
+
+class SyntheticRunner:
+    def __init__(self, hits_per_query: int = 50, seed: int = 0) -> None:
+        self.hits_per_query = hits_per_query
+        self.seed = seed
+        self._subjects: Dict[str, List[Tuple[str, str]]] = {}
+
+    def _db(self, db_path: str) -> List[Tuple[str, str]]:
+        subjects = self._subjects.get(db_path)
+        if subjects is None:
+            subjects = read_fasta(db_path)
+            self._subjects[db_path] = subjects
+        return subjects
+
+    def _hit(self, rng: random.Random, query: str, title: str, subject: str) -> Dict[str, Any]:
+        length = min(len(query), len(subject))
+        query_from = rng.randrange(len(query) - length + 1)
+        hit_from = rng.randrange(len(subject) - length + 1)
+        qseq = query[query_from:query_from + length]
+        hseq = subject[hit_from:hit_from + length]
+        midline = "".join(q if q == h else " " for q, h in zip(qseq, hseq))
+        identity = sum(1 for c in midline if c != " ")
+        return {
+            "description": [{"title": title}],
+            "len": len(subject),
+            "hsps": [{
+                "bit_score": float(identity),
+                "score": identity,
+                "evalue": 0.,
+                "identity": identity,
+                "query_from": query_from + 1,
+                "query_to": query_from + length,
+                "hit_from": hit_from + 1,
+                "hit_to": hit_from + length,
+                "align_len": length,
+                "qseq": qseq,
+                "hseq": hseq,
+                "midline": midline,
+            }],
+        }
+
+    def __call__(self, query_path: str, db_path: str, out_path: str, max_target_seqs: int, num_threads: int) -> int:
+        subjects = self._db(db_path)
+        reports = []
+        for title, translation in read_fasta(query_path):
+            rng = random.Random(f"{self.seed}:{_key(translation)}")
+            count = min(self.hits_per_query, max_target_seqs, len(subjects))
+            hits = [
+                self._hit(rng, translation, *subjects[i])
+                for i in sorted(rng.sample(range(len(subjects)), count))
+            ]
+            hits.sort(key=lambda h: -h["hsps"][0]["bit_score"])
+            reports.append(_report(title, len(translation), hits))
+        _write_reports(out_path, reports)
+        return 0
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+import uuid
+
+from kd_splicing import blast, fake_blast, hitstore
+from kd_splicing.blast_cache import BlastCache
+from kd_splicing.database.models import DB, Isoform
+from kd_splicing.models import Queries
+
+
+def _launch(db: DB, folder: str, db_path: str, runner: blast.BlastRunner) -> hitstore.HitStore:
+    isoforms = sorted(db.isoforms)
+    lengths = {iso: len(db.isoforms[iso].translation) for iso in isoforms}
+    isoform_to_group, isoform_to_idx = blast.assign_groups(isoforms, lengths, 2)
+    blast.create_queires(db, Queries([], isoforms, isoform_to_idx, isoform_to_group), folder)
+    blast.run(folder, db_path, num_groups=2, parallel=False, runner=runner)
+    return hitstore.HitStore(folder)
+
+
+class FakeBlastTestCase(unittest.TestCase):
+    def test_synthetic_and_recorded(self) -> None:
+        translations = ["MKVLAGHTREWQ", "MKVLAGHTRE", "PLKDAYYWCC", "GGHTREWQPL", "MKWWLAGHT"]
+        db = DB(isoforms={uuid.UUID(int=i): Isoform(uuid.UUID(int=i), uuid.UUID(int=1000 + i), None, None, None, t, None, None) for i, t in enumerate(translations)})
+        with tempfile.TemporaryDirectory() as folder:
+            db_path = os.path.join(folder, "blast_db", "db")
+            fake_blast.write_db(db, db_path, deduplicate_isoforms=False)
+
+            launch = os.path.join(folder, "synthetic")
+            store = _launch(db, launch, db_path, fake_blast.SyntheticRunner(hits_per_query=3))
+            self.assertEqual(set(store.query_to_idx), set(db.isoforms))
+            hits = {iso: store.get(iso) for iso in db.isoforms}
+            for iso, iso_hits in hits.items():
+                self.assertEqual(len(iso_hits), 3)
+                for h in iso_hits:
+                    self.assertEqual(h.qseq.decode(), db.isoforms[iso].translation[h.query_from:h.query_to])
+
+            corpus = os.path.join(folder, "corpus")
+            self.assertEqual(fake_blast.record(launch, corpus), len(db.isoforms))
+            replay = _launch(db, os.path.join(folder, "recorded"), db_path, fake_blast.RecordedRunner(corpus))
+            for iso, iso_hits in hits.items():
+                self.assertEqual([h.iso_uuid for h in replay.get(iso)], [h.iso_uuid for h in iso_hits])
+
+    def test_fake_runner_bypasses_cache(self) -> None:
+        db = DB(isoforms={uuid.UUID(int=i): Isoform(uuid.UUID(int=i), uuid.UUID(int=1000 + i), None, None, None, t, None, None) for i, t in enumerate(["MKVLAGHTREWQ", "PLKDAYYWCC"])})
+        with tempfile.TemporaryDirectory() as folder:
+            db_path = os.path.join(folder, "blast_db", "db")
+            fake_blast.write_db(db, db_path, deduplicate_isoforms=False)
+            isoforms = sorted(db.isoforms)
+            queries = Queries([], isoforms, {iso: i for i, iso in enumerate(isoforms)}, {iso: 0 for iso in isoforms})
+            cache = BlastCache(os.path.join(folder, "cache.sqlite"))
+            launch = os.path.join(folder, "launch")
+            blast.run_cached(db, queries, launch, db_path, cache, num_groups=1, parallel=False, runner=fake_blast.SyntheticRunner(hits_per_query=1))
+            self.assertEqual(len(cache), 0)
+            self.assertEqual(set(hitstore.HitStore(launch).query_to_idx), set(db.isoforms))
+            cache.close()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+import os
+import uuid
+from typing import Any, Callable, Dict, List, Mapping, Tuple
+
+import numpy as np
+
+from kd_common import logutil, pathutil
+from kd_splicing.match_store import FEATURES
+from kd_splicing.models import IsoformTuple, Match
+
+_logger = logutil.get_logger(__name__)
+
+_ROW_DTYPE = np.dtype([
+    ("query_a", "V16"),
+    ("query_b", "V16"),
+    ("hit_a", "V16"),
+    ("hit_b", "V16"),
+    *((name, "f8") for name in FEATURES),
+])
+
+
+def store_folder(launch_folder: str) -> str:
+    return os.path.join(launch_folder, "feature_store")
+
+
+def segments_folder(launch_folder: str) -> str:
+    return pathutil.create_folder(store_folder(launch_folder), "segments")
+
+
+def segment_path(launch_folder: str, name: str) -> str:
+    return os.path.join(segments_folder(launch_folder), name)
+
+
+def write_segment(path: str, matches: List[Match]) -> None:
+    rows = np.array([
+        (
+            m.query_isoforms.a.bytes,
+            m.query_isoforms.b.bytes,
+            m.hit_isoforms.a.bytes,
+            m.hit_isoforms.b.bytes,
+            *(getattr(m, name) for name in FEATURES),
+        )
+        for m in matches
+    ], dtype=_ROW_DTYPE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, rows)
+    os.replace(tmp_path, path)
+
+
+def read_segment(path: str) -> np.ndarray:
+    return np.load(path)
+
+
+def to_matches(rows: np.ndarray, hit_organism: Callable[[uuid.UUID], Tuple[str, str]]) -> List[Match]:
+    uuids: Dict[bytes, uuid.UUID] = {}
+
+    def to_uuid(value: bytes) -> uuid.UUID:
+        result = uuids.get(value)
+        if result is None:
+            result = uuids[value] = uuid.UUID(bytes=value)
+        return result
+
+    matches = []
+    for query_a, query_b, hit_a, hit_b, *values in rows.tolist():
+        hit_a_uuid = to_uuid(hit_a)
+        organism, db_name = hit_organism(hit_a_uuid)
+        m = Match(
+            query_isoforms=IsoformTuple(to_uuid(query_a), to_uuid(query_b)),
+            hit_isoforms=IsoformTuple(hit_a_uuid, to_uuid(hit_b)),
+            hit_organism=organism,
+            hit_db_name=db_name,
+        )
+        for name, value in zip(FEATURES, values):
+            setattr(m, name, value)
+        matches.append(m)
+    return matches
+
+
+def write_meta(launch_folder: str, meta: Mapping[str, Any]) -> None:
+    with open(os.path.join(pathutil.create_folder(store_folder(launch_folder)), "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def update_meta(launch_folder: str, **values: Any) -> None:
+    write_meta(launch_folder, {**read_meta(launch_folder), **values})
+
+
+def read_meta(launch_folder: str) -> Dict[str, Any]:
+    path = os.path.join(store_folder(launch_folder), "meta.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+import uuid
+
+from kd_splicing import feature_store
+from kd_splicing.models import IsoformTuple, Match
+
+
+class FeatureStoreTestCase(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        query = IsoformTuple(uuid.uuid4(), uuid.uuid4())
+        hit_a, hit_b = uuid.uuid4(), uuid.uuid4()
+        matches = [
+            Match(
+                query_isoforms=query,
+                hit_isoforms=IsoformTuple(hit_a, hit_b),
+                hit_organism="organism",
+                hit_db_name="refseq",
+                isoform_blast_score=0.1,
+                splicing_difference=0.2,
+                splicing_similarity=0.3,
+                splicing_dissimilarity=0.4,
+            ),
+            Match(query_isoforms=query, hit_isoforms=IsoformTuple(hit_b, hit_a), hit_organism="other", hit_db_name="genbank"),
+        ]
+        organisms = {hit_a: ("organism", "refseq"), hit_b: ("other", "genbank")}
+        with tempfile.TemporaryDirectory() as launch_folder:
+            path = feature_store.segment_path(launch_folder, "batch_0.npy")
+            feature_store.write_segment(path, matches)
+            self.assertEqual(feature_store.to_matches(feature_store.read_segment(path), organisms.__getitem__), matches)
+
+            self.assertEqual(feature_store.read_meta(launch_folder), {})
+            feature_store.write_meta(launch_folder, {"prune": False})
+            self.assertEqual(feature_store.read_meta(launch_folder), {"prune": False})
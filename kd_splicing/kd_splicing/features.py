@@ -1,27 +1,29 @@
 from __future__ import annotations
 
+import hashlib
 import itertools
 import multiprocessing
 import os
 import pickle
-import string
+import time
 import uuid
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from dataclasses import dataclass, field
 from functools import partial
 from itertools import chain
 from multiprocessing import get_context
-from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Any
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple, Any
 from copy import copy
-from Bio.SubsMat import MatrixInfo
 
+import pandas as pd
 from tqdm import tqdm
 
-from kd_common import logutil, pathutil
-from kd_splicing import blast, database, location, ml, models, paths
+from kd_common import logutil, pathutil, profileutil
+from kd_splicing import blast, database, hitstore, location, feature_store, match_store, ml, models, paths, scoring, work_ledger
+from kd_splicing.exception import RescoreException
 from kd_splicing.location.models import ConvertSegment, Location, LocationPart
 from kd_splicing.location.utils import (union, convert_location,
-                                        get_alignment_segments, intersection,
+                                        intersection,
                                         merge, nucleotide_to_amino,
                                         relative_to_alignment,
                                         relative_to_location,
@@ -30,67 +32,13 @@ from kd_splicing.models import IsoformTuple, Match, Queries, SimpleMatch
 
 _logger = logutil.get_logger(__name__)
 
-_SCORE_TABLE = {
-    **{letter: 1 for letter in string.ascii_uppercase},
-    "+": 1,
-}
-
-def _build_matrix() -> Mapping[Tuple[str, str], float]:
-    result: Dict[Tuple[str, str], float] = {}
-    for tup, score in MatrixInfo.blosum30.items():
-        if score < 0:
-            score = 0
-        result[(tup[0], tup[1])] = score
-        result[(tup[1], tup[0])] = score
-    return result
-
-_SCORE_MATRIX = _build_matrix()
-
 def count_all_matches(midline: str) -> float:
-    count = 0.
-    for m in midline:
-        count += _SCORE_TABLE.get(m, 0)
-    return count
+    return scoring.count_all_matches(scoring.midline_prefix(midline))
 
 def count_matches(loc: Location, midline: str) -> float:
-    count = 0.
-    for part in loc.parts:
-        for i in range(part.start, part.end):
-            if i >= 0 and i < len(midline):
-                count += _SCORE_TABLE.get(midline[i], 0)
-    return count
-
-def evaluate_score(loc: Location, seq_a: str, seq_b: str, open_gap: float = 0, extend_gap: float = 0,
-                   penalize_extend_when_opening: bool=False) -> float:
-    openA = False
-    openB = False
-    if penalize_extend_when_opening:
-        open_gap += extend_gap
-    score = .0
-    for part in loc.parts:
-        for i in range(part.start, part.end):
-            if not(i >= 0 and i < len(seq_a)):
-                continue
-            char_a = seq_a[i]
-            char_b = seq_b[i]
-            if char_a !='-' and char_b != '-':
-                openA, openB = False, False
-                score += _SCORE_MATRIX[(char_a, char_b)]
-            elif char_a == '-':
-                if not openA:
-                    score += open_gap
-                    openA = True
-                    openB = False
-                else:
-                    score += extend_gap
-            elif char_b == '-':
-                if not openB:
-                    score += open_gap
-                    openB = True
-                    openA = False
-                else:
-                    score += extend_gap
-    return score
+    return scoring.count_matches(loc, scoring.midline_prefix(midline))
+
+evaluate_score = scoring.evaluate_score
 
 
 def convert_splicing(splicing: Location, loc: Location, translation_len: int) -> Location:
@@ -122,6 +70,8 @@ class CalcQuery:
     iso_b_location: database.models.Location
     iso_b_len: int
     organism: str
+    iso_a_translation: str = ""
+    iso_b_translation: str = ""
 
 
 @dataclass
@@ -129,14 +79,20 @@ class CalcQueriesContext:
     queries: List[CalcQuery]
     iso_to_hits: Mapping[uuid.UUID, List[blast.Hit]]
     q_iso_to_gene: Mapping[uuid.UUID, uuid.UUID]
+    hit_classes: Mapping[uuid.UUID, uuid.UUID] = field(default_factory=dict)
     hit_tuple: Optional[IsoformTuple] = None
     debug: bool = False
+    evaluated: int = 0
+    pruned: int = 0
+    reused: int = 0
+    collapsed: int = 0
 
 
 @dataclass
 class CalcBatch:
     result_path: str
     ctx: CalcQueriesContext
+    features_path: Optional[str] = None
 
 
 def _parallel_results_folder(launch_folder: str) -> str:
@@ -303,6 +259,54 @@ def _calc_splicing_difference_per_event(
 # Calc
 ###############
 
+HitSplicing = Tuple[Location, Location, Location, Location]
+
+
+def isoform_blast_score(hit_a: blast.Hit, hit_b: blast.Hit) -> float:
+    match_score_a = scoring.count_all_matches(hit_a.midline_prefix)
+    match_score_b = scoring.count_all_matches(hit_b.midline_prefix)
+    return (match_score_a + match_score_b) / (hit_a.query_len + hit_b.query_len + hit_a.iso_len + hit_b.iso_len)
+
+
+class HitSplicingCache:
+    def __init__(self, max_size: int = 100_000) -> None:
+        self.max_size = max_size
+        self.items: OrderedDict[Tuple[uuid.UUID, uuid.UUID], HitSplicing] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, hit_a: blast.Hit, hit_b: blast.Hit) -> HitSplicing:
+        key = (hit_a.iso_uuid, hit_b.iso_uuid)
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        global_splicing_a, global_splicing_b = _get_splicing(hit_a.iso_location, hit_b.iso_location)
+        value = (
+            global_splicing_a,
+            global_splicing_b,
+            convert_splicing(global_splicing_a, hit_a.iso_location, hit_a.iso_len),
+            convert_splicing(global_splicing_b, hit_b.iso_location, hit_b.iso_len),
+        )
+        self.items[key] = value
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+        return value
+
+    def stats(self) -> Mapping[str, float]:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self.items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.,
+        }
+
+
+hit_splicing_cache = HitSplicingCache()
+
 
 def calc_single(ctx: CalcMatchContext) -> Match:
     match = Match(
@@ -312,37 +316,37 @@ def calc_single(ctx: CalcMatchContext) -> Match:
         hit_db_name=ctx.hit_a.db_name,
     )
 
-    hit_global_splicing_a, hit_global_splicing_b = _get_splicing(
-        ctx.hit_a.iso_location, ctx.hit_b.iso_location)
-    hit_splicing_a = convert_splicing(
-        hit_global_splicing_a, ctx.hit_a.iso_location, ctx.hit_a.iso_len)
-    hit_splicing_b = convert_splicing(
-        hit_global_splicing_b, ctx.hit_b.iso_location, ctx.hit_b.iso_len)
-
-    aligned_splicing_a = convert_location(
-        ctx.splicing_a, ctx.hit_a.query_segments)
-    aligned_hit_splicing_a = convert_location(
-        hit_splicing_a, ctx.hit_a.hit_segments)
-    aligned_splicing_b = convert_location(
-        ctx.splicing_b, ctx.hit_b.query_segments)
-    aligned_hit_splicing_b = convert_location(
-        hit_splicing_b, ctx.hit_b.hit_segments)
-
-    splicing_intersection_a = intersection(
-        aligned_splicing_a, aligned_hit_splicing_a)
-    splicing_intersection_b = intersection(
-        aligned_splicing_b, aligned_hit_splicing_b)
-    splicing_intersection_a_length = splicing_intersection_a.length()
-    splicing_intersection_b_length = splicing_intersection_b.length()
+    with profileutil.stage("calc_single.hit_splicing"):
+        hit_global_splicing_a, hit_global_splicing_b, hit_splicing_a, hit_splicing_b = hit_splicing_cache.get(
+            ctx.hit_a, ctx.hit_b)
+
+    with profileutil.stage("calc_single.convert_location", items=4):
+        aligned_splicing_a = convert_location(
+            ctx.splicing_a, ctx.hit_a.query_map.segments)
+        aligned_hit_splicing_a = convert_location(
+            hit_splicing_a, ctx.hit_a.hit_map.segments)
+        aligned_splicing_b = convert_location(
+            ctx.splicing_b, ctx.hit_b.query_map.segments)
+        aligned_hit_splicing_b = convert_location(
+            hit_splicing_b, ctx.hit_b.hit_map.segments)
+
+    with profileutil.stage("calc_single.intersection"):
+        splicing_intersection_a = intersection(
+            aligned_splicing_a, aligned_hit_splicing_a)
+        splicing_intersection_b = intersection(
+            aligned_splicing_b, aligned_hit_splicing_b)
+        splicing_intersection_a_length = splicing_intersection_a.length()
+        splicing_intersection_b_length = splicing_intersection_b.length()
 
     ########################
     # Splicing difference
     ########################
 
-    splicing_symmetric_difference_a = symmetric_difference(
-        aligned_splicing_a, aligned_hit_splicing_a)
-    splicing_symmetric_difference_b = symmetric_difference(
-        aligned_splicing_b, aligned_hit_splicing_b)
+    with profileutil.stage("calc_single.symmetric_difference"):
+        splicing_symmetric_difference_a = symmetric_difference(
+            aligned_splicing_a, aligned_hit_splicing_a)
+        splicing_symmetric_difference_b = symmetric_difference(
+            aligned_splicing_b, aligned_hit_splicing_b)
     if ctx.debug:
         print("<---------------------------------->")
         print("ctx.hit_a.iso_location", ctx.hit_a.iso_location)
@@ -352,16 +356,17 @@ def calc_single(ctx: CalcMatchContext) -> Match:
         print("hit_splicing_a", hit_splicing_a)
         print("hit_splicing_b", hit_splicing_b)
 
-    _calc_splicing_difference_per_event(
-        m=match, 
-        query_splicing_a=aligned_splicing_a,
-        query_splicing_b=aligned_splicing_b,
-        hit_splicing_a=aligned_hit_splicing_a,
-        hit_splicing_b=aligned_hit_splicing_b,
-        symmetric_difference_a=splicing_symmetric_difference_a,
-        symmetric_difference_b=splicing_symmetric_difference_b,
-        debug=ctx.debug,
-    )
+    with profileutil.stage("calc_single.difference_per_event"):
+        _calc_splicing_difference_per_event(
+            m=match, 
+            query_splicing_a=aligned_splicing_a,
+            query_splicing_b=aligned_splicing_b,
+            hit_splicing_a=aligned_hit_splicing_a,
+            hit_splicing_b=aligned_hit_splicing_b,
+            symmetric_difference_a=splicing_symmetric_difference_a,
+            symmetric_difference_b=splicing_symmetric_difference_b,
+            debug=ctx.debug,
+        )
 
     ########################
     # Splicing Similarity
@@ -380,12 +385,12 @@ def calc_single(ctx: CalcMatchContext) -> Match:
 
     max_intersection_length = max(splicing_intersection_a_length, splicing_intersection_b_length)
     normalized_max_intersection_length = _normalize_length(max_intersection_length)
-    splicing_score_a = count_matches(splicing_intersection_a, ctx.hit_a.midline)
+    splicing_score_a = scoring.count_matches(splicing_intersection_a, ctx.hit_a.midline_prefix)
     
 
     splicing_dissimilarity_a = (max_splicing_length_a - splicing_score_a) / normalized_max_splicing_length \
                                 if normalized_max_splicing_length else 0
-    splicing_score_b = count_matches(splicing_intersection_b, ctx.hit_b.midline)
+    splicing_score_b = scoring.count_matches(splicing_intersection_b, ctx.hit_b.midline_prefix)
     splicing_dissimilarity_b = (max_splicing_length_b - splicing_score_b) / normalized_max_splicing_length \
                                if normalized_max_splicing_length else 0
     splicing_intersection_length = splicing_intersection_a_length + splicing_intersection_b_length
@@ -433,17 +438,13 @@ def calc_single(ctx: CalcMatchContext) -> Match:
     # isoform blast score
     ########################
     # match.isoform_blast_score = (ctx.hit_a.score + ctx.hit_b.score) / (ctx.hit_a.query_len + ctx.hit_b.query_len + ctx.hit_a.iso_len + ctx.hit_b.iso_len)
-    match_score_a = count_all_matches(ctx.hit_a.midline)
-    match_score_b = count_all_matches(ctx.hit_b.midline)
-    match.isoform_blast_score = (match_score_a + match_score_b) / (ctx.hit_a.query_len + ctx.hit_b.query_len + ctx.hit_a.iso_len + ctx.hit_b.iso_len)
+    match.isoform_blast_score = isoform_blast_score(ctx.hit_a, ctx.hit_b)
     if ctx.debug:
         print("ctx.hit_a.score", ctx.hit_a.score)
-        print("match_score_a", match_score_a)
         print("ctx.hit_a.query_len", ctx.hit_a.query_len)
         print("ctx.hit_a.iso_len", ctx.hit_a.iso_len)
 
         print("ctx.hit_b.score", ctx.hit_b.score)
-        print("match_score_b", match_score_b)
         print("ctx.hit_b.query_len", ctx.hit_b.query_len)
         print("ctx.hit_b.iso_len", ctx.hit_b.iso_len)
 
@@ -452,23 +453,38 @@ def calc_single(ctx: CalcMatchContext) -> Match:
     return match
 
 
-def prepare_calc_queries(db: database.models.DB, launch_folder: str, query_ctx: Queries, query_tuples: List[IsoformTuple], ) -> CalcQueriesContext:
+def prepare_calc_queries(
+    db: database.models.DB,
+    launch_folder: str,
+    query_ctx: Queries,
+    query_tuples: List[IsoformTuple],
+    store: Optional[hitstore.HitStore] = None,
+) -> CalcQueriesContext:
     isoforms = list(set(chain.from_iterable(
         (query_isoforms.a, query_isoforms.b)
         for query_isoforms in query_tuples
     )))
+    if store is None and hitstore.exists(launch_folder):
+        store = hitstore.HitStore(launch_folder)
     iso_to_hits = {}
     for iso_uuid in isoforms:
         iso = db.isoforms[iso_uuid]
+        if store is not None and iso_uuid in store:
+            with profileutil.stage("prepare.stored_hits"):
+                iso_to_hits[iso_uuid] = blast.get_stored_results(db, store, iso_uuid, query_len=len(iso.translation))
+            profileutil.count("prepare.hits", len(iso_to_hits[iso_uuid]))
+            continue
         gene = db.genes[iso.gene_uuid]
         record = db.records[gene.record_uuid]
-        iso_to_hits[iso_uuid] = blast.get_results(
-            db, 
-            launch_folder,
-            query_len=len(iso.translation),
-            result_file=query_ctx.isoform_to_file[iso_uuid],
-            query_organism=record.organism,
-        )
+        with profileutil.stage("prepare.json_hits"):
+            iso_to_hits[iso_uuid] = blast.get_results(
+                db, 
+                launch_folder,
+                query_len=len(iso.translation),
+                result_file=query_ctx.isoform_to_file[iso_uuid],
+                query_organism=record.organism,
+            )
+        profileutil.count("prepare.hits", len(iso_to_hits[iso_uuid]))
 
     queries = []
     for query in query_tuples:
@@ -485,46 +501,134 @@ def prepare_calc_queries(db: database.models.DB, launch_folder: str, query_ctx:
             iso_b_location=iso_b.location,
             iso_b_len=len(iso_b.translation),
             organism=record.organism,
+            iso_a_translation=iso_a.translation,
+            iso_b_translation=iso_b.translation,
         ))
 
     q_iso_to_gene = {iso_uuid:db.isoforms[iso_uuid].gene_uuid for iso_uuid in isoforms}
 
+    hit_classes = {}
+    if db.isoform_to_duplicates is not None:
+        for hits in iso_to_hits.values():
+            for h in hits:
+                if h.iso_uuid not in hit_classes:
+                    duplicates = db.isoform_to_duplicates.get(h.iso_uuid)
+                    hit_classes[h.iso_uuid] = min(duplicates) if duplicates else h.iso_uuid
+
     return CalcQueriesContext(
         queries=queries,
         iso_to_hits=iso_to_hits,
         q_iso_to_gene=q_iso_to_gene,
+        hit_classes=hit_classes,
+    )
+
+
+def _hit_class(ctx: CalcQueriesContext, hit: blast.Hit) -> Tuple[Any, ...]:
+    return (
+        ctx.hit_classes.get(hit.iso_uuid, hit.iso_uuid),
+        hit.iso_len,
+        hit.score,
+        hit.query_from,
+        hit.query_to,
+        hit.hit_from,
+        hit.hit_to,
+        hit.qseq,
+        hit.hseq,
+        hit.midline,
+    )
+
+
+# Collapsing is an approximation: queries whose splicing parts and the
+# translation within COLLAPSE_WINDOW residues around them agree, and whose
+# isoforms hit the same subjects, share one evaluation, and every member gets
+# the representative's hit pairs and features (also in the feature store and
+# on rescore). Differences further than the window from the splicing are
+# ignored; pass window=None to require identical translations.
+COLLAPSE_WINDOW = 30
+
+
+def _location_signature(loc: Location, translation: str, window: Optional[int]) -> Tuple[Any, ...]:
+    parts = tuple((p.start, p.end, p.strand, p.data.get("event_id")) for p in loc.parts)
+    if window is None:
+        return parts, translation
+    return parts, tuple(translation[max(p.start - window, 0):p.end + window] for p in loc.parts)
+
+
+def splicing_signature(query: CalcQuery, window: Optional[int] = COLLAPSE_WINDOW) -> Tuple[Any, ...]:
+    global_a, global_b = _get_splicing(query.iso_a_location, query.iso_b_location)
+    splicing_a = convert_splicing(global_a, query.iso_a_location, query.iso_a_len)
+    splicing_b = convert_splicing(global_b, query.iso_b_location, query.iso_b_len)
+    return (
+        _location_signature(splicing_a, query.iso_a_translation, window),
+        _location_signature(splicing_b, query.iso_b_translation, window),
+    )
+
+
+def _hits_signature(ctx: CalcQueriesContext, query: CalcQuery) -> Tuple[Any, ...]:
+    return tuple(
+        frozenset(ctx.hit_classes.get(h.iso_uuid, h.iso_uuid) for h in ctx.iso_to_hits[iso])
+        for iso in (query.iso_a, query.iso_b)
     )
 
 
-def calc_queries(ctx: CalcQueriesContext, use_tqdm: bool = True) -> List[Match]:
+def calc_collapsed_queries(
+    ctx: CalcQueriesContext,
+    use_tqdm: bool = True,
+    detector: Optional[ml.Detector] = None,
+    window: Optional[int] = COLLAPSE_WINDOW,
+) -> List[Match]:
+    signature_to_queries: Dict[Tuple[Any, ...], List[CalcQuery]] = defaultdict(list)
+    for query in ctx.queries:
+        signature_to_queries[(splicing_signature(query, window), _hits_signature(ctx, query))].append(query)
+    representatives = [queries[0] for queries in signature_to_queries.values()]
+    rep_to_members = {
+        IsoformTuple(queries[0].iso_a, queries[0].iso_b): queries[1:]
+        for queries in signature_to_queries.values()
+    }
+    all_queries = ctx.queries
+    ctx.queries = representatives
+    try:
+        matches = calc_queries(ctx, use_tqdm=use_tqdm, detector=detector)
+    finally:
+        ctx.queries = all_queries
+    ctx.collapsed += len(all_queries) - len(representatives)
+
+    result = []
+    for m in matches:
+        result.append(m)
+        for member in rep_to_members[m.query_isoforms]:
+            member_match = copy(m)
+            member_match.query_isoforms = IsoformTuple(member.iso_a, member.iso_b)
+            result.append(member_match)
+    return result
+
+
+_PRUNE_EPS = 1e-9
+
+
+def calc_queries(ctx: CalcQueriesContext, use_tqdm: bool = True, detector: Optional[ml.Detector] = None) -> List[Match]:
+    prune = detector is not None and detector.can_prune()
     if ctx.debug:
         with open(os.path.join(paths.FOLDER_DATA, "calc_queries_ctx.pkl"), "wb") as f:
             pickle.dump(ctx, f)
-    hit_groups: Iterable[List[blast.Hit]] = tqdm(
-        ctx.iso_to_hits.values(), desc="get_alignment_segments for hits") if use_tqdm else ctx.iso_to_hits.values()
-    for hits in hit_groups:
-        for hit in hits:
-            hit.query_segments = get_alignment_segments(
-                hit.qseq, hit.query_from, hit.query_len)
-            hit.hit_segments = get_alignment_segments(
-                hit.hseq, hit.hit_from, hit.iso_len)
     matches = []
     queries: List[CalcQuery] = tqdm(
         ctx.queries, desc="calc_queires") if use_tqdm else ctx.queries
     for query in queries:
-        query_union = union(query.iso_a_location, query.iso_b_location)
-        _extend_splicing(query_union)
-        _add_event_ids(query_union)
-        query_splicing_global_a, query_splicing_global_b = _get_splicings_from_union(query_union)
+        with profileutil.stage("calc_queries.query_splicing"):
+            query_union = union(query.iso_a_location, query.iso_b_location)
+            _extend_splicing(query_union)
+            _add_event_ids(query_union)
+            query_splicing_global_a, query_splicing_global_b = _get_splicings_from_union(query_union)
+
+            splicing_a = convert_splicing(
+                query_splicing_global_a, query.iso_a_location, query.iso_a_len)
+            splicing_b = convert_splicing(
+                query_splicing_global_b, query.iso_b_location, query.iso_b_len)
 
         hits_a = ctx.iso_to_hits[query.iso_a]
         hits_b = ctx.iso_to_hits[query.iso_b]
 
-        splicing_a = convert_splicing(
-            query_splicing_global_a, query.iso_a_location, query.iso_a_len)
-        splicing_b = convert_splicing(
-            query_splicing_global_b, query.iso_b_location, query.iso_b_len)
-
         if ctx.debug:
             print("<------------->")
             print("query.iso_a_location", query.iso_a_location)
@@ -540,6 +644,8 @@ def calc_queries(ctx: CalcQueriesContext, use_tqdm: bool = True) -> List[Match]:
         for h in hits_b:
             gene_to_hits_b[h.iso_gene_uuid].append(h)
 
+        hit_class = {id(h): _hit_class(ctx, h) for h in chain(hits_a, hits_b)}
+        pairs = []
         for hit_a in hits_a:
             # if hit_a.organism == query.organism:
             #     continue
@@ -549,16 +655,47 @@ def calc_queries(ctx: CalcQueriesContext, use_tqdm: bool = True) -> List[Match]:
                     continue
                 if hit_b.iso_uuid == hit_a.iso_uuid:
                     continue
-                m = calc_single(CalcMatchContext(
-                    hit_a=hit_a,
-                    hit_b=hit_b,
-                    iso_a=query.iso_a,
-                    iso_b=query.iso_b,
-                    splicing_a=splicing_a,
-                    splicing_b=splicing_b,
-                    debug=ctx.debug,
-                ))
-                matches.append(m)
+                pairs.append((hit_a, hit_b))
+
+        if prune:
+            bounds = [detector.probability_upper_bound(isoform_blast_score(hit_a, hit_b)) for hit_a, hit_b in pairs]
+            order = sorted(range(len(pairs)), key=lambda i: -bounds[i])
+        else:
+            order = list(range(len(pairs)))
+        best: Dict[Tuple[str, str], float] = {}
+        class_matches: Dict[Tuple[Any, Any], Match] = {}
+        query_matches = []
+        for i in order:
+            hit_a, hit_b = pairs[i]
+            key = hit_a.organism, hit_a.db_name
+            if prune and key in best and bounds[i] < best[key] - _PRUNE_EPS:
+                ctx.pruned += 1
+                continue
+            class_pair = hit_class[id(hit_a)], hit_class[id(hit_b)]
+            m = class_matches.get(class_pair)
+            if m is not None:
+                ctx.reused += 1
+                m = copy(m)
+                m.hit_isoforms = IsoformTuple(hit_a.iso_uuid, hit_b.iso_uuid)
+            else:
+                ctx.evaluated += 1
+                with profileutil.stage("calc_single"):
+                    m = calc_single(CalcMatchContext(
+                        hit_a=hit_a,
+                        hit_b=hit_b,
+                        iso_a=query.iso_a,
+                        iso_b=query.iso_b,
+                        splicing_a=splicing_a,
+                        splicing_b=splicing_b,
+                        debug=ctx.debug,
+                    ))
+                class_matches[class_pair] = m
+            if prune:
+                with profileutil.stage("calc_queries.detector_probability"):
+                    best[key] = max(best.get(key, 0.), detector.probability(m))
+            query_matches.append((i, m))
+        query_matches.sort(key=lambda x: x[0])
+        matches.extend(m for _, m in query_matches)
 
     return matches
 
@@ -570,13 +707,63 @@ def calc(
     query_tuples: Optional[List[IsoformTuple]] = None,
     hit_tuple: Optional[IsoformTuple] = None,
     debug: bool = False,
+    detector: Optional[ml.Detector] = None,
+    collapse: bool = False,
+    collapse_window: Optional[int] = COLLAPSE_WINDOW,
 ) -> List[Match]:
     if query_tuples is None:
         query_tuples = queries.tuples
     ctx = prepare_calc_queries(db, launch_folder, queries, query_tuples,)
     ctx.hit_tuple = hit_tuple
     ctx.debug = debug
-    return calc_queries(ctx)
+    if collapse:
+        matches = calc_collapsed_queries(ctx, detector=detector, window=collapse_window)
+    else:
+        matches = calc_queries(ctx, detector=detector)
+    total = ctx.evaluated + ctx.reused + ctx.pruned
+    if ctx.pruned:
+        _logger.info(f"Pruned {ctx.pruned} of {total} hit pairs")
+    if ctx.reused:
+        _logger.info(f"Reused duplicate class features for {ctx.reused} of {total} hit pairs")
+    if ctx.collapsed:
+        _logger.info(f"Collapsed {ctx.collapsed} of {len(ctx.queries)} queries by splicing signature")
+    return matches
+
+def score_matches(detector: ml.Detector, matches: List[Match], batch_size: int = 1000) -> None:
+    for i in range(0, len(matches), batch_size):
+        detector.transform(matches[i:i + batch_size])
+
+
+def iter_calc(
+    db: database.models.DB,
+    launch_folder: str,
+    queries: Queries,
+    query_tuples: Optional[List[IsoformTuple]] = None,
+    detector: Optional[ml.Detector] = None,
+    prune: bool = False,
+    score_batch: int = 1000,
+) -> Iterator[Tuple[IsoformTuple, List[Match]]]:
+    if query_tuples is None:
+        query_tuples = queries.tuples
+    store = hitstore.HitStore(launch_folder) if hitstore.exists(launch_folder) else None
+    evaluated = pruned = reused = 0
+    for _, gene_tuples in itertools.groupby(query_tuples, key=lambda t: db.isoforms[t.a].gene_uuid):
+        gene_tuples = list(gene_tuples)
+        ctx = prepare_calc_queries(db, launch_folder, queries, gene_tuples, store=store)
+        query_to_matches: Dict[IsoformTuple, List[Match]] = defaultdict(list)
+        for m in calc_queries(ctx, use_tqdm=False, detector=detector if prune else None):
+            query_to_matches[m.query_isoforms].append(m)
+        evaluated += ctx.evaluated
+        pruned += ctx.pruned
+        reused += ctx.reused
+        del ctx
+        for query_tuple in gene_tuples:
+            matches = query_to_matches.pop(query_tuple, [])
+            if detector is not None:
+                score_matches(detector, matches, score_batch)
+            yield query_tuple, matches
+    _logger.info(f"Streamed {len(query_tuples)} queries: {evaluated} hit pairs evaluated, {reused} reused, {pruned} pruned")
+
 
 def _check_connections(two_level_dict: Dict[uuid.UUID, Dict[Any, uuid.UUID]], m: Match, iso_from: uuid.UUID, mid: Any, iso_to: uuid.UUID) -> None:
     sub_dict = two_level_dict[iso_from]
@@ -588,7 +775,8 @@ def _check_connections(two_level_dict: Dict[uuid.UUID, Dict[Any, uuid.UUID]], m:
 
 
 def transform(ctx: CalcQueriesContext, matches: List[Match], detector: ml.Detector) -> List[Match]:
-    detector.transform(matches)
+    with profileutil.stage("transform.detector", items=len(matches)):
+        detector.transform(matches)
     query_to_organism_to_match: Dict[IsoformTuple,
                                      Dict[Tuple[str, str], Match]] = defaultdict(dict)
     for m in matches:
@@ -615,51 +803,286 @@ def transform(ctx: CalcQueriesContext, matches: List[Match], detector: ml.Detect
     return matches
    
 
-def calc_single_batch_parallel(batch: CalcBatch, detector: ml.Detector) -> None:
-    matches = calc_queries(batch.ctx, use_tqdm=False)
-    matches = transform(batch.ctx, matches, detector)
+def calc_single_batch_parallel(
+    batch: CalcBatch,
+    detector: ml.Detector,
+    prune: bool = False,
+    partial: bool = False,
+    collapse: bool = False,
+    collapse_window: Optional[int] = COLLAPSE_WINDOW,
+) -> None:
+    with profileutil.stage("calc_queries", items=len(batch.ctx.queries)):
+        if collapse:
+            matches = calc_collapsed_queries(
+                batch.ctx, use_tqdm=False, detector=detector if prune else None, window=collapse_window)
+        else:
+            matches = calc_queries(batch.ctx, use_tqdm=False, detector=detector if prune else None)
+    _logger.debug(f"Hit splicing cache: {hit_splicing_cache.stats()}")
+    total = batch.ctx.evaluated + batch.ctx.reused + batch.ctx.pruned
+    if prune:
+        _logger.debug(f"Pruned {batch.ctx.pruned} of {total} hit pairs")
+    _logger.debug(f"Reused duplicate class features for {batch.ctx.reused} of {total} hit pairs")
+    if collapse:
+        _logger.debug(f"Collapsed {batch.ctx.collapsed} of {len(batch.ctx.queries)} queries by splicing signature")
+    if partial:
+        with open(batch.result_path, "wb") as f:
+            pickle.dump(matches, f)
+        return
+    if batch.features_path is not None:
+        with profileutil.stage("write_features", items=len(matches)):
+            feature_store.write_segment(batch.features_path, matches)
+    with profileutil.stage("transform"):
+        matches = transform(batch.ctx, matches, detector)
+    with profileutil.stage("write_segment", items=len(matches)):
+        match_store.write_segment(batch.result_path, matches)
+
 
-    query_to_matches: Dict[IsoformTuple, List[SimpleMatch]] = defaultdict(list)
-    for m in matches:
-        query_to_matches[m.query_isoforms].append(SimpleMatch(
-            hit_isoforms=m.hit_isoforms,
-            predicted_positive=m.predicted_positive,
-            predicted_positive_probability=m.predicted_positive_probability,
-        ))
-    with open(batch.result_path, "wb") as f:
-        pickle.dump(dict(query_to_matches), f,
-                    protocol=pickle.HIGHEST_PROTOCOL)
+@dataclass
+class CalcTask:
+    batch_id: str
+    result_path: str
+    tuples: List[IsoformTuple]
+    cost: int = 0
+    partial: bool = False
+    features_path: Optional[str] = None
 
 
-def build_calc_batch_generator(
+@dataclass
+class CalcMerge:
+    batch_id: str
+    result_path: str
+    parts: List[CalcTask]
+    features_path: Optional[str] = None
+
+    @property
+    def tuples(self) -> List[IsoformTuple]:
+        return [t for part in self.parts for t in part.tuples]
+
+
+@dataclass
+class CalcTaskResult:
+    batch_id: str
+    seconds: float
+    error: Optional[str] = None
+    profile: Optional[profileutil.Profile] = None
+    pairs: int = 0
+    reused: int = 0
+
+
+def input_version(launch_folder: str, detector: ml.Detector, *options: Any) -> str:
+    h = hashlib.sha1()
+    if hitstore.exists(launch_folder):
+        files = sorted(pathutil.file_list(hitstore.store_folder(launch_folder)))
+    else:
+        files = hitstore.results_files(launch_folder)
+    for path in files:
+        stat = os.stat(path)
+        h.update(f"{os.path.relpath(path, launch_folder)}:{stat.st_size}:{int(stat.st_mtime)};".encode())
+    h.update(pickle.dumps(detector))
+    h.update(repr(options).encode())
+    return h.hexdigest()
+
+
+def build_calc_tasks(
     db: database.models.DB,
     launch_folder: str,
-    queries: Queries,
     query_tuples: List[IsoformTuple],
     batch_size: int = 10,
-) -> Iterable[CalcBatch]:
-    batch_idx = itertools.count()
-    results_folder = _parallel_results_folder(launch_folder)
+    version: str = "",
+) -> List[CalcTask]:
+    results_folder = match_store.segments_folder(launch_folder)
     gene_to_tuples: Dict[uuid.UUID, List[IsoformTuple]] = defaultdict(list)
     for query_tuple in query_tuples:
         gene_to_tuples[db.isoforms[query_tuple.a].gene_uuid].append(query_tuple)
     tuple_groups = list(gene_to_tuples.values())
 
+    tasks = []
     for i in range(0, len(tuple_groups), batch_size):
-        result_path = os.path.join(
-            results_folder, f"batch_{next(batch_idx)}.pkl")
-        if os.path.exists(result_path): continue
-        batch_tuples = [
+        tuples = [
             query_tuple
             for tuple_group in tuple_groups[i:i + batch_size]
             for query_tuple in tuple_group
         ]
-        ctx = prepare_calc_queries(db, launch_folder,  queries, batch_tuples)
-        yield CalcBatch(
-            result_path=result_path,
-            ctx=ctx,
+        batch_id = work_ledger.batch_id(tuples, version)
+        tasks.append(CalcTask(
+            batch_id=batch_id,
+            result_path=os.path.join(results_folder, f"batch_{batch_id}.npy"),
+            tuples=tuples,
+            features_path=feature_store.segment_path(launch_folder, f"batch_{batch_id}.npy"),
+        ))
+    return tasks
+
+
+def _hit_gene_counts(db: database.models.DB, store: hitstore.HitStore, iso_uuid: uuid.UUID) -> Tuple[Dict[uuid.UUID, int], Set[uuid.UUID]]:
+    gene_counts: Dict[uuid.UUID, int] = defaultdict(int)
+    hit_isoforms: Set[uuid.UUID] = set()
+    for hit_iso in store.hit_isoforms(iso_uuid):
+        iso = db.isoforms.get(hit_iso)
+        if iso is None:
+            continue
+        gene_counts[iso.gene_uuid] += 1
+        hit_isoforms.add(hit_iso)
+    return gene_counts, hit_isoforms
+
+
+def estimate_costs(db: database.models.DB, store: hitstore.HitStore, query_tuples: List[IsoformTuple]) -> List[int]:
+    iso_to_counts: Dict[uuid.UUID, Tuple[Dict[uuid.UUID, int], Set[uuid.UUID]]] = {}
+    costs = []
+    for t in query_tuples:
+        for iso_uuid in (t.a, t.b):
+            if iso_uuid not in iso_to_counts:
+                iso_to_counts[iso_uuid] = _hit_gene_counts(db, store, iso_uuid)
+        counts_a, isoforms_a = iso_to_counts[t.a]
+        counts_b, isoforms_b = iso_to_counts[t.b]
+        pairs = sum(count * counts_b.get(gene, 0) for gene, count in counts_a.items())
+        costs.append(1 + pairs - len(isoforms_a & isoforms_b))
+    return costs
+
+
+def _chunk_by_cost(items: List[Tuple[IsoformTuple, int]], batch_cost: int) -> List[List[Tuple[IsoformTuple, int]]]:
+    chunks: List[List[Tuple[IsoformTuple, int]]] = []
+    chunk: List[Tuple[IsoformTuple, int]] = []
+    chunk_cost = 0
+    for item in items:
+        if chunk and chunk_cost + item[1] > batch_cost:
+            chunks.append(chunk)
+            chunk, chunk_cost = [], 0
+        chunk.append(item)
+        chunk_cost += item[1]
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def build_cost_tasks(
+    db: database.models.DB,
+    launch_folder: str,
+    query_tuples: List[IsoformTuple],
+    store: hitstore.HitStore,
+    batch_cost: int,
+    version: str = "",
+) -> Tuple[List[CalcTask], List[CalcMerge]]:
+    results_folder = match_store.segments_folder(launch_folder)
+    parts_folder = pathutil.create_folder(match_store.store_folder(launch_folder), "parts")
+    gene_to_items: Dict[uuid.UUID, List[Tuple[IsoformTuple, int]]] = defaultdict(list)
+    for query_tuple, cost in zip(query_tuples, estimate_costs(db, store, query_tuples)):
+        gene_to_items[db.isoforms[query_tuple.a].gene_uuid].append((query_tuple, cost))
+    groups = sorted(gene_to_items.values(), key=lambda items: -sum(cost for _, cost in items))
+
+    def make_task(items: List[Tuple[IsoformTuple, int]], partial: bool) -> CalcTask:
+        tuples = [t for t, _ in items]
+        batch_id = work_ledger.batch_id(tuples, version + (":part" if partial else ""))
+        if partial:
+            return CalcTask(
+                batch_id,
+                os.path.join(parts_folder, f"part_{batch_id}.pkl"),
+                tuples,
+                cost=sum(cost for _, cost in items),
+                partial=True,
+            )
+        return CalcTask(
+            batch_id,
+            os.path.join(results_folder, f"batch_{batch_id}.npy"),
+            tuples,
+            cost=sum(cost for _, cost in items),
+            features_path=feature_store.segment_path(launch_folder, f"batch_{batch_id}.npy"),
         )
 
+    tasks = []
+    merges = []
+    small = []
+    for items in groups:
+        chunks = _chunk_by_cost(items, batch_cost)
+        if len(chunks) == 1:
+            small.append(items)
+            continue
+        parts = [make_task(chunk, partial=True) for chunk in chunks]
+        batch_id = work_ledger.batch_id([t for t, _ in items], version)
+        merges.append(CalcMerge(
+            batch_id,
+            os.path.join(results_folder, f"batch_{batch_id}.npy"),
+            parts,
+            features_path=feature_store.segment_path(launch_folder, f"batch_{batch_id}.npy"),
+        ))
+        tasks.extend(parts)
+
+    batch: List[Tuple[IsoformTuple, int]] = []
+    batch_total = 0
+    for items in small:
+        cost = sum(cost for _, cost in items)
+        if batch and batch_total + cost > batch_cost:
+            tasks.append(make_task(batch, partial=False))
+            batch, batch_total = [], 0
+        batch.extend(items)
+        batch_total += cost
+    if batch:
+        tasks.append(make_task(batch, partial=False))
+    _logger.info(f"Cost batches: {len(tasks)} tasks, {len(merges)} split genes, estimated {sum(t.cost for t in tasks)} pairs")
+    return tasks, merges
+
+
+def merge_parts(db: database.models.DB, merge: CalcMerge, detector: ml.Detector) -> None:
+    matches: List[Match] = []
+    for part in merge.parts:
+        with open(part.result_path, "rb") as f:
+            matches.extend(pickle.load(f))
+    ctx = CalcQueriesContext(
+        queries=[],
+        iso_to_hits={},
+        q_iso_to_gene={iso_uuid: db.isoforms[iso_uuid].gene_uuid for t in merge.tuples for iso_uuid in (t.a, t.b)},
+    )
+    if merge.features_path is not None:
+        feature_store.write_segment(merge.features_path, matches)
+    match_store.write_segment(merge.result_path, transform(ctx, matches, detector))
+
+
+def _log_costs(tasks: List[CalcTask], results: List[CalcTaskResult]) -> None:
+    task_costs = {task.batch_id: task.cost for task in tasks}
+    results = [r for r in results if r.error is None and r.batch_id in task_costs]
+    if not results:
+        return
+    predicted = sum(task_costs[r.batch_id] for r in results)
+    actual = sum(r.pairs for r in results)
+    seconds = sum(r.seconds for r in results)
+    reused = sum(r.reused for r in results)
+    slowest = max(results, key=lambda r: r.seconds)
+    _logger.info(f"Duplicate classes: reused features for {reused} of {actual} hit pairs")
+    _logger.info(
+        f"Batch cost: predicted {predicted} pairs, actual {actual} pairs in {seconds:.1f}s "
+        f"({seconds / max(actual, 1) * 1e6:.1f}us per pair); slowest batch {slowest.seconds:.1f}s "
+        f"with predicted {task_costs[slowest.batch_id]}, actual {slowest.pairs}")
+
+
+def _ledger_todo(ledger: work_ledger.Ledger, tasks: Sequence[Any], max_attempts: int) -> List[Any]:
+    for task in tasks:
+        if ledger.state(task.batch_id) == work_ledger.DONE and not os.path.exists(task.result_path):
+            ledger.reset(task.batch_id)
+    todo_ids = set(ledger.todo((task.batch_id for task in tasks), max_attempts))
+    return [task for task in tasks if task.batch_id in todo_ids]
+
+
+def _ledger_record(ledger: work_ledger.Ledger, result: CalcTaskResult) -> None:
+    if result.error is None:
+        ledger.finish(result.batch_id, result.seconds)
+    else:
+        _logger.error(f"Batch {result.batch_id} failed: {result.error}")
+        ledger.fail(result.batch_id, result.seconds, result.error)
+
+
+def _ledger_complete(ledger: work_ledger.Ledger, launch_folder: str, tasks: Sequence[Any]) -> List[IsoformTuple]:
+    _logger.info(f"Work ledger: {ledger.stats()}")
+    missing = ledger.missing((task.batch_id, task.tuples) for task in tasks)
+    if missing:
+        _logger.warning(f"{len(missing)} queries are missing from the match store: {missing}")
+    rescored = set(feature_store.read_meta(launch_folder).get("rescored", []))
+    match_store.build(launch_folder, [
+        _segment_path(launch_folder, task.result_path, rescored)
+        for task in tasks
+        if ledger.state(task.batch_id) == work_ledger.DONE
+    ])
+    ledger.close()
+    return missing
+
 
 def calc_batches(
         db: database.models.DB,
@@ -667,13 +1090,96 @@ def calc_batches(
         queries: Queries,
         query_tuples: List[IsoformTuple],
         detector: ml.Detector,
-        batch_size: int = 10
-) -> None:
+        batch_size: int = 10,
+        prune: bool = False,
+        max_attempts: int = 3,
+        profile: bool = False,
+        flame: bool = False,
+        collapse: bool = False,
+        collapse_window: Optional[int] = COLLAPSE_WINDOW,
+) -> List[IsoformTuple]:
     _logger.info("Start calc batches")
-    batches = build_calc_batch_generator(
-        db, launch_folder, queries, query_tuples)
-    for batch in tqdm(batches, total=len(query_tuples) / batch_size, desc="calc_batches"):
-        calc_single_batch_parallel(batch, detector=detector)
+    if profile:
+        profileutil.enable(flame)
+    try:
+        feature_store.update_meta(launch_folder, prune=prune, collapse=collapse, collapse_window=collapse_window)
+        store = hitstore.HitStore(launch_folder) if hitstore.exists(launch_folder) else None
+        tasks = build_calc_tasks(db, launch_folder, query_tuples, batch_size, input_version(launch_folder, detector, prune, collapse, collapse_window))
+        ledger = work_ledger.Ledger(match_store.ledger_path(launch_folder))
+        ledger.register((task.batch_id, len(task.tuples)) for task in tasks)
+        while True:
+            todo = _ledger_todo(ledger, tasks, max_attempts)
+            if not todo:
+                break
+            for task in tqdm(todo, desc="calc_batches"):
+                ledger.start([task.batch_id])
+                started = time.time()
+                try:
+                    with profileutil.stage("prepare", items=len(task.tuples)):
+                        ctx = prepare_calc_queries(db, launch_folder, queries, task.tuples, store=store)
+                    calc_single_batch_parallel(
+                        CalcBatch(result_path=task.result_path, ctx=ctx, features_path=task.features_path),
+                        detector=detector,
+                        prune=prune,
+                        collapse=collapse,
+                        collapse_window=collapse_window,
+                    )
+                    result = CalcTaskResult(task.batch_id, time.time() - started)
+                except Exception as e:
+                    result = CalcTaskResult(task.batch_id, time.time() - started, repr(e))
+                _ledger_record(ledger, result)
+        profileutil.log_report(os.path.join(launch_folder, "profile.folded"))
+        return _ledger_complete(ledger, launch_folder, tasks)
+    finally:
+        if profile:
+            profileutil.disable()
+            profileutil.reset()
+
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(
+    launch_folder: str,
+    queries: Queries,
+    detector: ml.Detector,
+    db_path: Optional[str],
+    prune: bool,
+    collapse: bool,
+    collapse_window: Optional[int],
+    flame: Optional[bool],
+) -> None:
+    if flame is not None:
+        profileutil.enable(flame)
+        profileutil.reset()
+    if db_path is not None:
+        _worker["db"] = database.store.read(db_path)
+        _worker["store"] = hitstore.HitStore(launch_folder)
+    _worker["launch_folder"] = launch_folder
+    _worker["queries"] = queries
+    _worker["detector"] = detector
+    _worker["prune"] = prune
+    _worker["collapse"] = collapse
+    _worker["collapse_window"] = collapse_window
+
+
+def calc_task(task: CalcTask) -> CalcTaskResult:
+    started = time.time()
+    try:
+        with profileutil.stage("prepare", items=len(task.tuples)):
+            ctx = prepare_calc_queries(_worker["db"], _worker["launch_folder"], _worker["queries"], task.tuples, store=_worker["store"])
+        calc_single_batch_parallel(
+            CalcBatch(result_path=task.result_path, ctx=ctx, features_path=task.features_path),
+            detector=_worker["detector"],
+            prune=_worker["prune"],
+            partial=task.partial,
+            collapse=_worker["collapse"],
+            collapse_window=_worker["collapse_window"],
+        )
+    except Exception as e:
+        _logger.exception(f"exception in batch {task.batch_id}")
+        return CalcTaskResult(task.batch_id, time.time() - started, repr(e), profileutil.take())
+    return CalcTaskResult(task.batch_id, time.time() - started, profile=profileutil.take(), pairs=ctx.evaluated + ctx.reused + ctx.pruned, reused=ctx.reused)
 
 
 def calc_parallel(
@@ -682,21 +1188,147 @@ def calc_parallel(
         queries: Queries,
         query_tuples: List[IsoformTuple],
         detector: ml.Detector,
-        batch_size: int = 10
-) -> None:
+        batch_size: int = 10,
+        processes: int = 19,
+        db_path: Optional[str] = None,
+        prune: bool = False,
+        max_attempts: int = 3,
+        profile: bool = False,
+        flame: bool = False,
+        batch_cost: Optional[int] = None,
+        collapse: bool = False,
+        collapse_window: Optional[int] = COLLAPSE_WINDOW,
+) -> List[IsoformTuple]:
     _logger.info("Start calc parallel")
-    pathutil.reset_folder(_parallel_results_folder(launch_folder))
-    generator = build_calc_batch_generator(
-        db, launch_folder, queries, query_tuples)
-    with get_context("spawn").Pool(19, maxtasksperchild=50) as p:
-        list(tqdm(p.imap_unordered(
-            partial(
-                calc_single_batch_parallel,
-                detector=detector,
-            ),
-            generator,
-            chunksize=1,
-        ), total=len(query_tuples) / batch_size))
+    if profile:
+        profileutil.enable(flame)
+    try:
+        feature_store.update_meta(launch_folder, prune=prune, collapse=collapse, collapse_window=collapse_window)
+        if not hitstore.exists(launch_folder):
+            hitstore.build(launch_folder)
+        version = input_version(launch_folder, detector, prune, collapse, collapse_window)
+        store = hitstore.HitStore(launch_folder)
+        if batch_cost is None:
+            tasks, merges = build_calc_tasks(db, launch_folder, query_tuples, batch_size, version), []
+        else:
+            tasks, merges = build_cost_tasks(db, launch_folder, query_tuples, store, batch_cost, version)
+        ledger = work_ledger.Ledger(match_store.ledger_path(launch_folder))
+        ledger.register((task.batch_id, len(task.tuples)) for task in [*tasks, *merges])
+        results = []
+        if db_path is None:
+            _worker["db"] = db
+            _worker["store"] = store
+            context = get_context("fork")
+        else:
+            context = get_context("spawn")
+        with context.Pool(
+            processes,
+            initializer=_init_worker,
+            initargs=(launch_folder, queries, detector, db_path, prune, collapse, collapse_window, flame if profile else None),
+            maxtasksperchild=50 if db_path is None else None,
+        ) as p:
+            while True:
+                todo = _ledger_todo(ledger, tasks, max_attempts)
+                if not todo:
+                    break
+                ledger.start(task.batch_id for task in todo)
+                for result in tqdm(p.imap_unordered(calc_task, todo, chunksize=1), total=len(todo)):
+                    profileutil.merge(result.profile)
+                    _ledger_record(ledger, result)
+                    results.append(result)
+        _worker.clear()
+        _log_costs(tasks, results)
+        for merge in _ledger_todo(ledger, merges, max_attempts):
+            if any(ledger.state(part.batch_id) != work_ledger.DONE for part in merge.parts):
+                continue
+            ledger.start([merge.batch_id])
+            started = time.time()
+            try:
+                merge_parts(db, merge, detector)
+                result = CalcTaskResult(merge.batch_id, time.time() - started)
+            except Exception as e:
+                result = CalcTaskResult(merge.batch_id, time.time() - started, repr(e))
+            _ledger_record(ledger, result)
+        profileutil.log_report(os.path.join(launch_folder, "profile.folded"))
+        return _ledger_complete(ledger, launch_folder, [*(task for task in tasks if not task.partial), *merges])
+    finally:
+        if profile:
+            profileutil.disable()
+            profileutil.reset()
+
+
+def _hit_organism(db: database.models.DB, iso_uuid: uuid.UUID) -> Tuple[str, str]:
+    iso = db.isoforms[iso_uuid]
+    record = db.records[db.genes[iso.gene_uuid].record_uuid]
+    return record.organism, db.files[record.file_uuid].db_name
+
+
+def _rescored_folder(launch_folder: str) -> str:
+    return pathutil.create_folder(match_store.store_folder(launch_folder), "rescored")
+
+
+def _segment_path(launch_folder: str, result_path: str, rescored: Set[str]) -> str:
+    name = os.path.basename(result_path)
+    if name not in rescored:
+        return result_path
+    rescored_path = os.path.join(_rescored_folder(launch_folder), name)
+    if not os.path.exists(rescored_path) or os.path.getmtime(rescored_path) < os.path.getmtime(result_path):
+        _logger.warning(f"Rescored segment {name} is older than its batch, using the batch matches")
+        return result_path
+    return rescored_path
+
+
+def rescore_segment(db: database.models.DB, launch_folder: str, name: str, detector: ml.Detector) -> Optional[str]:
+    path = feature_store.segment_path(launch_folder, name)
+    if not os.path.exists(path):
+        _logger.warning(f"No stored features for {name}, keeping the previous matches")
+        return None
+    hit_organisms: Dict[uuid.UUID, Tuple[str, str]] = {}
+
+    def hit_organism(iso_uuid: uuid.UUID) -> Tuple[str, str]:
+        result = hit_organisms.get(iso_uuid)
+        if result is None:
+            result = hit_organisms[iso_uuid] = _hit_organism(db, iso_uuid)
+        return result
+
+    matches = feature_store.to_matches(feature_store.read_segment(path), hit_organism)
+    ctx = CalcQueriesContext(
+        queries=[],
+        iso_to_hits={},
+        q_iso_to_gene={
+            iso_uuid: db.isoforms[iso_uuid].gene_uuid
+            for m in matches
+            for iso_uuid in (m.query_isoforms.a, m.query_isoforms.b)
+        },
+    )
+    result_path = os.path.join(_rescored_folder(launch_folder), name)
+    match_store.write_segment(result_path, transform(ctx, matches, detector))
+    return result_path
+
+
+def _rescore_task(name: str) -> Optional[str]:
+    return rescore_segment(_worker["db"], _worker["launch_folder"], name, _worker["detector"])
+
+
+def rescore(db: database.models.DB, launch_folder: str, detector: ml.Detector, processes: int = 1) -> None:
+    _logger.info("Start rescore")
+    if feature_store.read_meta(launch_folder).get("prune"):
+        raise RescoreException("Features were calculated with pruning against the previous detector, recalculate without prune")
+    names = match_store.segment_names(launch_folder)
+    pathutil.reset_folder(_rescored_folder(launch_folder))
+    if processes > 1:
+        _worker.update(db=db, launch_folder=launch_folder, detector=detector)
+        with get_context("fork").Pool(processes) as p:
+            rescored = list(tqdm(p.imap(_rescore_task, names), total=len(names), desc="rescore"))
+        _worker.clear()
+    else:
+        rescored = [rescore_segment(db, launch_folder, name, detector) for name in tqdm(names, desc="rescore")]
+    _logger.info(f"Rescored {sum(path is not None for path in rescored)} of {len(names)} segments")
+    feature_store.update_meta(launch_folder, rescored=[name for name, path in zip(names, rescored) if path is not None])
+    match_store.build(launch_folder, [
+        path if path is not None else os.path.join(match_store.segments_folder(launch_folder), name)
+        for name, path in zip(names, rescored)
+    ])
 
 
 ###############
@@ -704,6 +1336,8 @@ def calc_parallel(
 ###############
 
 def read_simple_matches(launch_folder: str) -> Mapping[IsoformTuple, List[SimpleMatch]]:
+    if match_store.exists(launch_folder):
+        return match_store.MatchStore(launch_folder).to_simple_matches()
     results_folder = _parallel_results_folder(launch_folder)
     result: Dict[IsoformTuple, List[SimpleMatch]] = {}
     for file_path in tqdm(pathutil.file_list(results_folder), desc="read_simple_matches"):
@@ -712,6 +1346,12 @@ def read_simple_matches(launch_folder: str) -> Mapping[IsoformTuple, List[Simple
     return result
 
 
+def read_matches_df(launch_folder: str) -> pd.DataFrame:
+    if match_store.exists(launch_folder):
+        return match_store.MatchStore(launch_folder).to_dataframe()
+    return match_store.simple_matches_to_dataframe(read_simple_matches(launch_folder))
+
+
 def convert_matches(simple_matches: Dict[IsoformTuple, List[SimpleMatch]]) -> List[Match]:
     result = []
     for query_isoforms, matches in simple_matches.items():
@@ -1,7 +1,14 @@
+import os
+import tempfile
 import unittest
+import uuid
+from types import SimpleNamespace
+from typing import Dict, List
 
 from kd_splicing.location.models import Location, LocationPart, ConvertSegment
-from kd_splicing import as_type
+from kd_splicing import as_type, blast, feature_store, features
+from kd_splicing.exception import RescoreException
+from kd_splicing.models import IsoformTuple
 
 class FeaturesTestCase(unittest.TestCase):
 
@@ -13,3 +20,209 @@ class FeaturesTestCase(unittest.TestCase):
             LocationPart(start=12754944, end=12755048, strand=-1),
             LocationPart(start=12755136, end=12755140, strand=-1)])
         print(features.convert_splicing(query_splicing, query_iso_b, 348))
+
+
+class _FakeStore:
+    def __init__(self, hits: Dict[uuid.UUID, List[uuid.UUID]]) -> None:
+        self.hits = hits
+
+    def hit_isoforms(self, query_uuid: uuid.UUID) -> List[uuid.UUID]:
+        return self.hits.get(query_uuid, [])
+
+
+class CostBatchesTestCase(unittest.TestCase):
+    def test_build_cost_tasks(self) -> None:
+        big_gene, small_gene, hit_gene = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        big = [uuid.uuid4() for _ in range(3)]
+        small = [uuid.uuid4() for _ in range(2)]
+        hits = [uuid.uuid4() for _ in range(4)]
+        isoforms = {
+            **{iso: SimpleNamespace(gene_uuid=big_gene) for iso in big},
+            **{iso: SimpleNamespace(gene_uuid=small_gene) for iso in small},
+            **{iso: SimpleNamespace(gene_uuid=hit_gene) for iso in hits},
+        }
+        db = SimpleNamespace(isoforms=isoforms)
+        store = _FakeStore({**{iso: hits for iso in big}, small[0]: hits[:1], small[1]: hits[:2]})
+        big_tuples = [IsoformTuple(big[0], big[1]), IsoformTuple(big[0], big[2]), IsoformTuple(big[1], big[2])]
+        small_tuple = IsoformTuple(small[0], small[1])
+
+        self.assertEqual(features.estimate_costs(db, store, big_tuples + [small_tuple]), [13, 13, 13, 2])
+        with tempfile.TemporaryDirectory() as launch_folder:
+            tasks, merges = features.build_cost_tasks(db, launch_folder, big_tuples + [small_tuple], store, batch_cost=20)
+
+        self.assertEqual(len(merges), 1)
+        self.assertEqual([part.tuples for part in merges[0].parts], [[t] for t in big_tuples])
+        self.assertTrue(all(task.partial for task in tasks[:3]))
+        self.assertEqual(tasks[3].tuples, [small_tuple])
+        self.assertFalse(tasks[3].partial)
+        self.assertEqual(tasks[3].cost, 2)
+
+
+class InputVersionTestCase(unittest.TestCase):
+    def test_json_results_without_hit_store(self) -> None:
+        with tempfile.TemporaryDirectory() as launch_folder:
+            group_folder = os.path.join(launch_folder, "blast_results", "group_0")
+            os.makedirs(group_folder)
+            with open(os.path.join(group_folder, "result_1.json"), "w") as f:
+                f.write("{}")
+            version = features.input_version(launch_folder, None)
+            with open(os.path.join(group_folder, "result_2.json"), "w") as f:
+                f.write("{}")
+            self.assertNotEqual(features.input_version(launch_folder, None), version)
+
+
+class RescoreTestCase(unittest.TestCase):
+    def test_refuse_pruned(self) -> None:
+        with tempfile.TemporaryDirectory() as launch_folder:
+            feature_store.update_meta(launch_folder, prune=True)
+            with self.assertRaises(RescoreException):
+                features.rescore(None, launch_folder, None)
+
+    def test_rescored_segment_path(self) -> None:
+        with tempfile.TemporaryDirectory() as launch_folder:
+            result_path = os.path.join(launch_folder, "batch.npy")
+            rescored_path = os.path.join(features._rescored_folder(launch_folder), "batch.npy")
+            for path in (result_path, rescored_path):
+                with open(path, "w") as f:
+                    f.write("")
+            os.utime(result_path, (0, 0))
+            self.assertEqual(features._segment_path(launch_folder, result_path, set()), result_path)
+            self.assertEqual(features._segment_path(launch_folder, result_path, {"batch.npy"}), rescored_path)
+            os.utime(result_path, None)
+            os.utime(rescored_path, (0, 0))
+            self.assertEqual(features._segment_path(launch_folder, result_path, {"batch.npy"}), result_path)
+
+
+def _hit(iso_uuid: uuid.UUID, gene_uuid: uuid.UUID, location: Location, length: int) -> blast.Hit:
+    return blast.Hit(
+        iso_uuid=iso_uuid,
+        iso_len=length,
+        iso_gene_uuid=gene_uuid,
+        iso_location=location,
+        organism="organism",
+        db_name="db",
+        score=length,
+        query_from=0,
+        query_to=length,
+        query_len=length,
+        hit_from=0,
+        hit_to=length,
+        qseq="M" * length,
+        hseq="M" * length,
+        midline="M" * length,
+    )
+
+
+class DuplicateClassesTestCase(unittest.TestCase):
+    def test_reuse_duplicate_features(self) -> None:
+        loc_a = Location(parts=[LocationPart(0, 30, 1), LocationPart(60, 90, 1)])
+        loc_b = Location(parts=[LocationPart(0, 30, 1), LocationPart(40, 49, 1), LocationPart(60, 90, 1)])
+        iso_a, iso_b, gene = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        hit_gene = uuid.uuid4()
+        hit_a, hit_a_copy, hit_b = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        query = features.CalcQuery(
+            iso_a=iso_a, iso_a_len=20, iso_a_location=loc_a,
+            iso_b=iso_b, iso_b_location=loc_b, iso_b_len=23,
+            organism="query",
+        )
+
+        def ctx(hit_classes: Dict[uuid.UUID, uuid.UUID]) -> features.CalcQueriesContext:
+            hits = [_hit(hit_a, hit_gene, loc_a, 20), _hit(hit_a_copy, hit_gene, loc_a, 20), _hit(hit_b, hit_gene, loc_b, 23)]
+            return features.CalcQueriesContext(
+                queries=[query],
+                iso_to_hits={iso_a: hits, iso_b: hits},
+                q_iso_to_gene={iso_a: gene, iso_b: gene},
+                hit_classes=hit_classes,
+            )
+
+        plain_ctx = ctx({})
+        plain = features.calc_queries(plain_ctx, use_tqdm=False)
+        dedup_ctx = ctx({hit_a_copy: hit_a})
+        dedup = features.calc_queries(dedup_ctx, use_tqdm=False)
+
+        self.assertEqual(plain, dedup)
+        self.assertEqual(plain_ctx.reused, 0)
+        self.assertEqual(dedup_ctx.evaluated + dedup_ctx.reused, plain_ctx.evaluated)
+        self.assertGreater(dedup_ctx.reused, 0)
+
+
+def _shift(loc: Location, offset: int) -> Location:
+    return Location(parts=[LocationPart(p.start + offset, p.end + offset, p.strand) for p in loc.parts])
+
+
+class SplicingSignatureTestCase(unittest.TestCase):
+    def test_collapse_queries(self) -> None:
+        loc_a = Location(parts=[LocationPart(0, 30, 1), LocationPart(60, 90, 1)])
+        loc_b = Location(parts=[LocationPart(0, 30, 1), LocationPart(40, 49, 1), LocationPart(60, 90, 1)])
+        gene, hit_gene = uuid.uuid4(), uuid.uuid4()
+        hits = [_hit(uuid.uuid4(), hit_gene, loc_a, 20), _hit(uuid.uuid4(), hit_gene, loc_b, 23)]
+        isoforms = [uuid.uuid4() for _ in range(4)]
+        queries = [
+            features.CalcQuery(
+                iso_a=isoforms[0], iso_a_len=20, iso_a_location=loc_a,
+                iso_b=isoforms[1], iso_b_location=loc_b, iso_b_len=23,
+                organism="query", iso_a_translation="M" * 20, iso_b_translation="M" * 23,
+            ),
+            features.CalcQuery(
+                iso_a=isoforms[2], iso_a_len=20, iso_a_location=_shift(loc_a, 1000),
+                iso_b=isoforms[3], iso_b_location=_shift(loc_b, 1000), iso_b_len=23,
+                organism="query", iso_a_translation="M" * 20, iso_b_translation="M" * 23,
+            ),
+        ]
+        self.assertEqual(features.splicing_signature(queries[0]), features.splicing_signature(queries[1]))
+
+        def ctx() -> features.CalcQueriesContext:
+            return features.CalcQueriesContext(
+                queries=list(queries),
+                iso_to_hits={iso: hits for iso in isoforms},
+                q_iso_to_gene={iso: gene for iso in isoforms},
+            )
+
+        full = features.calc_queries(ctx(), use_tqdm=False)
+        collapsed_ctx = ctx()
+        collapsed = features.calc_collapsed_queries(collapsed_ctx, use_tqdm=False)
+
+        key = lambda m: (m.query_isoforms.a, m.hit_isoforms.a, m.hit_isoforms.b)
+        self.assertEqual(sorted(collapsed, key=key), sorted(full, key=key))
+        self.assertEqual(collapsed_ctx.collapsed, 1)
+        self.assertEqual(len(collapsed_ctx.queries), 2)
+
+    def test_collapse_different_isoforms_with_same_event(self) -> None:
+        loc_a = Location(parts=[LocationPart(0, 150, 1), LocationPart(180, 330, 1)])
+        loc_b = Location(parts=[LocationPart(0, 150, 1), LocationPart(160, 169, 1), LocationPart(180, 330, 1)])
+        gene, hit_gene = uuid.uuid4(), uuid.uuid4()
+        hits = [_hit(uuid.uuid4(), hit_gene, loc_a, 100), _hit(uuid.uuid4(), hit_gene, loc_b, 103)]
+        other_hits = [_hit(uuid.uuid4(), hit_gene, loc_a, 100), _hit(uuid.uuid4(), hit_gene, loc_b, 103)]
+        isoforms = [uuid.uuid4() for _ in range(6)]
+        core_a, core_b = "A" * 70, "A" * 73
+
+        def query(a: int, b: int, head: str, tail: str) -> features.CalcQuery:
+            return features.CalcQuery(
+                iso_a=isoforms[a], iso_a_len=100, iso_a_location=_shift(loc_a, 1000 * a),
+                iso_b=isoforms[b], iso_b_location=_shift(loc_b, 1000 * a), iso_b_len=103,
+                organism="query", iso_a_translation=head + core_a + tail, iso_b_translation=head + core_b + tail,
+            )
+
+        queries = [query(0, 1, "M" * 10, "K" * 20), query(2, 3, "W" * 10, "R" * 20), query(4, 5, "M" * 10, "K" * 20)]
+        self.assertEqual(features.splicing_signature(queries[0]), features.splicing_signature(queries[1]))
+        self.assertNotEqual(features.splicing_signature(queries[0], None), features.splicing_signature(queries[1], None))
+
+        def ctx() -> features.CalcQueriesContext:
+            iso_to_hits = {iso: hits for iso in isoforms[:4]}
+            iso_to_hits.update({iso: other_hits for iso in isoforms[4:]})
+            return features.CalcQueriesContext(
+                queries=list(queries),
+                iso_to_hits=iso_to_hits,
+                q_iso_to_gene={iso: gene for iso in isoforms},
+            )
+
+        full = features.calc_queries(ctx(), use_tqdm=False)
+        collapsed_ctx = ctx()
+        collapsed = features.calc_collapsed_queries(collapsed_ctx, use_tqdm=False)
+
+        key = lambda m: (m.query_isoforms.a, m.hit_isoforms.a, m.hit_isoforms.b)
+        self.assertEqual(sorted(collapsed, key=key), sorted(full, key=key))
+        self.assertEqual(collapsed_ctx.collapsed, 1)
+        member = [m for m in collapsed if m.query_isoforms == IsoformTuple(isoforms[2], isoforms[3])]
+        self.assertTrue(member)
+        self.assertTrue(all({m.hit_isoforms.a, m.hit_isoforms.b} <= {h.iso_uuid for h in hits} for m in member))
@@ -13,7 +13,7 @@ from tqdm import tqdm
 
 from kd_common import excel, google, logutil, pathutil
 from kd_splicing import as_type, blast, database, features, pipeline
-from kd_splicing.models import IsoformTuple, Queries, SimpleMatch
+from kd_splicing.models import IsoformTuple, Queries
 from kd_splicing.location.utils import symmetric_difference
 import pickle
 import json
@@ -52,10 +52,7 @@ def get_query_isoforms(db: database.models.DB, num_groups: int = 20, organism: O
             isoforms_count += 1
 
     tuples = []
-    isoform_to_idx = {}
-    group_count = itertools.cycle(range(0, num_groups))
-    isoform_to_group = {}
-    group_size: Dict[int, int] = defaultdict(int)
+    grouped_isoforms = []
     duplicated_isoforms_count: int = 0
     all_pairs_count: int = 0
 
@@ -69,10 +66,7 @@ def get_query_isoforms(db: database.models.DB, num_groups: int = 20, organism: O
             iso_uuid = gene_isoforms[i]
             if iso_uuid in duplicates:
                 continue
-            group = next(group_count)
-            isoform_to_group[iso_uuid] = group
-            isoform_to_idx[iso_uuid] = group_size[group]
-            group_size[group] += 1
+            grouped_isoforms.append(iso_uuid)
             for j in range(i + 1, len(gene_isoforms)):
                 if gene_isoforms[j] in duplicates:
                     continue
@@ -82,6 +76,11 @@ def get_query_isoforms(db: database.models.DB, num_groups: int = 20, organism: O
         for iso_tuple in tuples
         for iso in (iso_tuple.a, iso_tuple.b)
     })
+    isoform_to_group, isoform_to_idx = blast.assign_groups(
+        grouped_isoforms,
+        {iso: len(db.isoforms[iso].translation) for iso in grouped_isoforms},
+        num_groups,
+    )
     _logger.info(f"Isoforms count: {isoforms_count}")
     _logger.info(
         f"Duplicated isoforms:{duplicated_isoforms_count} {duplicated_isoforms_count / isoforms_count}")
@@ -145,66 +144,59 @@ def get_taxonomy_df() -> pd.DataFrame:
 
 def get_basic_df(
     db: database.models.DB, 
-    query_to_matches: Mapping[IsoformTuple, List[SimpleMatch]],
+    matches: pd.DataFrame,
     isoforms_to_duplicates: Optional[Mapping[uuid.UUID, List[uuid.UUID]]] = None, 
 ) -> pd.DataFrame:
-    data: List[Dict[str, Any]] = []
     organism_to_classification = _get_taxonomy()
-    for query, matches in tqdm(query_to_matches.items()):
-        q_iso_a = db.isoforms[query.a]
-        q_iso_b = db.isoforms[query.b]
+
+    query_columns: Dict[Any, Dict[str, Any]] = {}
+    for a, b in tqdm(set(zip(matches["query_a"], matches["query_b"])), desc="query columns"):
+        q_iso_a = db.isoforms[a]
+        q_iso_b = db.isoforms[b]
         q_gene = db.genes[q_iso_a.gene_uuid]
-        query_as_types = None
-        if isoforms_to_duplicates is not None:
-            query_as_types = as_type.get_isoforms_as_types(db, isoforms_to_duplicates, q_iso_a.uuid, q_iso_b.uuid)
-        
-        for m in matches:
-            m_iso_a = db.isoforms[m.hit_isoforms.a]
-            m_iso_b = db.isoforms[m.hit_isoforms.b]
-            m_gene = db.genes[m_iso_a.gene_uuid]
-            m_record = db.records[m_gene.record_uuid]
-            m_file = db.files[m_record.file_uuid]
-            row = {
-                "organism": m_record.organism,
-                "hit_isoforms": m.hit_isoforms,
-                "hit_gene_id": m_gene.gene_id,
-                "hit_protein_ids": f"{m_iso_a.protein_id}, {m_iso_b.protein_id}",
-
-                "query_isoforms": query,
-                "query_gene_uuid": q_iso_a.gene_uuid,
-                "query_protein_ids": f"{q_iso_a.protein_id}, {q_iso_b.protein_id}",
-                "query_locus_tag": q_gene.locus_tag,
-                "query_gene_id": q_gene.gene_id,
-                "query_db_xref": q_gene.db_xref,
-
-                "conservative": int(m.predicted_positive),
-                "conservative_probability": m.predicted_positive_probability,
-                "db_name": m_file.db_name,
-            }
-
-            # if m.predicted_positive_probability > 0.5 and query_as_types is not None and isoforms_to_duplicates is not None :
-            hit_as_types = as_type.get_isoforms_as_types(db, isoforms_to_duplicates, m_iso_a.uuid, m_iso_b.uuid)
-            intersection_as_types = hit_as_types & query_as_types
-            row.update({
-                "hit_as_types": hit_as_types,
-                "hit_as_types_max": max([len(as_type) for as_type in hit_as_types], default=0),
-                "query_as_types": query_as_types,
-                "query_as_types_max": max([len(as_type) for as_type in query_as_types], default=0),
-                "intersection_as_types": intersection_as_types,
-                "intersection_as_types_len": len(intersection_as_types),
-            })
-
-            classification = organism_to_classification.get(m_record.organism)
-            if classification:
-                row["group"] = classification.group
-                row["order"] = classification.order
-                row["family"] = classification.family
-                row["group_with_brassicalis"] = classification.group
-                if classification.group == "dicots":
-                    row["group_with_brassicalis"] += " " + ("Brassicales" if classification.order == "Brassicales" else "NotBrassicales")
-
-            data.append(row)
-    df = pd.DataFrame(data)
+        query_columns[(a, b)] = {
+            "query_isoforms": IsoformTuple(a, b),
+            "query_gene_uuid": q_iso_a.gene_uuid,
+            "query_protein_ids": f"{q_iso_a.protein_id}, {q_iso_b.protein_id}",
+            "query_locus_tag": q_gene.locus_tag,
+            "query_gene_id": q_gene.gene_id,
+            "query_db_xref": q_gene.db_xref,
+            "query_as_types": as_type.get_isoforms_as_types(db, isoforms_to_duplicates, a, b),
+        }
+
+    hit_columns: Dict[Any, Dict[str, Any]] = {}
+    for a, b in tqdm(set(zip(matches["hit_a"], matches["hit_b"])), desc="hit columns"):
+        m_iso_a = db.isoforms[a]
+        m_iso_b = db.isoforms[b]
+        m_gene = db.genes[m_iso_a.gene_uuid]
+        m_record = db.records[m_gene.record_uuid]
+        hit_columns[(a, b)] = {
+            "organism": m_record.organism,
+            "hit_isoforms": IsoformTuple(a, b),
+            "hit_gene_id": m_gene.gene_id,
+            "hit_protein_ids": f"{m_iso_a.protein_id}, {m_iso_b.protein_id}",
+            "db_name": db.files[m_record.file_uuid].db_name,
+            "hit_as_types": as_type.get_isoforms_as_types(db, isoforms_to_duplicates, a, b),
+        }
+
+    query_df = pd.DataFrame([query_columns[q] for q in zip(matches["query_a"], matches["query_b"])], index=matches.index)
+    hit_df = pd.DataFrame([hit_columns[h] for h in zip(matches["hit_a"], matches["hit_b"])], index=matches.index)
+    df = pd.concat([hit_df, query_df], axis=1)
+    df["conservative"] = matches["positive"].astype(int)
+    df["conservative_probability"] = matches["probability"]
+    df["hit_as_types_max"] = df["hit_as_types"].map(lambda types: max([len(t) for t in types], default=0))
+    df["query_as_types_max"] = df["query_as_types"].map(lambda types: max([len(t) for t in types], default=0))
+    df["intersection_as_types"] = [h & q for h, q in zip(df["hit_as_types"], df["query_as_types"])]
+    df["intersection_as_types_len"] = df["intersection_as_types"].map(len)
+
+    df["group"] = df["organism"].map({o: c.group for o, c in organism_to_classification.items()})
+    df["order"] = df["organism"].map({o: c.order for o, c in organism_to_classification.items()})
+    df["family"] = df["organism"].map({o: c.family for o, c in organism_to_classification.items()})
+    df["group_with_brassicalis"] = df["organism"].map({
+        o: c.group + " " + ("Brassicales" if c.order == "Brassicales" else "NotBrassicales") if c.group == "dicots" else c.group
+        for o, c in organism_to_classification.items()
+    })
+
     df = df.sort_values(["conservative_probability", "conservative", "db_name"],
                         ascending=False).drop_duplicates(["query_isoforms", "organism"])
     return df
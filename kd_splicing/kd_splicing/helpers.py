@@ -8,12 +8,16 @@ from typing import Dict, List, Mapping, Optional, Tuple
 import pandas as pd
 
 from kd_common import excel, logutil, pathutil
-from kd_splicing import as_type, blast, database, features, ml, performance, pipeline
+from kd_splicing import as_type, blast, blast_shards, database, features, hitstore, ml, performance, pipeline
 from kd_splicing.dataset.models import Dataset
-from kd_splicing.dump import dump
+from kd_splicing.dump import DumpWriter, dump
 from kd_splicing.models import FormattedResults, IsoformTuple, Match, SimpleMatch, Queries
 from kd_splicing.models import SearchStatus
 from kd_splicing.exception import CustomException
+from kd_splicing import answers
+from kd_splicing.answers import AnswerStore
+from kd_splicing.blast_cache import BlastCache
+from kd_splicing.kmer_index import KmerIndex
 import itertools
 from tqdm import tqdm
 import json
@@ -83,20 +87,16 @@ def str_to_isoform_tuple(db: database.models.DB, protein_ids_str: str) -> Isofor
         db.protein_id_to_isoform[protein_ids[0]], db.protein_id_to_isoform[protein_ids[1]])
 def isoform_tuple_to_protein_ids(db: database.models.DB, iso_tuple: IsoformTuple) -> str:
     return f"{db.isoforms[iso_tuple.a].protein_id},{db.isoforms[iso_tuple.b].protein_id}"
-def tuples_to_queries(tuples: List[IsoformTuple], num_groups: int = 20) -> Queries:
+def tuples_to_queries(tuples: List[IsoformTuple], num_groups: int = 20, db: Optional[database.models.DB] = None) -> Queries:
     isoforms = sorted(list(set(chain.from_iterable(
         (query_isoforms.a, query_isoforms.b)
         for query_isoforms in tuples
     ))))
-    group_count = itertools.cycle(range(0, num_groups))
-    isoform_to_group = {}
-    isoform_to_idx = {}
-    group_size: Dict[int, int] = defaultdict(int)
-    for iso in isoforms:
-        group = next(group_count)
-        isoform_to_group[iso] = group
-        isoform_to_idx[iso] = group_size[group]
-        group_size[group] += 1
+    if db is not None:
+        lengths = {iso: len(db.isoforms[iso].translation) for iso in isoforms}
+    else:
+        lengths = {iso: 1 for iso in isoforms}
+    isoform_to_group, isoform_to_idx = blast.assign_groups(isoforms, lengths, num_groups)
     return Queries(
         tuples=tuples,
         isoforms=isoforms,
@@ -319,6 +319,30 @@ def search_custom(
 
     search(file_db, p, detector, [",".join(str(i.uuid) for i in isoforms)], blast_db_path, status = status, isoforms_to_duplicates = isoforms_to_duplicates)
 
+def build_answer_store(path: str, launch_folder: str, isoforms_to_duplicates: Mapping[uuid.UUID, List[uuid.UUID]]) -> None:
+    answers.build(path, features.read_matches_df(launch_folder), isoforms_to_duplicates)
+
+def precomputed_matches(
+    db: database.models.DB,
+    answer_store: AnswerStore,
+    query: IsoformTuple,
+    taxonomy: Optional[List[str]] = None,
+) -> Optional[List[Match]]:
+    simple_matches = answer_store.get(query)
+    if simple_matches is None:
+        return None
+    matches = [m for m in features.convert_matches({query: simple_matches}) if in_taxonomy(db, m, taxonomy)]
+    for m in matches:
+        hit_gene = db.genes[db.isoforms[m.hit_isoforms.a].gene_uuid]
+        m.hit_organism = db.records[hit_gene.record_uuid].organism
+    return matches
+
+def in_taxonomy(db: database.models.DB, m: Match, taxonomy: Optional[List[str]]) -> bool:
+    if not taxonomy:
+        return True
+    record = db.records[db.genes[db.isoforms[m.hit_isoforms.a].gene_uuid].record_uuid]
+    return record.organism in taxonomy or any(t in taxonomy for t in record.taxonomy)
+
 def search(
     db: database.models.DB,
     p: pipeline.Pipeline,
@@ -327,12 +351,44 @@ def search(
     blast_db_path: str,
     status: SearchStatus = SearchStatus.construct(progress = 0, description = ""),
     isoforms_to_duplicates: Optional[Mapping[uuid.UUID, List[uuid.UUID]]] = None,
+    answer_store: Optional[AnswerStore] = None,
+    taxonomy: Optional[List[str]] = None,
 ) -> str:
     status.set(0, "Preparing queries")
     tuples = [str_to_isoform_tuple(db, query_proteins) for query_proteins in query_protein_ids_str]
-    queries = tuples_to_queries(tuples, num_groups=1)
     name = ";".join(query_protein_ids_str)
-    return search_queries(db, p, detector, queries, name, blast_db_path, status, isoforms_to_duplicates)
+
+    precomputed: List[Match] = []
+    if answer_store is not None:
+        missing = []
+        for t in tuples:
+            matches = precomputed_matches(db, answer_store, t, taxonomy)
+            if matches is None:
+                missing.append(t)
+            else:
+                precomputed.extend(matches)
+        _logger.info(f"Precomputed answers for {len(tuples) - len(missing)} of {len(tuples)} queries")
+        if not missing:
+            result_folder = pathutil.create_folder(p.launch_folder, "search_single", name)
+            status.set(50, "Preparing results")
+            dump(db, result_folder, precomputed, isoforms_to_duplicates)
+            return result_folder
+        tuples = missing
+
+    queries = tuples_to_queries(tuples, num_groups=1, db=db)
+    return search_queries(db, p, detector, queries, name, blast_db_path, status, isoforms_to_duplicates, precomputed=precomputed, taxonomy=taxonomy)
+
+
+_blast_db_indexes: Dict[str, KmerIndex] = {}
+
+
+def blast_db_index(blast_db_path: str) -> KmerIndex:
+    folder = os.path.dirname(blast_db_path)
+    index = _blast_db_indexes.get(folder)
+    if index is None:
+        index = _blast_db_indexes[folder] = KmerIndex(folder)
+    return index
+
 def search_queries(
     db: database.models.DB,
     p: pipeline.Pipeline,
@@ -342,21 +398,48 @@ def search_queries(
     blast_db_path: str,
     status: SearchStatus,
     isoforms_to_duplicates: Optional[Mapping[uuid.UUID, List[uuid.UUID]]] = None,
+    cache: Optional[BlastCache] = None,
+    precomputed: Optional[List[Match]] = None,
+    taxonomy: Optional[List[str]] = None,
+    prefilter: bool = False,
+    gene_level: bool = False,
+    runner: blast.BlastRunner = blast.blastp,
+    prune: bool = False,
 ) -> str:
     status.set(10, "BLAST running")
-    blast.create_queires(db, queries, p.launch_folder)
-    blast.run(p.launch_folder, blast_db_path, parallel = False)
+    if prefilter:
+        dbsize = blast_shards.residues(blast_shards.restrict(blast_db_path, taxonomy))
+        blast.run_prefiltered(db, queries, p.launch_folder, blast_db_index(blast_db_path), parallel = False, taxonomy = taxonomy, cache = cache, dbsize = dbsize)
+    elif gene_level:
+        restricted_path = blast_shards.restrict(blast_db_path, taxonomy)
+        blast.run_gene_level(db, queries, p.launch_folder, restricted_path, blast_db_index(blast_db_path), parallel = False, runner = runner, dbsize = blast_shards.residues(restricted_path))
+    else:
+        blast_db_path = blast_shards.restrict(blast_db_path, taxonomy)
+        if cache is None:
+            blast.create_queires(db, queries, p.launch_folder)
+            blast.run(p.launch_folder, blast_db_path, parallel = False, runner = runner)
+        else:
+            blast.run_cached(db, queries, p.launch_folder, blast_db_path, cache, parallel = False, runner = runner)
     status.set(20, "Reading BLAST results")
     queries.isoform_to_file = get_isoforms_to_file(p.launch_folder)
 
+    result_folder = pathutil.create_folder(p.launch_folder, "search_single", name)
+    writer = DumpWriter(db, result_folder, isoforms_to_duplicates)
+    if precomputed:
+        query_to_precomputed: Dict[IsoformTuple, List[Match]] = defaultdict(list)
+        for m in precomputed:
+            query_to_precomputed[m.query_isoforms].append(m)
+        for query_isoforms, query_matches in query_to_precomputed.items():
+            writer.add(query_isoforms, query_matches)
+
     status.set(30, "Calculating features")
-    matches = features.calc(db, p.launch_folder, queries)
-    status.set(40, "Running ml model")
-    detector.transform(matches)
+    total = len(queries.tuples)
+    for i, (query_isoforms, query_matches) in enumerate(features.iter_calc(db, p.launch_folder, queries, detector=detector, prune=prune)):
+        writer.add(query_isoforms, query_matches)
+        status.set(30 + 20 * (i + 1) // total, f"Calculated {i + 1} of {total} queries")
 
-    result_folder = pathutil.create_folder(p.launch_folder, "search_single", name)
     status.set(50, "Preparing results")
-    dump(db, result_folder, matches, isoforms_to_duplicates)
+    writer.close()
     return result_folder
 def matches_to_df(
     db: database.models.DB,
@@ -421,16 +504,6 @@ def matches_to_df(
     df = pd.DataFrame(data)
     return df
 def get_isoforms_to_file(launch_folder: str) -> Mapping[uuid.UUID, str]:
-    results_folder = pathutil.create_folder(launch_folder, "blast_results")
-    isoforms_to_file: Dict[uuid.UUID, str] = {}
-    for group_folder in tqdm(pathutil.get_sub_directories(results_folder)):
-        for result_file in pathutil.file_list(group_folder, ".json"):
-            with open(result_file, "r") as f:
-                try:
-                    data = json.load(f)
-                except Exception as e:
-                    _logger.exception("exception in file result file")
-                    continue
-                query_iso_str = data["BlastOutput2"]["report"]["results"]["search"]["query_title"]
-                isoforms_to_file[uuid.UUID(query_iso_str)] = result_file
-    return isoforms_to_file
\ No newline at end of file
+    if not hitstore.exists(launch_folder):
+        hitstore.build(launch_folder)
+    return hitstore.HitStore(launch_folder).query_to_file()
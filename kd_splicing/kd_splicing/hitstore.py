@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import json
+import os
+import uuid
+import zlib
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from kd_common import logutil, pathutil
+from kd_splicing import blast_members
+from kd_splicing.exception import BlastException
+
+_logger = logutil.get_logger(__name__)
+
+_QUERY_DTYPE = np.dtype([
+    ("uuid", "V16"),
+    ("query_len", "i4"),
+    ("hit_start", "i8"),
+    ("hit_end", "i8"),
+    ("block_start", "i8"),
+    ("block_end", "i8"),
+])
+
+_HIT_DTYPE = np.dtype([
+    ("iso_uuid", "V16"),
+    ("score", "f8"),
+    ("query_from", "i4"),
+    ("query_to", "i4"),
+    ("hit_from", "i4"),
+    ("hit_to", "i4"),
+    ("align_len", "i4"),
+    ("seq_offset", "i4"),
+])
+
+
+@dataclass
+class RawHit:
+    __slots__ = "iso_uuid", "score", "query_from", "query_to", "hit_from", "hit_to", "qseq", "hseq", "midline"
+    iso_uuid: uuid.UUID
+    score: float
+    query_from: int
+    query_to: int
+    hit_from: int
+    hit_to: int
+    qseq: bytes
+    hseq: bytes
+    midline: bytes
+
+
+def store_folder(launch_folder: str) -> str:
+    return os.path.join(launch_folder, "hit_store")
+
+
+def exists(launch_folder: str) -> bool:
+    return os.path.exists(os.path.join(store_folder(launch_folder), "queries.npy"))
+
+
+def results_files(launch_folder: str) -> List[str]:
+    results_folder = pathutil.create_folder(launch_folder, "blast_results")
+    return [
+        result_file
+        for group_folder in sorted(pathutil.get_sub_directories(results_folder))
+        for result_file in sorted(pathutil.file_list(group_folder, ".json"))
+    ]
+
+
+def _append_results(
+    result_files: List[str],
+    members: Mapping[uuid.UUID, List[uuid.UUID]],
+    seqs: BinaryIO,
+    queries: List[Tuple[Any, ...]],
+    hits: List[Tuple[Any, ...]],
+    files: List[str],
+    block_pos: int,
+) -> int:
+    for result_file in tqdm(result_files, desc="build hit store"):
+        with open(result_file, "r") as f:
+            try:
+                search = json.load(f)["BlastOutput2"]["report"]["results"]["search"]
+            except (ValueError, KeyError, TypeError) as e:
+                raise BlastException(f"Unreadable result file {result_file}") from e
+        block = bytearray()
+        hit_start = len(hits)
+        for hit in search.get("hits", []):
+            hsps = hit["hsps"][0]
+            qseq = hsps["qseq"].encode()
+            hseq = hsps["hseq"].encode()
+            midline = hsps["midline"].encode()
+            assert len(qseq) == len(hseq) == len(midline)
+            for iso_uuid in blast_members.expand(members, uuid.UUID(hit["description"][0]["title"])):
+                hits.append((
+                    iso_uuid.bytes,
+                    hsps["bit_score"],
+                    hsps["query_from"] - 1,
+                    hsps["query_to"],
+                    hsps["hit_from"] - 1,
+                    hsps["hit_to"],
+                    len(qseq),
+                    len(block),
+                ))
+            block += qseq + hseq + midline
+        compressed = zlib.compress(bytes(block))
+        seqs.write(compressed)
+        queries.append((
+            uuid.UUID(search["query_title"]).bytes,
+            search.get("query_len", 0),
+            hit_start,
+            len(hits),
+            block_pos,
+            block_pos + len(compressed),
+        ))
+        files.append(result_file)
+        block_pos += len(compressed)
+    return block_pos
+
+
+def _save(folder: str, queries: List[Tuple[Any, ...]], hits: List[Tuple[Any, ...]], files: List[str], block_pos: int) -> None:
+    np.save(os.path.join(folder, "hits.npy"), np.array(hits, dtype=_HIT_DTYPE))
+    np.save(os.path.join(folder, "queries.npy"), np.array(queries, dtype=_QUERY_DTYPE))
+    np.save(os.path.join(folder, "files.npy"), np.array(files, dtype=str))
+    _logger.info(f"Hit store: {len(queries)} queries, {len(hits)} hits, {block_pos} bytes of sequences")
+
+
+def build(launch_folder: str) -> None:
+    folder = store_folder(launch_folder)
+    pathutil.reset_folder(folder)
+    queries: List[Tuple[Any, ...]] = []
+    hits: List[Tuple[Any, ...]] = []
+    files: List[str] = []
+    members = blast_members.load_for_launch(launch_folder)
+    with open(os.path.join(folder, "seqs.bin"), "wb") as seqs:
+        block_pos = _append_results(results_files(launch_folder), members, seqs, queries, hits, files, 0)
+    _save(folder, queries, hits, files, block_pos)
+
+
+def extend(launch_folder: str, result_files: List[str]) -> None:
+    folder = store_folder(launch_folder)
+    queries = np.load(os.path.join(folder, "queries.npy")).tolist()
+    hits = np.load(os.path.join(folder, "hits.npy")).tolist()
+    files = np.load(os.path.join(folder, "files.npy")).tolist()
+    members = blast_members.load_for_launch(launch_folder)
+    seqs_path = os.path.join(folder, "seqs.bin")
+    with open(seqs_path, "ab") as seqs:
+        block_pos = _append_results(result_files, members, seqs, queries, hits, files, os.path.getsize(seqs_path))
+    _save(folder, queries, hits, files, block_pos)
+
+
+class HitStore:
+    def __init__(self, launch_folder: str) -> None:
+        folder = store_folder(launch_folder)
+        self.queries = np.load(os.path.join(folder, "queries.npy"), mmap_mode="r")
+        self.hits = np.load(os.path.join(folder, "hits.npy"), mmap_mode="r")
+        self.files = np.load(os.path.join(folder, "files.npy"))
+        self.seqs_path = os.path.join(folder, "seqs.bin")
+        self.query_to_idx: Dict[uuid.UUID, int] = {
+            uuid.UUID(bytes=bytes(q)): i
+            for i, q in enumerate(self.queries["uuid"])
+        }
+
+    def __contains__(self, query_uuid: uuid.UUID) -> bool:
+        return query_uuid in self.query_to_idx
+
+    def __len__(self) -> int:
+        return len(self.query_to_idx)
+
+    def query_to_file(self) -> Mapping[uuid.UUID, str]:
+        return {q: str(self.files[i]) for q, i in self.query_to_idx.items()}
+
+    def query_len(self, query_uuid: uuid.UUID) -> int:
+        return int(self.queries[self.query_to_idx[query_uuid]]["query_len"])
+
+    def hit_isoforms(self, query_uuid: uuid.UUID) -> List[uuid.UUID]:
+        idx = self.query_to_idx.get(query_uuid)
+        if idx is None:
+            return []
+        q = self.queries[idx]
+        return [uuid.UUID(bytes=bytes(b)) for b in self.hits["iso_uuid"][int(q["hit_start"]):int(q["hit_end"])]]
+
+    def get(self, query_uuid: uuid.UUID) -> Optional[List[RawHit]]:
+        idx = self.query_to_idx.get(query_uuid)
+        if idx is None:
+            return None
+        q = self.queries[idx]
+        with open(self.seqs_path, "rb") as f:
+            f.seek(int(q["block_start"]))
+            block = zlib.decompress(f.read(int(q["block_end"] - q["block_start"])))
+        result = []
+        for h in self.hits[int(q["hit_start"]):int(q["hit_end"])].tolist():
+            iso_uuid, score, query_from, query_to, hit_from, hit_to, align_len, offset = h
+            result.append(RawHit(
+                iso_uuid=uuid.UUID(bytes=iso_uuid),
+                score=score,
+                query_from=query_from,
+                query_to=query_to,
+                hit_from=hit_from,
+                hit_to=hit_to,
+                qseq=block[offset:offset + align_len],
+                hseq=block[offset + align_len:offset + 2 * align_len],
+                midline=block[offset + 2 * align_len:offset + 3 * align_len],
+            ))
+        return result
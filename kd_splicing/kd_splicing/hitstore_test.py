@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+import unittest
+import uuid
+
+from kd_common import pathutil
+from kd_splicing import blast_members, hitstore
+from kd_splicing.exception import BlastException
+
+
+def _report(query_uuid: uuid.UUID, hits: list) -> dict:
+    return {"BlastOutput2": {"report": {"results": {"search": {
+        "query_title": str(query_uuid),
+        "query_len": 12,
+        "hits": [
+            {
+                "description": [{"title": str(iso_uuid)}],
+                "hsps": [{
+                    "bit_score": 42.5,
+                    "query_from": 2,
+                    "query_to": 6,
+                    "hit_from": 1,
+                    "hit_to": 4,
+                    "qseq": qseq,
+                    "hseq": hseq,
+                    "midline": midline,
+                }],
+            }
+            for iso_uuid, qseq, hseq, midline in hits
+        ],
+    }}}}}
+
+
+class HitStoreTestCase(unittest.TestCase):
+    def test_build_and_read(self) -> None:
+        query_a = uuid.UUID(int=1)
+        query_b = uuid.uuid4()
+        iso_a = uuid.UUID(int=2 << 120)
+        iso_b = uuid.uuid4()
+        with tempfile.TemporaryDirectory() as launch_folder:
+            group_folder = pathutil.create_folder(launch_folder, "blast_results", "group_0")
+            file_a = os.path.join(group_folder, "result_1.json")
+            file_b = os.path.join(group_folder, "result_2.json")
+            with open(file_a, "w") as f:
+                json.dump(_report(query_a, [(iso_a, "MK-LV", "MKALI", "MK L+"), (iso_b, "AC", "AC", "AC")]), f)
+            with open(file_b, "w") as f:
+                json.dump(_report(query_b, []), f)
+
+            hitstore.build(launch_folder)
+            self.assertTrue(hitstore.exists(launch_folder))
+            store = hitstore.HitStore(launch_folder)
+
+            self.assertEqual(store.query_to_file(), {query_a: file_a, query_b: file_b})
+            self.assertEqual(store.query_len(query_a), 12)
+            self.assertEqual(store.get(query_b), [])
+            self.assertIsNone(store.get(uuid.uuid4()))
+
+            self.assertEqual(store.hit_isoforms(query_a), [iso_a, iso_b])
+            self.assertEqual(store.hit_isoforms(uuid.uuid4()), [])
+
+            hits = store.get(query_a)
+            self.assertEqual([h.iso_uuid for h in hits], [iso_a, iso_b])
+            self.assertEqual((hits[0].qseq, hits[0].hseq, hits[0].midline), (b"MK-LV", b"MKALI", b"MK L+"))
+            self.assertEqual((hits[1].qseq, hits[1].hseq, hits[1].midline), (b"AC", b"AC", b"AC"))
+            self.assertEqual((hits[0].score, hits[0].query_from, hits[0].query_to, hits[0].hit_from, hits[0].hit_to), (42.5, 1, 6, 0, 4))
+
+    def test_expand_collapsed_sequences(self) -> None:
+        query = uuid.uuid4()
+        seq_id = uuid.uuid4()
+        members = [uuid.UUID(int=3), uuid.UUID(int=4)]
+        with tempfile.TemporaryDirectory() as launch_folder:
+            group_folder = pathutil.create_folder(launch_folder, "blast_results", "group_0")
+            with open(os.path.join(group_folder, "result_1.json"), "w") as f:
+                json.dump(_report(query, [(seq_id, "MK", "MK", "MK")]), f)
+            blast_members.write(os.path.join(launch_folder, "blast_members.json"), {seq_id: members})
+
+            hitstore.build(launch_folder)
+            hits = hitstore.HitStore(launch_folder).get(query)
+            self.assertEqual([h.iso_uuid for h in hits], members)
+            self.assertEqual([h.hseq for h in hits], [b"MK", b"MK"])
+
+    def test_extend(self) -> None:
+        query_a, query_b = uuid.uuid4(), uuid.uuid4()
+        iso_a, iso_b = uuid.uuid4(), uuid.uuid4()
+        with tempfile.TemporaryDirectory() as launch_folder:
+            group_folder = pathutil.create_folder(launch_folder, "blast_results", "group_0")
+            with open(os.path.join(group_folder, "result_1.json"), "w") as f:
+                json.dump(_report(query_a, [(iso_a, "MK", "MK", "MK")]), f)
+            hitstore.build(launch_folder)
+
+            extra_folder = pathutil.create_folder(launch_folder, "blast_results", "group_realigned")
+            extra_file = os.path.join(extra_folder, "result_1.json")
+            with open(extra_file, "w") as f:
+                json.dump(_report(query_b, [(iso_b, "LV-", "LVA", "LV ")]), f)
+            hitstore.extend(launch_folder, [extra_file])
+
+            store = hitstore.HitStore(launch_folder)
+            self.assertEqual(len(store), 2)
+            self.assertEqual(store.query_to_file()[query_b], extra_file)
+            self.assertEqual([(h.iso_uuid, h.qseq) for h in store.get(query_a)], [(iso_a, b"MK")])
+            self.assertEqual([(h.iso_uuid, h.qseq, h.midline) for h in store.get(query_b)], [(iso_b, b"LV-", b"LV ")])
+
+    def test_build_fails_on_unreadable_result(self) -> None:
+        with tempfile.TemporaryDirectory() as launch_folder:
+            group_folder = pathutil.create_folder(launch_folder, "blast_results", "group_0")
+            with open(os.path.join(group_folder, "result_1.json"), "w") as f:
+                f.write('{"BlastOutput2": {"report": {}')
+            with self.assertRaises(BlastException):
+                hitstore.build(launch_folder)
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import uuid
+from collections import defaultdict
+from typing import TYPE_CHECKING, Callable, Dict, List, Mapping, Optional, Sequence, Set
+
+import numpy as np
+from tqdm import tqdm
+
+from kd_common import logutil, pathutil
+from kd_splicing import database, hitstore
+
+if TYPE_CHECKING:
+    from kd_splicing.dataset.models import Dataset
+
+_logger = logutil.get_logger(__name__)
+
+K = 5
+_ALPHABET = "ACDEFGHIKLMNPQRSTVWY"
+_UNKNOWN = len(_ALPHABET)
+_BASE = len(_ALPHABET) + 1
+_ENCODE = np.full(256, _UNKNOWN, dtype=np.int32)
+for _i, _c in enumerate(_ALPHABET):
+    _ENCODE[ord(_c)] = _i
+    _ENCODE[ord(_c.lower())] = _i
+
+
+def kmers(translation: str, k: int = K) -> np.ndarray:
+    codes = _ENCODE[np.frombuffer(translation.encode(), dtype=np.uint8)]
+    if len(codes) < k:
+        return np.empty(0, dtype=np.int32)
+    windows = np.lib.stride_tricks.sliding_window_view(codes, k)
+    valid = (windows != _UNKNOWN).all(axis=1)
+    weights = _BASE ** np.arange(k - 1, -1, -1, dtype=np.int32)
+    return np.unique((windows[valid] * weights).sum(axis=1, dtype=np.int32))
+
+
+def index_folder(folder: str) -> str:
+    return os.path.join(folder, "kmer_index")
+
+
+def exists(folder: str) -> bool:
+    return os.path.exists(os.path.join(index_folder(folder), "kmers.npy"))
+
+
+def version(folder: str) -> str:
+    h = hashlib.sha1()
+    for path in sorted(pathutil.file_list(index_folder(folder))):
+        stat = os.stat(path)
+        h.update(f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)};".encode())
+    return h.hexdigest()
+
+
+def build(isoforms: Sequence[database.models.Isoform], folder: str, k: int = K) -> None:
+    folder = index_folder(folder)
+    pathutil.reset_folder(folder)
+    gene_to_idx: Dict[uuid.UUID, int] = {}
+    iso_genes = np.empty(len(isoforms), dtype=np.int32)
+    codes: List[np.ndarray] = []
+    owners: List[np.ndarray] = []
+    for i, iso in enumerate(tqdm(isoforms, desc="build kmer index")):
+        gene = gene_to_idx.setdefault(iso.gene_uuid, len(gene_to_idx))
+        iso_genes[i] = gene
+        iso_kmers = kmers(iso.translation, k)
+        codes.append(iso_kmers)
+        owners.append(np.full(len(iso_kmers), gene, dtype=np.int32))
+
+    num_genes = max(len(gene_to_idx), 1)
+    pairs = np.unique(np.concatenate(codes).astype(np.int64) * num_genes + np.concatenate(owners))
+    keys, starts = np.unique(pairs // num_genes, return_index=True)
+    offsets = np.append(starts, len(pairs)).astype(np.int64)
+
+    np.save(os.path.join(folder, "kmers.npy"), keys.astype(np.int32))
+    np.save(os.path.join(folder, "offsets.npy"), offsets)
+    np.save(os.path.join(folder, "postings.npy"), (pairs % num_genes).astype(np.int32))
+    np.save(os.path.join(folder, "genes.npy"), np.array([g.bytes for g in gene_to_idx], dtype="V16"))
+    np.save(os.path.join(folder, "isoforms.npy"), np.array([iso.uuid.bytes for iso in isoforms], dtype="V16"))
+    np.save(os.path.join(folder, "isoform_genes.npy"), iso_genes)
+    np.save(os.path.join(folder, "meta.npy"), np.array([k, sum(len(t) for t in {iso.translation for iso in isoforms})], dtype=np.int64))
+    _logger.info(f"Kmer index: {len(keys)} kmers, {len(pairs)} postings, {len(gene_to_idx)} genes")
+
+
+class KmerIndex:
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        folder = index_folder(folder)
+        self.k, self.residues = (int(v) for v in np.load(os.path.join(folder, "meta.npy")))
+        self.kmers = np.load(os.path.join(folder, "kmers.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode="r")
+        self.postings = np.load(os.path.join(folder, "postings.npy"), mmap_mode="r")
+        self.genes = [uuid.UUID(bytes=bytes(g)) for g in np.load(os.path.join(folder, "genes.npy"))]
+        isoforms = np.load(os.path.join(folder, "isoforms.npy"))
+        isoform_genes = np.load(os.path.join(folder, "isoform_genes.npy"))
+        self.gene_to_isoforms: Dict[uuid.UUID, List[uuid.UUID]] = defaultdict(list)
+        for iso, gene in zip(isoforms, isoform_genes):
+            self.gene_to_isoforms[self.genes[gene]].append(uuid.UUID(bytes=bytes(iso)))
+
+    def scores(self, translation: str) -> np.ndarray:
+        query = kmers(translation, self.k)
+        pos = np.searchsorted(self.kmers, query)
+        inside = pos < len(self.kmers)
+        pos = pos[inside]
+        pos = pos[self.kmers[pos] == query[inside]]
+        if not len(pos):
+            return np.zeros(len(self.genes), dtype=np.int64)
+        starts = self.offsets[pos]
+        ends = self.offsets[pos + 1]
+        lengths = ends - starts
+        idx = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.bincount(self.postings[idx], minlength=len(self.genes))
+
+    def candidates(self, translation: str, max_candidates: int = 2000, min_shared: int = 2) -> List[uuid.UUID]:
+        scores = self.scores(translation)
+        passed = np.flatnonzero(scores >= min_shared)
+        if len(passed) > max_candidates:
+            passed = passed[np.argpartition(-scores[passed], max_candidates - 1)[:max_candidates]]
+        passed = passed[np.argsort(-scores[passed], kind="stable")]
+        return [self.genes[g] for g in passed]
+
+    def candidate_isoforms(
+        self,
+        translation: str,
+        max_candidates: int = 2000,
+        min_shared: int = 2,
+        gene_filter: Optional[Callable[[uuid.UUID], bool]] = None,
+    ) -> List[uuid.UUID]:
+        return [
+            iso
+            for gene in self.candidates(translation, max_candidates, min_shared)
+            if gene_filter is None or gene_filter(gene)
+            for iso in self.gene_to_isoforms[gene]
+        ]
+
+
+def recall(
+    db: database.models.DB,
+    index: KmerIndex,
+    dataset: Dataset,
+    max_candidates: int = 2000,
+    min_shared: int = 2,
+    blast_hits: Optional[Mapping[uuid.UUID, Set[uuid.UUID]]] = None,
+) -> Mapping[str, float]:
+    query_to_genes: Dict[uuid.UUID, Set[uuid.UUID]] = {}
+
+    def _candidates(iso: uuid.UUID) -> Set[uuid.UUID]:
+        genes = query_to_genes.get(iso)
+        if genes is None:
+            genes = set(index.candidates(db.isoforms[iso].translation, max_candidates, min_shared))
+            query_to_genes[iso] = genes
+        return genes
+
+    found = 0
+    positives = [m for m in dataset.matches if m.positive]
+    for m in tqdm(positives, desc="kmer recall"):
+        hit_gene = db.isoforms[m.hit.a].gene_uuid
+        if hit_gene in _candidates(m.query.a) and hit_gene in _candidates(m.query.b):
+            found += 1
+    result = {
+        "dataset_pairs": len(positives),
+        "dataset_recall": found / len(positives) if positives else 0.,
+        "mean_candidates": float(np.mean([len(g) for g in query_to_genes.values()])) if query_to_genes else 0.,
+    }
+    if blast_hits is not None:
+        blast_genes = 0
+        blast_found = 0
+        for iso, hit_genes in blast_hits.items():
+            candidates = _candidates(iso)
+            blast_genes += len(hit_genes)
+            blast_found += len(hit_genes & candidates)
+        result["blast_recall"] = blast_found / blast_genes if blast_genes else 0.
+    _logger.info(f"Kmer prefilter recall: {result}")
+    return result
+
+
+def blast_hit_genes(db: database.models.DB, launch_folder: str) -> Dict[uuid.UUID, Set[uuid.UUID]]:
+    store = hitstore.HitStore(launch_folder)
+    return {
+        query: {db.isoforms[h.iso_uuid].gene_uuid for h in store.get(query) or [] if h.iso_uuid in db.isoforms}
+        for query in store.query_to_idx
+    }
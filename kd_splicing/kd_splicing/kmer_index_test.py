@@ -0,0 +1,43 @@
+import tempfile
+import unittest
+import uuid
+
+import numpy as np
+
+from kd_splicing import kmer_index
+from kd_splicing.database.models import Isoform
+
+
+class KmerIndexTestCase(unittest.TestCase):
+    def test_kmers(self) -> None:
+        self.assertEqual(len(kmer_index.kmers("MKVLA", 5)), 1)
+        self.assertEqual(len(kmer_index.kmers("MKVLAMKVLA", 5)), 5)
+        self.assertEqual(len(kmer_index.kmers("MKXLAG", 5)), 0)
+        self.assertEqual(len(kmer_index.kmers("MKV", 5)), 0)
+
+    def test_candidates(self) -> None:
+        isoforms = [
+            Isoform(uuid.UUID(int=i), uuid.UUID(int=gene), None, None, None, translation, None, None)
+            for i, gene, translation in (
+                (1, 100, "MKVLAGHTREWQPLKDA"),
+                (2, 100, "MKVLAGHTREWQ"),
+                (3, 200, "GHTREWQPLKNNNNN"),
+                (4, 300, "CCCCCCCCCCCCC"),
+            )
+        ]
+        with tempfile.TemporaryDirectory() as folder:
+            kmer_index.build(isoforms, folder)
+            self.assertTrue(kmer_index.exists(folder))
+            index = kmer_index.KmerIndex(folder)
+            self.assertEqual(index.residues, sum(len(i.translation) for i in isoforms))
+
+            scores = index.scores("MKVLAGHTREWQPLK")
+            self.assertEqual(scores.tolist(), [11, 6, 0])
+            self.assertEqual(index.candidates("MKVLAGHTREWQPLK"), [uuid.UUID(int=100), uuid.UUID(int=200)])
+            self.assertEqual(index.candidates("MKVLAGHTREWQPLK", max_candidates=1), [uuid.UUID(int=100)])
+            self.assertEqual(index.candidate_isoforms("MKVLAGHTREWQPLK", min_shared=7), [uuid.UUID(int=1), uuid.UUID(int=2)])
+            self.assertEqual(
+                index.candidate_isoforms("MKVLAGHTREWQPLK", gene_filter=lambda gene: gene != uuid.UUID(int=100)),
+                [uuid.UUID(int=3)],
+            )
+            self.assertTrue(np.array_equal(index.scores("WWWWW"), [0, 0, 0]))
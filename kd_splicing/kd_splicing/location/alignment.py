@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import re
+from typing import List
+
+import numpy as np
+
+from kd_splicing.location.arrays import SegmentArray
+from kd_splicing.location.models import ConvertSegment
+
+_RESIDUE_RUN = re.compile(r"[^-]+")
+
+
+class AlignmentMap:
+    __slots__ = ("src_from", "src_len", "alignment_len", "segments")
+
+    def __init__(self, alignment: str, src_from: int, src_len: int) -> None:
+        self.src_from = src_from
+        self.src_len = src_len
+        self.alignment_len = len(alignment)
+
+        src_starts = [0]
+        src_ends = [src_from]
+        dst_starts = [-src_from]
+        src_pos = src_from
+        dst_end = 0
+        for run in _RESIDUE_RUN.finditer(alignment):
+            dst_start, dst_end = run.span()
+            src_starts.append(src_pos)
+            src_pos += dst_end - dst_start
+            src_ends.append(src_pos)
+            dst_starts.append(dst_start)
+        if dst_end == self.alignment_len and len(src_starts) > 1:
+            src_ends[-1] = src_len
+        else:
+            src_starts.append(src_pos)
+            src_ends.append(src_len)
+            dst_starts.append(self.alignment_len)
+
+        self.segments = SegmentArray(
+            src_starts=np.array(src_starts, dtype=np.int64),
+            src_ends=np.array(src_ends, dtype=np.int64),
+            dst_starts=np.array(dst_starts, dtype=np.int64),
+        )
+
+    def to_segments(self) -> List[ConvertSegment]:
+        return self.segments.to_segments()
@@ -0,0 +1,27 @@
+import unittest
+
+from kd_splicing.location.alignment import AlignmentMap
+from kd_splicing.location.models import ConvertSegment
+
+
+class AlignmentMapTestCase(unittest.TestCase):
+    def test_segments(self) -> None:
+        m = AlignmentMap("S-SD---KSD-", 3, 30)
+        correct = [
+            ConvertSegment(src_start=0, src_end=3, dst_start=-3),
+            ConvertSegment(src_start=3, src_end=4, dst_start=0),
+            ConvertSegment(src_start=4, src_end=6, dst_start=2),
+            ConvertSegment(src_start=6, src_end=9, dst_start=7),
+            ConvertSegment(src_start=9, src_end=30, dst_start=11)
+        ]
+        self.assertEqual(correct, m.to_segments())
+
+    def test_segments_without_gaps(self) -> None:
+        self.assertEqual(AlignmentMap("SD", 1, 4).to_segments(), [
+            ConvertSegment(src_start=0, src_end=1, dst_start=-1),
+            ConvertSegment(src_start=1, src_end=4, dst_start=0),
+        ])
+        self.assertEqual(AlignmentMap("", 1, 4).to_segments(), [
+            ConvertSegment(src_start=0, src_end=1, dst_start=-1),
+            ConvertSegment(src_start=1, src_end=4, dst_start=0),
+        ])
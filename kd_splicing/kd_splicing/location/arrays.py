@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from kd_splicing.location.models import ConvertSegment, Location, LocationPart
+
+# Kernels below expect parts of a single location to be pairwise disjoint,
+# which is what the event sweeps in location.utils rely on as well.
+
+
+@dataclass
+class LocationArray:
+    starts: np.ndarray
+    ends: np.ndarray
+    strand: Optional[int] = None
+    labels: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def length(self) -> int:
+        return int((self.ends - self.starts).sum())
+
+    @staticmethod
+    def empty(strand: Optional[int] = None) -> LocationArray:
+        return LocationArray(
+            starts=np.empty(0, dtype=np.int64),
+            ends=np.empty(0, dtype=np.int64),
+            strand=strand,
+        )
+
+    @staticmethod
+    def from_location(loc: Location) -> LocationArray:
+        n = len(loc.parts)
+        return LocationArray(
+            starts=np.fromiter((p.start for p in loc.parts), dtype=np.int64, count=n),
+            ends=np.fromiter((p.end for p in loc.parts), dtype=np.int64, count=n),
+            strand=loc.parts[0].strand if n else None,
+        )
+
+    def to_location(self) -> Location:
+        return Location([
+            LocationPart(start, end, self.strand)
+            for start, end in zip(self.starts.tolist(), self.ends.tolist())
+        ])
+
+
+@dataclass
+class SegmentArray:
+    src_starts: np.ndarray
+    src_ends: np.ndarray
+    dst_starts: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.src_starts)
+
+    @staticmethod
+    def from_segments(segments: List[ConvertSegment]) -> SegmentArray:
+        n = len(segments)
+        return SegmentArray(
+            src_starts=np.fromiter((s.src_start for s in segments), dtype=np.int64, count=n),
+            src_ends=np.fromiter((s.src_end for s in segments), dtype=np.int64, count=n),
+            dst_starts=np.fromiter((s.dst_start for s in segments), dtype=np.int64, count=n),
+        )
+
+    def to_segments(self) -> List[ConvertSegment]:
+        return [
+            ConvertSegment(src_start=s, src_end=e, dst_start=d)
+            for s, e, d in zip(self.src_starts.tolist(), self.src_ends.tolist(), self.dst_starts.tolist())
+        ]
+
+
+def _sort_order(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    return np.lexsort((ends, starts))
+
+
+def covering(loc: LocationArray, positions: np.ndarray) -> np.ndarray:
+    if not len(loc):
+        return np.full(len(positions), -1, dtype=np.intp)
+    order = _sort_order(loc.starts, loc.ends)
+    starts = loc.starts[order]
+    ends = loc.ends[order]
+    idx = np.searchsorted(starts, positions, side="right") - 1
+    safe = np.maximum(idx, 0)
+    found = (idx >= 0) & (ends[safe] > positions)
+    return np.where(found, order[safe], -1)
+
+
+def _elementary(a: LocationArray, b: LocationArray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    bounds = np.unique(np.concatenate((a.starts, a.ends, b.starts, b.ends)))
+    left = bounds[:-1]
+    right = bounds[1:]
+    return left, right, covering(a, left), covering(b, left)
+
+
+def union(a: LocationArray, b: LocationArray) -> Tuple[LocationArray, np.ndarray, np.ndarray]:
+    strand = a.strand if len(a) else b.strand
+    left, right, a_idx, b_idx = _elementary(a, b)
+    keep = (a_idx >= 0) | (b_idx >= 0)
+    a_idx = a_idx[keep]
+    b_idx = b_idx[keep]
+    labels = (a_idx >= 0).astype(np.int8) | ((b_idx >= 0).astype(np.int8) << 1)
+    return LocationArray(left[keep], right[keep], strand, labels), a_idx, b_idx
+
+
+def symmetric_difference(a: LocationArray, b: LocationArray) -> Tuple[LocationArray, np.ndarray, np.ndarray]:
+    left, right, a_idx, b_idx = _elementary(a, b)
+    keep = (a_idx >= 0) != (b_idx >= 0)
+    return LocationArray(left[keep], right[keep], a.strand), a_idx[keep], b_idx[keep]
+
+
+def _pairwise_overlaps(
+    a_starts: np.ndarray, a_ends: np.ndarray,
+    b_starts: np.ndarray, b_ends: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    lo = np.searchsorted(b_ends, a_starts, side="right")
+    hi = np.searchsorted(b_starts, a_ends, side="left")
+    counts = np.maximum(hi - lo, 0)
+    total = int(counts.sum())
+    a_idx = np.repeat(np.arange(len(a_starts)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    b_idx = np.repeat(lo, counts) + offsets
+    return a_idx, b_idx
+
+
+def intersection(a: LocationArray, b: LocationArray) -> Tuple[LocationArray, np.ndarray, np.ndarray]:
+    if not len(a) or not len(b):
+        return LocationArray.empty(a.strand), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    a_order = _sort_order(a.starts, a.ends)
+    b_order = _sort_order(b.starts, b.ends)
+    a_starts, a_ends = a.starts[a_order], a.ends[a_order]
+    b_starts, b_ends = b.starts[b_order], b.ends[b_order]
+    ai, bi = _pairwise_overlaps(a_starts, a_ends, b_starts, b_ends)
+    starts = np.maximum(a_starts[ai], b_starts[bi])
+    ends = np.minimum(a_ends[ai], b_ends[bi])
+    keep = ends > starts
+    return LocationArray(starts[keep], ends[keep], a.strand), a_order[ai[keep]], b_order[bi[keep]]
+
+
+def merge(loc: LocationArray) -> Tuple[LocationArray, np.ndarray]:
+    if not len(loc):
+        return loc, np.empty(0, dtype=np.intp)
+    breaks = np.flatnonzero(loc.starts[1:] != loc.ends[:-1]) + 1
+    first = np.concatenate(([0], breaks))
+    last = np.concatenate((breaks - 1, [len(loc) - 1]))
+    return LocationArray(loc.starts[first], loc.ends[last], loc.strand), first
+
+
+def convert(loc: LocationArray, segments: SegmentArray) -> Tuple[LocationArray, np.ndarray, LocationArray]:
+    if not len(loc):
+        return LocationArray.empty(), np.empty(0, dtype=np.intp), LocationArray.empty(loc.strand)
+    non_empty = segments.src_ends > segments.src_starts
+    s_src_starts = segments.src_starts[non_empty]
+    s_src_ends = segments.src_ends[non_empty]
+    s_dst_starts = segments.dst_starts[non_empty]
+    s_order = np.argsort(s_src_starts, kind="stable")
+    s_src_starts, s_src_ends, s_dst_starts = s_src_starts[s_order], s_src_ends[s_order], s_dst_starts[s_order]
+
+    order = _sort_order(loc.starts, loc.ends)
+    starts, ends = loc.starts[order], loc.ends[order]
+    pi, si = _pairwise_overlaps(starts, ends, s_src_starts, s_src_ends)
+    overlap_starts = np.maximum(starts[pi], s_src_starts[si])
+    overlap_ends = np.minimum(ends[pi], s_src_ends[si])
+    keep = overlap_ends > overlap_starts
+    pi, si = pi[keep], si[keep]
+    overlap_starts, overlap_ends = overlap_starts[keep], overlap_ends[keep]
+
+    if loc.strand == -1:
+        dst_starts = s_src_ends[si] - overlap_ends + s_dst_starts[si]
+        dst_ends = s_src_ends[si] - overlap_starts + s_dst_starts[si]
+        return (
+            LocationArray(dst_starts[::-1], dst_ends[::-1]),
+            order[pi][::-1],
+            LocationArray(overlap_starts[::-1], overlap_ends[::-1], loc.strand),
+        )
+    dst_starts = overlap_starts - s_src_starts[si] + s_dst_starts[si]
+    dst_ends = overlap_ends - s_src_starts[si] + s_dst_starts[si]
+    return LocationArray(dst_starts, dst_ends), order[pi], LocationArray(overlap_starts, overlap_ends, loc.strand)
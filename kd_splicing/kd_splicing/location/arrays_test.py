@@ -0,0 +1,61 @@
+import unittest
+
+import numpy as np
+
+from kd_splicing.location import arrays
+from kd_splicing.location.arrays import LocationArray, SegmentArray
+from kd_splicing.location.models import ConvertSegment, Location, LocationPart
+
+
+def _array(*parts, strand=None):
+    return LocationArray.from_location(Location([LocationPart(s, e, strand) for s, e in parts]))
+
+
+def _pairs(arr):
+    return list(zip(arr.starts.tolist(), arr.ends.tolist()))
+
+
+class ArraysTestCase(unittest.TestCase):
+    def test_union(self) -> None:
+        a = _array((0, 3), (5, 6), (9, 11))
+        b = _array((1, 2), (4, 7))
+        r, a_idx, b_idx = arrays.union(a, b)
+        self.assertEqual(_pairs(r), [(0, 1), (1, 2), (2, 3), (4, 5), (5, 6), (6, 7), (9, 11)])
+        self.assertEqual(r.labels.tolist(), [1, 3, 1, 2, 3, 2, 1])
+        self.assertEqual(a_idx.tolist(), [0, 0, 0, -1, 1, -1, 2])
+        self.assertEqual(b_idx.tolist(), [-1, 0, -1, 1, 1, 1, -1])
+
+    def test_intersection(self) -> None:
+        a = _array((9, 11), (0, 3), (5, 6))
+        b = _array((1, 2), (4, 10))
+        r, a_idx, b_idx = arrays.intersection(a, b)
+        self.assertEqual(_pairs(r), [(1, 2), (5, 6), (9, 10)])
+        self.assertEqual(a_idx.tolist(), [1, 2, 0])
+        self.assertEqual(b_idx.tolist(), [0, 1, 1])
+
+    def test_symmetric_difference(self) -> None:
+        a = _array((0, 3), (5, 6))
+        b = _array((1, 2), (4, 7))
+        r, _, _ = arrays.symmetric_difference(a, b)
+        self.assertEqual(_pairs(r), [(0, 1), (2, 3), (4, 5), (6, 7)])
+
+    def test_merge(self) -> None:
+        r, first = arrays.merge(_array((0, 3), (3, 5), (7, 8), (8, 9), (10, 11)))
+        self.assertEqual(_pairs(r), [(0, 5), (7, 9), (10, 11)])
+        self.assertEqual(first.tolist(), [0, 2, 4])
+
+    def test_convert(self) -> None:
+        segments = SegmentArray.from_segments([
+            ConvertSegment(src_start=10, src_end=20, dst_start=0),
+            ConvertSegment(src_start=30, src_end=40, dst_start=10),
+        ])
+        r, part_idx, _ = arrays.convert(_array((15, 35)), segments)
+        self.assertEqual(_pairs(r), [(5, 10), (10, 15)])
+        self.assertEqual(part_idx.tolist(), [0, 0])
+
+        r, _, _ = arrays.convert(_array((15, 35), strand=-1), segments)
+        self.assertEqual(_pairs(r), [(15, 20), (0, 5)])
+
+    def test_covering(self) -> None:
+        loc = _array((10, 20), (0, 5))
+        self.assertEqual(arrays.covering(loc, np.array([0, 7, 10, 19, 20])).tolist(), [1, -1, 0, 0, -1])
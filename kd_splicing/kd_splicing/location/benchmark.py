@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import glob
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import unittest
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from kd_common import logutil
+from kd_splicing import paths
+from kd_splicing.location import utils_test
+from kd_splicing.location.models import Location, LocationPart
+from kd_splicing.location.utils import (convert_location, get_alignment_segments,
+                                        get_convert_to_local_segments,
+                                        intersection, nucleotide_to_amino,
+                                        relative_to_alignment,
+                                        symmetric_difference, union)
+
+_logger = logutil.get_logger(__name__)
+
+
+@dataclass
+class Hsp:
+    qseq: str
+    hseq: str
+    query_from: int
+    query_len: int
+    hit_from: int
+    hit_len: int
+
+
+@dataclass
+class Inputs:
+    location_pairs: List[Tuple[Location, Location]]
+    hsps: List[Hsp]
+
+
+@dataclass
+class Result:
+    name: str
+    calls: int
+    ops_per_sec: float
+    mean_peak_bytes: float
+    max_peak_bytes: int
+
+
+def sample_location_pairs(db: Any, count: int, seed: int = 0) -> List[Tuple[Location, Location]]:
+    gene_to_locations: Dict[Any, List[Location]] = defaultdict(list)
+    for iso in db.isoforms.values():
+        if iso.location.parts:
+            gene_to_locations[iso.gene_uuid].append(iso.location)
+    pairs = [
+        (locs[i], locs[j])
+        for locs in gene_to_locations.values()
+        for i in range(len(locs))
+        for j in range(i + 1, len(locs))
+    ]
+    rnd = random.Random(seed)
+    rnd.shuffle(pairs)
+    return pairs[:count]
+
+
+def read_hsps(results_folder: str, query_len: Optional[int] = None, count: int = 1000) -> List[Hsp]:
+    result: List[Hsp] = []
+    for path in sorted(glob.glob(os.path.join(results_folder, "**", "*.json"), recursive=True)):
+        with open(path, "r") as f:
+            search = json.load(f)["BlastOutput2"]["report"]["results"]["search"]
+        for hit in search["hits"]:
+            hsps = hit["hsps"][0]
+            result.append(Hsp(
+                qseq=hsps["qseq"],
+                hseq=hsps["hseq"],
+                query_from=hsps["query_from"] - 1,
+                query_len=query_len or search.get("query_len", hsps["query_to"]),
+                hit_from=hsps["hit_from"] - 1,
+                hit_len=hit.get("len", hsps["hit_to"]),
+            ))
+            if len(result) >= count:
+                return result
+    return result
+
+
+def synthetic_inputs(count: int = 500, seed: int = 0) -> Inputs:
+    rnd = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        strand = rnd.choice([1, -1])
+        exons = []
+        pos = rnd.randint(0, 10000)
+        for _ in range(rnd.randint(2, 15)):
+            length = rnd.randint(30, 300)
+            exons.append((pos, pos + length))
+            pos += length + rnd.randint(50, 2000)
+        a = [e for e in exons if rnd.random() < 0.85] or exons[:1]
+        b = [e for e in exons if rnd.random() < 0.85] or exons[-1:]
+        pairs.append((
+            Location([LocationPart(s, e, strand) for s, e in a]),
+            Location([LocationPart(s, e, strand) for s, e in b]),
+        ))
+    hsps = []
+    for _ in range(count):
+        length = rnd.randint(50, 800)
+        qseq = "".join(rnd.choice("ACDEFGHIKLMNPQRSTVWY") if rnd.random() > 0.05 else "-" for _ in range(length))
+        hseq = "".join(rnd.choice("ACDEFGHIKLMNPQRSTVWY") if rnd.random() > 0.05 else "-" for _ in range(length))
+        query_from = rnd.randint(0, 50)
+        hit_from = rnd.randint(0, 50)
+        hsps.append(Hsp(
+            qseq=qseq,
+            hseq=hseq,
+            query_from=query_from,
+            query_len=query_from + length + rnd.randint(0, 50),
+            hit_from=hit_from,
+            hit_len=hit_from + length + rnd.randint(0, 50),
+        ))
+    return Inputs(location_pairs=pairs, hsps=hsps)
+
+
+def load_inputs(db: Any = None, results_folder: Optional[str] = None, count: int = 500, seed: int = 0) -> Inputs:
+    inputs = synthetic_inputs(count, seed)
+    if db is not None:
+        inputs.location_pairs = sample_location_pairs(db, count, seed)
+    if results_folder is not None:
+        inputs.hsps = read_hsps(results_folder, count=count)
+    return inputs
+
+
+def _cases(inputs: Inputs) -> Mapping[str, Tuple[Callable[..., Any], List[Tuple[Any, ...]]]]:
+    locations = [loc for pair in inputs.location_pairs for loc in pair]
+    converts = []
+    for a, b in inputs.location_pairs:
+        segments = get_convert_to_local_segments(a)
+        if segments:
+            converts.append((b, segments))
+    hsp_segments = [(h.qseq, h.query_from, h.query_len) for h in inputs.hsps]
+    alignment_locations = [
+        (Location([LocationPart(h.query_from + 1, h.query_from + 10, None), LocationPart(h.query_from + 20, h.query_from + 40, None)]),
+         h.qseq, h.query_from, h.query_len)
+        for h in inputs.hsps
+    ]
+    return {
+        "union": (union, inputs.location_pairs),
+        "intersection": (intersection, inputs.location_pairs),
+        "symmetric_difference": (symmetric_difference, inputs.location_pairs),
+        "convert_location": (convert_location, converts),
+        "nucleotide_to_amino": (nucleotide_to_amino, [(loc,) for loc in locations]),
+        "get_alignment_segments": (get_alignment_segments, hsp_segments),
+        "relative_to_alignment": (relative_to_alignment, alignment_locations),
+    }
+
+
+def _measure(name: str, func: Callable[..., Any], args: Sequence[Tuple[Any, ...]], min_time: float) -> Result:
+    calls = 0
+    begin = time.perf_counter()
+    elapsed = 0.
+    while elapsed < min_time and args:
+        for a in args:
+            func(*a)
+        calls += len(args)
+        elapsed = time.perf_counter() - begin
+
+    peaks = []
+    tracemalloc.start()
+    for a in args:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        func(*a)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - current)
+    tracemalloc.stop()
+
+    return Result(
+        name=name,
+        calls=calls,
+        ops_per_sec=calls / elapsed if elapsed else 0.,
+        mean_peak_bytes=sum(peaks) / len(peaks) if peaks else 0.,
+        max_peak_bytes=max(peaks, default=0),
+    )
+
+
+def check_correctness(suite: Optional[unittest.TestSuite] = None) -> unittest.TestResult:
+    if suite is None:
+        suite = unittest.defaultTestLoader.loadTestsFromModule(utils_test)
+    return unittest.TextTestRunner(verbosity=0).run(suite)
+
+
+def run(inputs: Inputs, min_time: float = 1., only: Optional[Sequence[str]] = None) -> List[Result]:
+    results = []
+    for name, (func, args) in _cases(inputs).items():
+        if only and name not in only:
+            continue
+        result = _measure(name, func, args, min_time)
+        _logger.info(f"{name}: {result.ops_per_sec:.0f} ops/s, {result.mean_peak_bytes:.0f} mean / {result.max_peak_bytes} max peak bytes per call")
+        results.append(result)
+    return results
+
+
+def save_baseline(results: List[Result], path: str) -> None:
+    with open(path, "w") as f:
+        json.dump({r.name: asdict(r) for r in results}, f, indent=2)
+
+
+def compare(results: List[Result], baseline_path: str, tolerance: float = 0.1) -> Dict[str, float]:
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    ratios = {}
+    for r in results:
+        base = baseline.get(r.name)
+        if not base or not base["ops_per_sec"]:
+            continue
+        ratio = r.ops_per_sec / base["ops_per_sec"]
+        ratios[r.name] = ratio
+        if ratio < 1 - tolerance:
+            _logger.warn(f"{r.name} regressed: {ratio:.2f}x of baseline")
+        else:
+            _logger.info(f"{r.name}: {ratio:.2f}x of baseline")
+    return ratios
+
+
+def main(
+    db: Any = None,
+    results_folder: Optional[str] = None,
+    baseline_path: Optional[str] = None,
+    checks: Optional[unittest.TestSuite] = None,
+    count: int = 500,
+    min_time: float = 1.,
+) -> None:
+    result = check_correctness(checks)
+    if not result.wasSuccessful():
+        _logger.error(f"Correctness checks failed: {len(result.failures)} failures, {len(result.errors)} errors")
+        sys.exit(1)
+    if baseline_path is None:
+        baseline_path = os.path.join(paths.FOLDER_DATA, "location_benchmark_baseline.json")
+    results = run(load_inputs(db, results_folder, count), min_time)
+    if os.path.exists(baseline_path):
+        compare(results, baseline_path)
+    else:
+        save_baseline(results, baseline_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from kd_splicing.location import benchmark
+from kd_splicing.location.models import Location, LocationPart
+
+
+class _UnionCheck(unittest.TestCase):
+    def test_union(self) -> None:
+        a = Location(parts=[LocationPart(start=0, end=3, strand=1)])
+        b = Location(parts=[LocationPart(start=2, end=5, strand=1)])
+        self.assertEqual([(p.start, p.end) for p in benchmark.union(a, b).parts], [(0, 2), (2, 3), (3, 5)])
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_smoke(self) -> None:
+        checks = lambda: unittest.defaultTestLoader.loadTestsFromTestCase(_UnionCheck)
+        with tempfile.TemporaryDirectory() as folder:
+            baseline_path = os.path.join(folder, "baseline.json")
+            benchmark.main(baseline_path=baseline_path, checks=checks(), count=3, min_time=0.01)
+            with open(baseline_path, "r") as f:
+                baseline = json.load(f)
+            self.assertEqual(set(baseline), set(benchmark._cases(benchmark.synthetic_inputs(3))))
+            self.assertTrue(all(r["ops_per_sec"] > 0 for r in baseline.values()))
+
+            with mock.patch.object(benchmark, "union", lambda a, b: a):
+                with self.assertRaises(SystemExit) as cm:
+                    benchmark.main(baseline_path=baseline_path, checks=checks(), count=3, min_time=0.01)
+            self.assertEqual(cm.exception.code, 1)
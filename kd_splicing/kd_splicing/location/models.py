@@ -1,8 +1,6 @@
 from __future__ import annotations
 
-import uuid
 from dataclasses import dataclass, field
-from enum import Enum
 from typing import Dict, List, Optional, Tuple, Any
 
 from Bio.Seq import MutableSeq, Seq, reverse_complement
@@ -91,22 +89,6 @@ class ConvertSegment:
 
 
 
-@dataclass
-class _ConvertEvent:
-    class Type(Enum):
-        END = 0
-        START = 1
-
-    src_pos: int
-    event_type: Type
-    dst_pos: Optional[int] = None
-    data: Optional[Dict[str, Any]] = None
-    
-
-    def get_sort_tuple(self) -> Tuple[int, ...]:
-        return (self.src_pos, self.event_type.value, 0 if self.dst_pos is not None else 1)
-
-
 @dataclass
 class LocationEvent:
     pos: int
@@ -116,14 +98,3 @@ class LocationEvent:
     def __lt__(self, right: LocationEvent) -> bool:
         return self.pos < right.pos or self.pos == right.pos and self.start and not right.start
 
-
-@dataclass
-class _EventWithId:
-    id: uuid.UUID
-    pos: int
-    start: bool
-    data: Optional[Dict[str, Any]] = None
-
-    def __lt__(self, right: LocationEvent) -> bool:
-        return self.pos < right.pos or self.pos == right.pos and self.start and not right.start
-
@@ -1,12 +1,13 @@
-from collections import defaultdict
-import uuid
 from copy import copy
 import math
-from dataclasses import dataclass
-from typing import List, Optional, Tuple, Dict, Any, Set
+from typing import List, Dict, Any, Set, Tuple, Union
 
-from kd_splicing.location.models import (ConvertSegment, Location, _EventWithId,
-                                         LocationPart, _ConvertEvent, LocationEvent)
+import numpy as np
+
+from kd_splicing.location import arrays
+from kd_splicing.location.alignment import AlignmentMap
+from kd_splicing.location.arrays import LocationArray, SegmentArray
+from kd_splicing.location.models import ConvertSegment, Location, LocationPart
 
 
 def get_convert_to_local_segments(loc: Location) -> List[ConvertSegment]:
@@ -26,65 +27,43 @@ def get_convert_to_local_segments(loc: Location) -> List[ConvertSegment]:
     return result
 
 
-def convert_location(loc: Location, segments: List[ConvertSegment]) -> Location:
-    if not loc.parts:
-        return loc
-    reverse = loc.parts[0].strand == -1
-    events = []
-    for part in loc.parts:
-        events.append(_ConvertEvent(
-            src_pos=part.start if not reverse else -part.start,
-            event_type=_ConvertEvent.Type.START if not reverse else _ConvertEvent.Type.END,
-            data=part.data,
-        ))
-        events.append(_ConvertEvent(
-            src_pos=part.end if not reverse else -part.end,
-            event_type=_ConvertEvent.Type.END if not reverse else _ConvertEvent.Type.START,
-            data=part.data,
-        ))
+def _accumulate_data(datas: List[Dict[str, Any]], keys: List[int], thresholds: List[int]) -> List[Dict[str, Any]]:
+    result = []
+    data: Dict[str, Any] = {}
+    i = 0
+    for threshold in thresholds:
+        while i < len(keys) and keys[i] < threshold:
+            if datas[i]:
+                data.update(datas[i])
+            i += 1
+        result.append(copy(data))
+    return result
 
-    for s in segments:
-        events.append(_ConvertEvent(
-            src_pos=s.src_start if not reverse else -s.src_start,
-            event_type=_ConvertEvent.Type.START if not reverse else _ConvertEvent.Type.END,
-            dst_pos=s.dst_start if not reverse else None,
-        ))
-        events.append(_ConvertEvent(
-            src_pos=s.src_end if not reverse else -s.src_end,
-            event_type=_ConvertEvent.Type.END if not reverse else _ConvertEvent.Type.START,
-            dst_pos=s.dst_start if reverse else None,
-        ))
 
-    events.sort(key=lambda e: e.get_sort_tuple())
-    k = 0
-    data: Dict[str, Any] = {}
-    prev_src_pos = 0
-    prev_dst_pos = 0
-    dst_start_pos = None
-    result = Location()
-    for e in events:
-        if e.dst_pos is not None:
-            prev_src_pos = e.src_pos
-            prev_dst_pos = e.dst_pos
-
-        if e.event_type == _ConvertEvent.Type.START:
-            k += 1
-            if e.data:
-                data.update(e.data)
+def convert_location(loc: Location, segments: Union[List[ConvertSegment], SegmentArray]) -> Location:
+    if not loc.parts:
+        return loc
+    if not isinstance(segments, SegmentArray):
+        segments = SegmentArray.from_segments(segments)
+    arr = LocationArray.from_location(loc)
+    converted, _, overlaps = arrays.convert(arr, segments)
+    reverse = arr.strand == -1
+    if any(p.data for p in loc.parts):
+        if reverse:
+            order = np.lexsort((np.arange(len(arr)), -arr.ends))
+            keys = (-arr.ends[order]).tolist()
+            thresholds = (-overlaps.starts).tolist()
         else:
-            k -= 1
-
-        if e.event_type == _ConvertEvent.Type.START and k == 2:
-            dst_start_pos = e.src_pos - prev_src_pos + prev_dst_pos
-        elif e.event_type == _ConvertEvent.Type.END and dst_start_pos is not None:
-            result.parts.append(LocationPart(
-                start=dst_start_pos,
-                end=e.src_pos - prev_src_pos + prev_dst_pos,
-                strand=None,
-                data=copy(data),
-            ))
-            dst_start_pos = None
-    return result
+            order = np.lexsort((np.arange(len(arr)), arr.starts))
+            keys = arr.starts[order].tolist()
+            thresholds = overlaps.ends.tolist()
+        datas = _accumulate_data([loc.parts[i].data for i in order.tolist()], keys, thresholds)
+    else:
+        datas = [{} for _ in range(len(converted))]
+    return Location([
+        LocationPart(start=start, end=end, strand=None, data=data)
+        for start, end, data in zip(converted.starts.tolist(), converted.ends.tolist(), datas)
+    ])
 
 
 def relative_to_location(loc: Location, other: Location) -> Location:
@@ -93,48 +72,11 @@ def relative_to_location(loc: Location, other: Location) -> Location:
 
 
 def get_alignment_segments(s: str, src_from: int, src_len: int) -> List[ConvertSegment]:
-    segments = [
-        ConvertSegment(
-            src_start=0,
-            src_end=src_from,
-            dst_start=-src_from,
-        )
-    ]
-    src_pos = src_from
-    dst_pos = 0
-    src_start = src_pos
-    dst_start = dst_pos
-    prev = "-"
-    for c in s:
-        if c != "-":
-            if prev == '-':
-                src_start = src_pos
-                dst_start = dst_pos
-            src_pos += 1
-        else:
-            if prev != '-':
-                segments.append(ConvertSegment(
-                    src_start=src_start,
-                    src_end=src_pos,
-                    dst_start=dst_start,
-                ))
-                src_start = src_pos
-                dst_start = dst_pos
-        dst_pos += 1
-        prev = c
-    if prev == "-":
-        dst_start = dst_pos
-    segments.append(ConvertSegment(
-        src_start=src_start,
-        src_end=src_len,
-        dst_start=dst_start,
-    ))
-    return segments
+    return AlignmentMap(s, src_from, src_len).to_segments()
 
 
 def relative_to_alignment(loc: Location, alignment: str, query_from: int, query_len: int) -> Location:
-    segments = get_alignment_segments(alignment, query_from, query_len)
-    return convert_location(loc, segments)
+    return convert_location(loc, AlignmentMap(alignment, query_from, query_len).segments)
 
 
 def nucleotide_to_amino(loc: Location) -> Location:
@@ -149,38 +91,29 @@ def nucleotide_to_amino(loc: Location) -> Location:
     return result
 
 
-def _location_to_events(loc: Location) -> List[LocationEvent]:
-    events = []
-    for part in loc.parts:
-        events.append(LocationEvent(
-            pos=part.start,
-            start=True,
-            data=part.data,
-        ))
-        events.append(LocationEvent(
-            pos=part.end,
-            start=False,
-            data={key: None for key in part.data.keys()},
-        ))
-    return events
+# Below this many parts the sorted-list sweeps beat converting to arrays and back.
+SMALL_PARTS = 64
 
 
-def _location_to_events_with_ids(loc: Location) -> List[_EventWithId]:
-    events = []
-    for part in loc.parts:
-        event_id = uuid.uuid4()
-        events.append(_EventWithId(
-            id=event_id,
-            pos=part.start,
-            start=True,
-            data=part.data,
-        ))
-        events.append(_EventWithId(
-            id=event_id,
-            pos=part.end,
-            start=False,
-        ))
-    return events
+def _sorted_order(parts: List[LocationPart]) -> List[int]:
+    return sorted(range(len(parts)), key=lambda i: (parts[i].start, parts[i].end))
+
+
+def _covering(parts: List[LocationPart], positions: List[int]) -> List[int]:
+    order = _sorted_order(parts)
+    result = []
+    j = 0
+    for pos in positions:
+        while j < len(order) and parts[order[j]].start <= pos:
+            j += 1
+        result.append(order[j - 1] if j and parts[order[j - 1]].end > pos else -1)
+    return result
+
+
+def _elementary(a: List[LocationPart], b: List[LocationPart]) -> Tuple[List[int], List[int], List[int], List[int]]:
+    bounds = sorted({p.start for p in a} | {p.end for p in a} | {p.start for p in b} | {p.end for p in b})
+    left = bounds[:-1]
+    return left, bounds[1:], _covering(a, left), _covering(b, left)
 
 
 def symmetric_difference(a: Location, b: Location) -> Location:
@@ -190,120 +123,112 @@ def symmetric_difference(a: Location, b: Location) -> Location:
         return b
     assert a.parts[0].strand == b.parts[0].strand
     strand = a.parts[0].strand
-    events = _location_to_events_with_ids(a) + _location_to_events_with_ids(b)
-    events.sort()
-
-    pos = 0
-    current_events: Dict[uuid.UUID, Any] = {}
-    result = Location()
-    for e in events:
-        if len(current_events) == 1 and e.pos > pos:
-            result.parts.append(LocationPart(
-                start=pos,
-                end=e.pos,
+    if len(a.parts) + len(b.parts) <= SMALL_PARTS:
+        starts, ends, a_idx, b_idx = _elementary(a.parts, b.parts)
+        keep = [k for k in range(len(starts)) if (a_idx[k] >= 0) != (b_idx[k] >= 0)]
+        return Location([
+            LocationPart(
+                start=starts[k],
+                end=ends[k],
                 strand=strand,
-                data=next(iter(current_events.values())),
-            ))
+                data=a.parts[a_idx[k]].data if a_idx[k] >= 0 else b.parts[b_idx[k]].data,
+            )
+            for k in keep
+        ])
+    diff, a_idx, b_idx = arrays.symmetric_difference(LocationArray.from_location(a), LocationArray.from_location(b))
+    return Location([
+        LocationPart(
+            start=start,
+            end=end,
+            strand=strand,
+            data=a.parts[ai].data if ai >= 0 else b.parts[bi].data,
+        )
+        for start, end, ai, bi in zip(diff.starts.tolist(), diff.ends.tolist(), a_idx.tolist(), b_idx.tolist())
+    ])
 
-        if e.start:
-            current_events[e.id] = e.data
-        else:
-            del current_events[e.id]
 
-        if len(current_events) == 1:
-            pos = e.pos
-    return result
+def _intersection_bounds(a: List[LocationPart], b: List[LocationPart]) -> Tuple[List[int], List[int]]:
+    a_sorted = [a[i] for i in _sorted_order(a)]
+    b_sorted = [b[i] for i in _sorted_order(b)]
+    starts = []
+    ends = []
+    i = j = 0
+    while i < len(a_sorted) and j < len(b_sorted):
+        start = max(a_sorted[i].start, b_sorted[j].start)
+        end = min(a_sorted[i].end, b_sorted[j].end)
+        if end > start:
+            starts.append(start)
+            ends.append(end)
+        if a_sorted[i].end < b_sorted[j].end:
+            i += 1
+        else:
+            j += 1
+    return starts, ends
 
 
 def intersection(a: Location, b: Location) -> Location:
     if not a.parts or not b.parts:
         return Location()
-    events = _location_to_events(a) + _location_to_events(b)
-    events.sort()
-
-    pos = 0
-    data: Dict[str, Any] = {}
-    count = 0
-    result = Location()
-    for e in events:
-        if count == 2 and e.pos > pos:
-            result.parts.append(LocationPart(
-                start=pos,
-                end=e.pos,
-                strand=a.parts[0].strand,
-                data=copy(data),
-            ))
-
-        if e.start:
-            count += 1
-            if e.data:
-                data.update(e.data)
+    parts = a.parts + b.parts
+    if len(parts) <= SMALL_PARTS:
+        inter_starts, inter_ends = _intersection_bounds(a.parts, b.parts)
+        if any(p.data for p in parts):
+            order = sorted(range(len(parts)), key=lambda i: parts[i].start)
+            datas = _accumulate_data([parts[i].data for i in order], [parts[i].start for i in order], inter_ends)
         else:
-            count -= 1
-
-        if count == 2:
-            pos = e.pos
-    return result
-
-
-def _location_to_union_events(loc: Location, source: str) -> List[LocationEvent]:
-    events = []
-    for idx, part in enumerate(loc.parts):
-        events.append(LocationEvent(
-            pos=part.start,
-            start=True,
-            data={
-                "source": source,
-                "source_part": f"{source}_{idx}" 
-            },
-        ))
-        events.append(LocationEvent(
-            pos=part.end,
-            start=False,
-            data={
-                "source": source,
-                "source_part": f"{source}_{idx}"
-            },
-        ))
-    return events
+            datas = [{} for _ in range(len(inter_starts))]
+    else:
+        arr_a = LocationArray.from_location(a)
+        arr_b = LocationArray.from_location(b)
+        inter, _, _ = arrays.intersection(arr_a, arr_b)
+        inter_starts, inter_ends = inter.starts.tolist(), inter.ends.tolist()
+        if any(p.data for p in parts):
+            starts = np.concatenate((arr_a.starts, arr_b.starts))
+            order = np.argsort(starts, kind="stable")
+            datas = _accumulate_data([parts[i].data for i in order.tolist()], starts[order].tolist(), inter_ends)
+        else:
+            datas = [{} for _ in range(len(inter_starts))]
+    strand = a.parts[0].strand
+    return Location([
+        LocationPart(start=start, end=end, strand=strand, data=data)
+        for start, end, data in zip(inter_starts, inter_ends, datas)
+    ])
 
 
 def union(a: Location, b: Location) -> Location:
     if not a.parts and not b.parts:
         return Location()
-    strand = a.parts[0].strand if a.parts else b.parts[0].strand
-    events = _location_to_union_events(
-        a, "a") + _location_to_union_events(b, "b")
-    events.sort(key = lambda e: (e.pos, e.start))
-
-    pos = 0
-    source: Set[str] = set()
-    source_part: Set[str] = set()
+    if len(a.parts) + len(b.parts) <= SMALL_PARTS:
+        strand = a.parts[0].strand if a.parts else b.parts[0].strand
+        left, right, a_all, b_all = _elementary(a.parts, b.parts)
+        keep = [k for k in range(len(left)) if a_all[k] >= 0 or b_all[k] >= 0]
+        starts = [left[k] for k in keep]
+        ends = [right[k] for k in keep]
+        a_idx = [a_all[k] for k in keep]
+        b_idx = [b_all[k] for k in keep]
+    else:
+        united, a_arr, b_arr = arrays.union(LocationArray.from_location(a), LocationArray.from_location(b))
+        strand = united.strand
+        starts, ends, a_idx, b_idx = united.starts.tolist(), united.ends.tolist(), a_arr.tolist(), b_arr.tolist()
     result = Location()
-    for e in events:
-        if len(source) > 0 and e.pos > pos:
-            result.parts.append(LocationPart(
-                start=pos,
-                end=e.pos,
-                strand=strand,
-                data={
-                    "source": copy(source),
-                    "source_part": copy(source_part),
-                },
-            ))
-            pos = e.pos
-
-        assert e.data
-        if e.start:
-            pos = e.pos
-            source.add(e.data["source"])
-            source_part.add(e.data["source_part"])
-        else:
-            # if e.data["source"] not in source:
-            #     print(e)
-            source.remove(e.data["source"])
-            source_part.remove(e.data["source_part"])
-
+    for start, end, ai, bi in zip(starts, ends, a_idx, b_idx):
+        source: Set[str] = set()
+        source_part: Set[str] = set()
+        if ai >= 0:
+            source.add("a")
+            source_part.add(f"a_{ai}")
+        if bi >= 0:
+            source.add("b")
+            source_part.add(f"b_{bi}")
+        result.parts.append(LocationPart(
+            start=start,
+            end=end,
+            strand=strand,
+            data={
+                "source": source,
+                "source_part": source_part,
+            },
+        ))
     return result
 
 
@@ -311,13 +236,19 @@ def merge(loc: Location) -> Location:
     if not loc.parts:
         return loc
     assert loc.parts[0].strand != -1
-    result = Location([copy(loc.parts[0])])
-    for part in loc.parts[1:]:
-        if result.parts[-1].end == part.start:
-            result.parts[-1].end = part.end
-        else:
-            result.parts.append(copy(part))
-    return result
+    if len(loc.parts) <= SMALL_PARTS:
+        result = Location()
+        for part in loc.parts:
+            if result.parts and result.parts[-1].end == part.start:
+                result.parts[-1].end = part.end
+            else:
+                result.parts.append(LocationPart(start=part.start, end=part.end, strand=part.strand, data=part.data))
+        return result
+    merged, first = arrays.merge(LocationArray.from_location(loc))
+    return Location([
+        LocationPart(start=start, end=end, strand=loc.parts[i].strand, data=loc.parts[i].data)
+        for start, end, i in zip(merged.starts.tolist(), merged.ends.tolist(), first.tolist())
+    ])
 
 
 def bounding_box(loc_parts: List[LocationPart]) -> Location:
@@ -1,6 +1,9 @@
+import random
 import unittest
 from pprint import PrettyPrinter, pprint
 
+from kd_splicing.location import arrays, utils
+from kd_splicing.location.arrays import LocationArray
 from kd_splicing.location.models import ConvertSegment, Location, LocationPart
 from kd_splicing.location.utils import (convert_location, union,
                                         get_alignment_segments, intersection,
@@ -164,3 +167,27 @@ class UtilsTestCase(unittest.TestCase):
         ])
         merged = merge(loc)
         print(merged)
+
+    def test_sorted_list_and_array_kernels_agree(self) -> None:
+        rnd = random.Random(0)
+
+        def _location(strand: int) -> Location:
+            parts = []
+            pos = rnd.randint(0, 50)
+            for _ in range(rnd.randint(0, 8)):
+                length = rnd.randint(1, 20)
+                parts.append(LocationPart(start=pos, end=pos + length, strand=strand))
+                pos += length + rnd.choice([0, 1, 10])
+            rnd.shuffle(parts)
+            return Location(parts)
+
+        for _ in range(500):
+            strand = rnd.choice([1, -1])
+            a, b = _location(strand), _location(strand)
+            arr_a, arr_b = LocationArray.from_location(a), LocationArray.from_location(b)
+            self.assertEqual(
+                utils._elementary(a.parts, b.parts),
+                tuple(v.tolist() for v in arrays._elementary(arr_a, arr_b)),
+            )
+            inter, _, _ = arrays.intersection(arr_a, arr_b)
+            self.assertEqual(utils._intersection_bounds(a.parts, b.parts), (inter.starts.tolist(), inter.ends.tolist()))
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import json
+import os
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from kd_common import logutil, pathutil
+from kd_splicing.models import IsoformTuple, Match, SimpleMatch
+
+_logger = logutil.get_logger(__name__)
+
+FEATURES = ("isoform_blast_score", "splicing_difference", "splicing_similarity", "splicing_dissimilarity")
+
+_ROW_DTYPE = np.dtype([
+    ("query_a", "V16"),
+    ("query_b", "V16"),
+    ("hit_a", "V16"),
+    ("hit_b", "V16"),
+    ("probability", "f8"),
+    ("positive", "?"),
+    *((name, "f4") for name in FEATURES),
+])
+
+_INDEX_DTYPE = np.dtype([
+    ("query_a", "V16"),
+    ("query_b", "V16"),
+    ("start", "i8"),
+    ("end", "i8"),
+])
+
+
+def store_folder(launch_folder: str) -> str:
+    return os.path.join(launch_folder, "match_store")
+
+
+def segments_folder(launch_folder: str) -> str:
+    return pathutil.create_folder(store_folder(launch_folder), "segments")
+
+
+def ledger_path(launch_folder: str) -> str:
+    return os.path.join(pathutil.create_folder(store_folder(launch_folder)), "ledger.sqlite")
+
+
+def exists(launch_folder: str) -> bool:
+    return os.path.exists(os.path.join(store_folder(launch_folder), "index.npy"))
+
+
+def segment_names(launch_folder: str) -> List[str]:
+    with open(os.path.join(store_folder(launch_folder), "segments.json"), "r") as f:
+        return json.load(f)
+
+
+def write_segment(path: str, matches: List[Match]) -> None:
+    query_to_matches: Dict[IsoformTuple, List[Match]] = defaultdict(list)
+    for m in matches:
+        query_to_matches[m.query_isoforms].append(m)
+    rows = np.array([
+        (
+            m.query_isoforms.a.bytes,
+            m.query_isoforms.b.bytes,
+            m.hit_isoforms.a.bytes,
+            m.hit_isoforms.b.bytes,
+            m.predicted_positive_probability,
+            m.predicted_positive,
+            *(getattr(m, name) for name in FEATURES),
+        )
+        for query_matches in query_to_matches.values()
+        for m in query_matches
+    ], dtype=_ROW_DTYPE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, rows)
+    os.replace(tmp_path, path)
+
+
+def build(launch_folder: str, segment_paths: Optional[List[str]] = None) -> None:
+    folder = store_folder(launch_folder)
+    if segment_paths is None:
+        segment_paths = sorted(pathutil.file_list(segments_folder(launch_folder), ".npy"))
+    segments = [np.load(path) for path in tqdm(segment_paths, desc="build match store")]
+    rows = np.concatenate(segments) if segments else np.empty(0, dtype=_ROW_DTYPE)
+    if len(rows):
+        changed = (rows["query_a"][1:] != rows["query_a"][:-1]) | (rows["query_b"][1:] != rows["query_b"][:-1])
+        starts = np.concatenate([[0], np.flatnonzero(changed) + 1])
+    else:
+        starts = np.empty(0, dtype=np.int64)
+    index = np.empty(len(starts), dtype=_INDEX_DTYPE)
+    index["query_a"] = rows["query_a"][starts]
+    index["query_b"] = rows["query_b"][starts]
+    index["start"] = starts
+    index["end"] = np.append(starts[1:], len(rows))
+    np.save(os.path.join(folder, "matches.npy"), rows)
+    np.save(os.path.join(folder, "index.npy"), index)
+    with open(os.path.join(folder, "segments.json"), "w") as f:
+        json.dump([os.path.basename(path) for path in segment_paths], f)
+    _logger.info(f"Match store: {len(index)} queries, {len(rows)} matches")
+
+
+class MatchStore:
+    def __init__(self, launch_folder: str) -> None:
+        folder = store_folder(launch_folder)
+        self.rows = np.load(os.path.join(folder, "matches.npy"), mmap_mode="r")
+        self.index = np.load(os.path.join(folder, "index.npy"))
+        self.queries = [
+            IsoformTuple(uuid.UUID(bytes=bytes(a)), uuid.UUID(bytes=bytes(b)))
+            for a, b in zip(self.index["query_a"], self.index["query_b"])
+        ]
+        self.query_to_idx: Dict[IsoformTuple, int] = {q: i for i, q in enumerate(self.queries)}
+
+    def __contains__(self, query: IsoformTuple) -> bool:
+        return query in self.query_to_idx
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def query_rows(self, query: IsoformTuple) -> np.ndarray:
+        idx = self.query_to_idx.get(query)
+        if idx is None:
+            return self.rows[:0]
+        return self.rows[self.index["start"][idx]:self.index["end"][idx]]
+
+    def get(self, query: IsoformTuple) -> List[SimpleMatch]:
+        return [
+            SimpleMatch(
+                hit_isoforms=IsoformTuple(uuid.UUID(bytes=bytes(row["hit_a"])), uuid.UUID(bytes=bytes(row["hit_b"]))),
+                predicted_positive=bool(row["positive"]),
+                predicted_positive_probability=float(row["probability"]),
+            )
+            for row in self.query_rows(query)
+        ]
+
+    def to_simple_matches(self) -> Mapping[IsoformTuple, List[SimpleMatch]]:
+        return {query: self.get(query) for query in tqdm(self.queries, desc="read match store")}
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "query_a": _decode_uuids(self.rows["query_a"]),
+            "query_b": _decode_uuids(self.rows["query_b"]),
+            "hit_a": _decode_uuids(self.rows["hit_a"]),
+            "hit_b": _decode_uuids(self.rows["hit_b"]),
+            "probability": np.asarray(self.rows["probability"]),
+            "positive": np.asarray(self.rows["positive"]),
+            **{name: np.asarray(self.rows[name]) for name in FEATURES},
+        })
+
+
+def _decode_uuids(values: np.ndarray) -> np.ndarray:
+    unique, inverse = np.unique(values, return_inverse=True)
+    decoded = np.array([uuid.UUID(bytes=bytes(v)) for v in unique], dtype=object)
+    return decoded[inverse.reshape(-1)]
+
+
+def simple_matches_to_dataframe(simple_matches: Mapping[IsoformTuple, List[SimpleMatch]]) -> pd.DataFrame:
+    rows = [
+        (query.a, query.b, m.hit_isoforms.a, m.hit_isoforms.b, m.predicted_positive_probability, bool(m.predicted_positive))
+        for query, matches in simple_matches.items()
+        for m in matches
+    ]
+    return pd.DataFrame(rows, columns=["query_a", "query_b", "hit_a", "hit_b", "probability", "positive"])
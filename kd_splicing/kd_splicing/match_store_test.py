@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+import uuid
+
+from kd_splicing import match_store
+from kd_splicing.models import IsoformTuple, Match, SimpleMatch
+
+
+def _match(query: IsoformTuple, hit: int, probability: float) -> Match:
+    return Match(
+        query_isoforms=query,
+        hit_isoforms=IsoformTuple(uuid.UUID(int=hit), uuid.UUID(int=hit + 1)),
+        predicted_positive=probability > 0.5,
+        predicted_positive_probability=probability,
+        splicing_similarity=0.25,
+    )
+
+
+class MatchStoreTestCase(unittest.TestCase):
+    def test_build_and_read(self) -> None:
+        q1 = IsoformTuple(uuid.uuid4(), uuid.uuid4())
+        q2 = IsoformTuple(uuid.uuid4(), uuid.uuid4())
+        q3 = IsoformTuple(uuid.uuid4(), uuid.uuid4())
+        with tempfile.TemporaryDirectory() as launch_folder:
+            segments = match_store.segments_folder(launch_folder)
+            match_store.write_segment(os.path.join(segments, "batch_0.npy"), [
+                _match(q1, 10, 0.9), _match(q2, 20, 0.1), _match(q1, 30, 0.6),
+            ])
+            match_store.write_segment(os.path.join(segments, "batch_1.npy"), [_match(q3, 40, 0.7)])
+            match_store.write_segment(os.path.join(segments, "batch_2.npy"), [])
+            match_store.build(launch_folder)
+            self.assertTrue(match_store.exists(launch_folder))
+
+            store = match_store.MatchStore(launch_folder)
+            self.assertEqual(store.queries, [q1, q2, q3])
+            self.assertEqual(store.get(q1), [
+                SimpleMatch(IsoformTuple(uuid.UUID(int=10), uuid.UUID(int=11)), True, 0.9),
+                SimpleMatch(IsoformTuple(uuid.UUID(int=30), uuid.UUID(int=31)), True, 0.6),
+            ])
+            self.assertEqual(store.get(IsoformTuple(uuid.uuid4(), uuid.uuid4())), [])
+            self.assertEqual(len(store.to_simple_matches()[q3]), 1)
+
+            df = store.to_dataframe()
+            self.assertEqual(df["query_a"].tolist(), [q1.a, q1.a, q2.a, q3.a])
+            self.assertEqual(df["hit_a"][3], uuid.UUID(int=40))
+            self.assertEqual(df["positive"].tolist(), [True, True, False, True])
+            self.assertEqual(df["splicing_similarity"].tolist(), [0.25] * 4)
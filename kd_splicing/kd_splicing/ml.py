@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+import math
 import pickle
 from operator import itemgetter
-from typing import List, Mapping, Tuple, Union
+from typing import List, Mapping, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 from sklearn import preprocessing, svm
 from sklearn.ensemble import GradientBoostingClassifier
@@ -31,6 +33,21 @@ def _extract_features(matches: List[Match]) -> Tuple[Tuple[float, ...], ...]:
     )
 
 
+_FEATURE_BOUNDS = (
+    (-math.inf, math.inf),
+    (0., math.inf),
+    (0., 1 / 0.3),
+    (0., math.inf),
+)
+
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1. / (1. + math.exp(-z))
+    e = math.exp(z)
+    return e / (1. + e)
+
+
 class Detector:
     def fit(self, model_name: str, matches: List[Match]) -> None:
         self.model_name = model_name
@@ -49,6 +66,7 @@ class Detector:
         self.scaler = preprocessing.StandardScaler().fit(x_train)
         x_train = self.scaler.transform(x_train)
         self.model.fit(x_train, y)
+        self._linear_form = self._build_linear()
 
     def transform(self, matches: List[Match]) -> None:
         if not matches:
@@ -61,6 +79,56 @@ class Detector:
             m.predicted_positive_probability = float(prob)
             m.predicted_positive = c
 
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state.pop("_linear_form", None)
+        return state
+
+    def _linear(self) -> Optional[Tuple[Tuple[float, ...], float, Optional[float]]]:
+        if "_linear_form" not in self.__dict__:
+            self._linear_form = self._build_linear()
+        return self._linear_form
+
+    def _build_linear(self) -> Optional[Tuple[Tuple[float, ...], float, Optional[float]]]:
+        if not isinstance(getattr(self, "model", None), LogisticRegression):
+            return None
+        weights = self.model.coef_[0] / self.scaler.scale_
+        intercept = float(self.model.intercept_[0] - np.dot(weights, self.scaler.mean_))
+        bound: Optional[float] = intercept
+        for w, (low, high) in zip(weights[1:], _FEATURE_BOUNDS[1:]):
+            if w == 0:
+                continue
+            best = high if w > 0 else low
+            if math.isinf(best):
+                bound = None
+                break
+            bound += float(w) * best
+        return tuple(float(w) for w in weights), intercept, bound
+
+    def probability(self, m: Match) -> float:
+        linear = self._linear()
+        assert linear is not None
+        weights, intercept, _ = linear
+        return _sigmoid(
+            intercept
+            + weights[0] * m.isoform_blast_score
+            + weights[1] * m.splicing_difference
+            + weights[2] * m.splicing_similarity
+            + weights[3] * m.splicing_dissimilarity
+        )
+
+    def probability_upper_bound(self, isoform_blast_score: float) -> float:
+        linear = self._linear()
+        if linear is None:
+            return 1.
+        weights, _, bound = linear
+        if bound is None:
+            return 1.
+        return _sigmoid(bound + weights[0] * isoform_blast_score)
+
+    def can_prune(self) -> bool:
+        return self._linear() is not None
+
     def cross_validate(self, model_name: str, matches: List[Match], db: database.models.DB, cross_validation_results: bool = True) -> None:
         queries = list({m.query_isoforms for m in matches})
 
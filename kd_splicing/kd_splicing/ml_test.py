@@ -0,0 +1,40 @@
+import pickle
+import random
+import unittest
+
+from kd_splicing import ml
+from kd_splicing.models import IsoformTuple, Match
+
+
+def _match(rng: random.Random, positive: bool) -> Match:
+    m = Match(query_isoforms=IsoformTuple(None, None), hit_isoforms=IsoformTuple(None, None), hit_organism="")
+    shift = 1. if positive else 0.
+    m.isoform_blast_score = rng.random() * 0.5 + shift * 0.3
+    m.splicing_difference = rng.random() * 3 * (1 - shift) + rng.random()
+    m.splicing_similarity = rng.random() / 0.3
+    m.splicing_dissimilarity = rng.random() * 4 * (1 - shift) + rng.random()
+    m.positive = positive
+    return m
+
+
+class DetectorTestCase(unittest.TestCase):
+    def test_probability_upper_bound(self) -> None:
+        rng = random.Random(0)
+        train = [_match(rng, i % 2 == 0) for i in range(200)]
+        detector = ml.Detector()
+        detector.fit("logistic_regression", train)
+        self.assertTrue(detector.can_prune())
+
+        test = [_match(rng, i % 3 == 0) for i in range(100)]
+        detector.transform(test)
+        for m in test:
+            self.assertAlmostEqual(detector.probability(m), m.predicted_positive_probability)
+            self.assertGreaterEqual(detector.probability_upper_bound(m.isoform_blast_score), m.predicted_positive_probability)
+
+        restored = pickle.loads(pickle.dumps(detector))
+        self.assertNotIn("_linear_form", restored.__dict__)
+        self.assertEqual(restored.probability(test[0]), detector.probability(test[0]))
+
+        detector.fit("boosting", train)
+        self.assertFalse(detector.can_prune())
+        self.assertEqual(detector.probability_upper_bound(0.1), 1.)
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import math
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from Bio.Align import PairwiseAligner, substitution_matrices
+
+from kd_common import logutil
+
+_logger = logutil.get_logger(__name__)
+
+_LAMBDA = 0.267
+_K = 0.041
+
+_default_aligner: Optional[PairwiseAligner] = None
+
+
+def make_aligner() -> PairwiseAligner:
+    return PairwiseAligner(
+        mode="local",
+        substitution_matrix=substitution_matrices.load("BLOSUM62"),
+        open_gap_score=-12,
+        extend_gap_score=-1,
+    )
+
+
+def default_aligner() -> PairwiseAligner:
+    global _default_aligner
+    if _default_aligner is None:
+        _default_aligner = make_aligner()
+    return _default_aligner
+
+
+def bit_score(score: float) -> float:
+    return (_LAMBDA * score - math.log(_K)) / math.log(2)
+
+
+def evalue(score: float, query_len: int, dbsize: int) -> float:
+    return _K * query_len * dbsize * math.exp(-_LAMBDA * score)
+
+
+def _gapped(aligner: PairwiseAligner, query: str, hit: str, coordinates: Any) -> Tuple[str, str, str]:
+    matrix = aligner.substitution_matrix
+    qseq: List[str] = []
+    hseq: List[str] = []
+    midline: List[str] = []
+    for i in range(coordinates.shape[1] - 1):
+        h_start, h_end = coordinates[0, i], coordinates[0, i + 1]
+        q_start, q_end = coordinates[1, i], coordinates[1, i + 1]
+        if h_start == h_end:
+            qseq.append(query[q_start:q_end])
+            hseq.append("-" * (q_end - q_start))
+            midline.append(" " * (q_end - q_start))
+        elif q_start == q_end:
+            qseq.append("-" * (h_end - h_start))
+            hseq.append(hit[h_start:h_end])
+            midline.append(" " * (h_end - h_start))
+        else:
+            for q, h in zip(query[q_start:q_end], hit[h_start:h_end]):
+                qseq.append(q)
+                hseq.append(h)
+                if q == h:
+                    midline.append(q)
+                elif q in matrix.alphabet and h in matrix.alphabet and matrix[q, h] > 0:
+                    midline.append("+")
+                else:
+                    midline.append(" ")
+    return "".join(qseq), "".join(hseq), "".join(midline)
+
+
+def align(aligner: PairwiseAligner, query: str, hit: str, dbsize: int, max_evalue: float) -> Optional[Dict[str, Any]]:
+    score = aligner.score(hit, query)
+    if score <= 0 or evalue(score, len(query), dbsize) > max_evalue:
+        return None
+    coordinates = aligner.align(hit, query)[0].coordinates
+    qseq, hseq, midline = _gapped(aligner, query, hit, coordinates)
+    return {
+        "bit_score": bit_score(score),
+        "score": score,
+        "evalue": evalue(score, len(query), dbsize),
+        "query_from": int(coordinates[1, 0]) + 1,
+        "query_to": int(coordinates[1, -1]),
+        "hit_from": int(coordinates[0, 0]) + 1,
+        "hit_to": int(coordinates[0, -1]),
+        "qseq": qseq,
+        "hseq": hseq,
+        "midline": midline,
+    }
+
+
+def report(
+    aligner: PairwiseAligner,
+    query_uuid: uuid.UUID,
+    query: str,
+    subjects: Sequence[Tuple[uuid.UUID, str]],
+    dbsize: int,
+    max_evalue: float,
+    max_target_seqs: int,
+) -> Dict[str, Any]:
+    hits = []
+    for iso_uuid, translation in subjects:
+        hsp = align(aligner, query, translation, dbsize, max_evalue)
+        if hsp is not None:
+            hits.append({"description": [{"title": str(iso_uuid)}], "len": len(translation), "hsps": [hsp]})
+    hits.sort(key=lambda h: -h["hsps"][0]["bit_score"])
+    return {"BlastOutput2": {"report": {"results": {"search": {
+        "query_title": str(query_uuid),
+        "query_len": len(query),
+        "hits": hits[:max_target_seqs],
+    }}}}}
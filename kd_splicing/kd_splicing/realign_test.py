@@ -0,0 +1,30 @@
+import unittest
+import uuid
+
+from kd_splicing import realign
+
+
+class RealignTestCase(unittest.TestCase):
+    def test_align(self) -> None:
+        aligner = realign.make_aligner()
+        query = "WWMKVLAGHTREWQPLKDAYYW"
+        hit = "CCMKVLAGHREWQPLKDAC"
+        hsp = realign.align(aligner, query, hit, dbsize=1000, max_evalue=1e-3)
+        self.assertIsNotNone(hsp)
+        self.assertEqual(len(hsp["qseq"]), len(hsp["hseq"]))
+        self.assertEqual(len(hsp["qseq"]), len(hsp["midline"]))
+        self.assertEqual(hsp["qseq"].replace("-", ""), query[hsp["query_from"] - 1:hsp["query_to"]])
+        self.assertEqual(hsp["hseq"].replace("-", ""), hit[hsp["hit_from"] - 1:hsp["hit_to"]])
+        self.assertEqual(hsp["qseq"], "MKVLAGHTREWQPLKDA")
+        self.assertEqual(hsp["hseq"], "MKVLAGH-REWQPLKDA")
+        self.assertEqual(hsp["midline"], "MKVLAGH REWQPLKDA")
+
+        self.assertIsNone(realign.align(aligner, query, hit, dbsize=10 ** 12, max_evalue=1e-9))
+
+    def test_report(self) -> None:
+        query_uuid = uuid.uuid4()
+        subjects = [(uuid.UUID(int=1), "CCCCC"), (uuid.UUID(int=2), "MKVLAGHTREWQ"), (uuid.UUID(int=3), "MKVLAGHTREWQPLKDA")]
+        report = realign.report(realign.make_aligner(), query_uuid, "MKVLAGHTREWQPLKDA", subjects, 1000, 1e-3, 10)
+        search = report["BlastOutput2"]["report"]["results"]["search"]
+        self.assertEqual(search["query_title"], str(query_uuid))
+        self.assertEqual([h["description"][0]["title"] for h in search["hits"]], [str(uuid.UUID(int=3)), str(uuid.UUID(int=2))])
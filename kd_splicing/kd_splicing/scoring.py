@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import string
+from typing import Optional
+
+import numpy as np
+
+from kd_splicing.location.models import Location
+
+_MATCH = np.zeros(256, dtype=np.int64)
+for _c in string.ascii_uppercase + "+":
+    _MATCH[ord(_c)] = 1
+
+_GAP = ord("-")
+
+_blosum30: Optional[np.ndarray] = None
+
+
+def blosum30() -> np.ndarray:
+    global _blosum30
+    if _blosum30 is None:
+        from Bio.SubsMat import MatrixInfo
+        table = np.zeros((256, 256), dtype=np.float64)
+        for (a, b), score in MatrixInfo.blosum30.items():
+            table[ord(a), ord(b)] = table[ord(b), ord(a)] = max(score, 0)
+        _blosum30 = table
+    return _blosum30
+
+
+def _codes(seq: str) -> np.ndarray:
+    return np.frombuffer(seq.encode(), dtype=np.uint8)
+
+
+def midline_prefix(midline: str) -> np.ndarray:
+    prefix = np.zeros(len(midline) + 1, dtype=np.int64)
+    np.cumsum(_MATCH[_codes(midline)], out=prefix[1:])
+    return prefix
+
+
+def count_all_matches(prefix: np.ndarray) -> float:
+    return float(prefix[-1])
+
+
+def count_matches(loc: Location, prefix: np.ndarray) -> float:
+    size = len(prefix) - 1
+    count = 0
+    for part in loc.parts:
+        start = min(max(part.start, 0), size)
+        end = min(max(part.end, 0), size)
+        if start < end:
+            count += int(prefix[end] - prefix[start])
+    return float(count)
+
+
+def evaluate_score(loc: Location, seq_a: str, seq_b: str, open_gap: float = 0, extend_gap: float = 0,
+                   penalize_extend_when_opening: bool = False) -> float:
+    if penalize_extend_when_opening:
+        open_gap += extend_gap
+    size = len(seq_a)
+    positions = [
+        np.arange(min(max(part.start, 0), size), min(max(part.end, 0), size))
+        for part in loc.parts
+    ]
+    idx = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+    if not len(idx):
+        return .0
+    a = _codes(seq_a)[idx]
+    b = _codes(seq_b)[idx]
+    kind = np.where(a == _GAP, 1, np.where(b == _GAP, 2, 0))
+    prev = np.concatenate([[0], kind[:-1]])
+    values = np.where(
+        kind == 0,
+        blosum30()[a, b],
+        np.where(kind == prev, extend_gap, open_gap),
+    )
+    score = .0
+    for value in values.tolist():
+        score += value
+    return score
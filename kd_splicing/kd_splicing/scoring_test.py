@@ -0,0 +1,14 @@
+import unittest
+
+from kd_splicing import scoring
+from kd_splicing.location.models import Location, LocationPart
+
+
+class ScoringTestCase(unittest.TestCase):
+    def test_count_matches(self) -> None:
+        prefix = scoring.midline_prefix("MK +  LV+")
+        self.assertEqual(prefix.tolist(), [0, 1, 2, 2, 3, 3, 3, 4, 5, 6])
+        self.assertEqual(scoring.count_all_matches(prefix), 6.)
+        self.assertEqual(scoring.count_matches(Location(parts=[LocationPart(0, 3, 1), LocationPart(5, 7, 1)]), prefix), 3.)
+        self.assertEqual(scoring.count_matches(Location(parts=[LocationPart(-3, 1, 1), LocationPart(8, 20, 1)]), prefix), 2.)
+        self.assertEqual(scoring.count_matches(Location(parts=[LocationPart(20, 30, 1)]), prefix), 0.)
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from kd_common import logutil
+from kd_splicing.models import IsoformTuple
+
+_logger = logutil.get_logger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def batch_id(tuples: Sequence[IsoformTuple], version: str) -> str:
+    h = hashlib.sha1(version.encode())
+    for t in sorted(tuples, key=lambda t: (t.a.bytes, t.b.bytes)):
+        h.update(t.a.bytes)
+        h.update(t.b.bytes)
+    return h.hexdigest()
+
+
+class Ledger:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            "id TEXT PRIMARY KEY, state TEXT, attempts INTEGER, queries INTEGER, "
+            "started REAL, seconds REAL, error TEXT)")
+        self._conn.commit()
+
+    def register(self, batches: Iterable[Tuple[str, int]]) -> None:
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO batches (id, state, attempts, queries) VALUES (?, ?, 0, ?)",
+            ((id_, PENDING, queries) for id_, queries in batches))
+        self._conn.commit()
+
+    def state(self, id_: str) -> Optional[str]:
+        row = self._conn.execute("SELECT state FROM batches WHERE id = ?", (id_,)).fetchone()
+        return None if row is None else row[0]
+
+    def attempts(self, id_: str) -> int:
+        row = self._conn.execute("SELECT attempts FROM batches WHERE id = ?", (id_,)).fetchone()
+        return 0 if row is None else row[0]
+
+    def todo(self, ids: Iterable[str], max_attempts: int) -> List[str]:
+        return [
+            id_ for id_ in ids
+            if self.state(id_) != DONE and self.attempts(id_) < max_attempts
+        ]
+
+    def start(self, ids: Iterable[str]) -> None:
+        now = time.time()
+        self._conn.executemany(
+            "UPDATE batches SET state = ?, attempts = attempts + 1, started = ?, error = NULL WHERE id = ?",
+            ((RUNNING, now, id_) for id_ in ids))
+        self._conn.commit()
+
+    def finish(self, id_: str, seconds: float) -> None:
+        self._conn.execute("UPDATE batches SET state = ?, seconds = ? WHERE id = ?", (DONE, seconds, id_))
+        self._conn.commit()
+
+    def fail(self, id_: str, seconds: float, error: str) -> None:
+        self._conn.execute(
+            "UPDATE batches SET state = ?, seconds = ?, error = ? WHERE id = ?", (FAILED, seconds, error, id_))
+        self._conn.commit()
+
+    def reset(self, id_: str) -> None:
+        self._conn.execute("UPDATE batches SET state = ? WHERE id = ?", (PENDING, id_))
+        self._conn.commit()
+
+    def errors(self) -> Mapping[str, str]:
+        return dict(self._conn.execute("SELECT id, error FROM batches WHERE state = ?", (FAILED,)).fetchall())
+
+    def stats(self) -> Mapping[str, int]:
+        counts: Dict[str, int] = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update(self._conn.execute("SELECT state, COUNT(*) FROM batches GROUP BY state").fetchall())
+        return counts
+
+    def missing(self, batches: Iterable[Tuple[str, Sequence[IsoformTuple]]]) -> List[IsoformTuple]:
+        return [
+            t
+            for id_, tuples in batches
+            if self.state(id_) != DONE
+            for t in tuples
+        ]
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+import uuid
+
+from kd_splicing import work_ledger
+from kd_splicing.models import IsoformTuple
+
+
+class WorkLedgerTestCase(unittest.TestCase):
+    def test_batch_id(self) -> None:
+        t1 = IsoformTuple(uuid.uuid4(), uuid.uuid4())
+        t2 = IsoformTuple(uuid.uuid4(), uuid.uuid4())
+        self.assertEqual(work_ledger.batch_id([t1, t2], "v1"), work_ledger.batch_id([t2, t1], "v1"))
+        self.assertNotEqual(work_ledger.batch_id([t1, t2], "v1"), work_ledger.batch_id([t1, t2], "v2"))
+        self.assertNotEqual(work_ledger.batch_id([t1], "v1"), work_ledger.batch_id([t2], "v1"))
+
+    def test_retry_and_missing(self) -> None:
+        t1 = IsoformTuple(uuid.uuid4(), uuid.uuid4())
+        t2 = IsoformTuple(uuid.uuid4(), uuid.uuid4())
+        batches = [("a", [t1]), ("b", [t2])]
+        with tempfile.TemporaryDirectory() as folder:
+            ledger = work_ledger.Ledger(os.path.join(folder, "ledger.sqlite"))
+            ledger.register((id_, len(tuples)) for id_, tuples in batches)
+            self.assertEqual(ledger.todo(["a", "b"], max_attempts=2), ["a", "b"])
+
+            ledger.start(["a", "b"])
+            ledger.finish("a", 1.)
+            ledger.fail("b", 1., "boom")
+            self.assertEqual(ledger.todo(["a", "b"], max_attempts=2), ["b"])
+            self.assertEqual(ledger.errors(), {"b": "boom"})
+            self.assertEqual(ledger.missing(batches), [t2])
+
+            ledger.start(["b"])
+            ledger.fail("b", 1., "boom")
+            self.assertEqual(ledger.todo(["a", "b"], max_attempts=2), [])
+            ledger.close()
+
+            ledger = work_ledger.Ledger(os.path.join(folder, "ledger.sqlite"))
+            ledger.register((id_, len(tuples)) for id_, tuples in batches)
+            self.assertEqual(ledger.stats()[work_ledger.DONE], 1)
+            self.assertEqual(ledger.attempts("b"), 2)
+            ledger.close()